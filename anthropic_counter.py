@@ -0,0 +1,136 @@
+# anthropic_counter.py
+# ---
+# concurrent token counting against the Anthropic count_tokens endpoint
+# requests run on a bounded thread pool behind a token-bucket rate limiter,
+# with retry and exponential backoff on 429 / 5xx responses
+
+import time
+import random
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_REQUESTS_PER_MINUTE = 100
+DEFAULT_MAX_RETRIES = 5
+
+# Status codes worth retrying; everything else fails the file immediately
+RETRYABLE_STATUS = {408, 409, 429}
+FATAL_STATUS = {401, 403}
+
+class TokenBucket:
+    """Thread-safe token bucket allowing 'rate' acquisitions per second with bursts up to 'capacity'."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a request may be made."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+def error_status(exc: Exception) -> Optional[int]:
+    """HTTP status of an API error, if it has one."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+def is_retryable(exc: Exception) -> bool:
+    """Rate limits, server errors and connection problems are retried."""
+    status = error_status(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(exc, (ConnectionError, TimeoutError)) or type(exc).__name__ in (
+        "APIConnectionError", "APITimeoutError"
+    )
+
+def retry_delay(exc: Exception, attempt: int, base_delay: float, max_delay: float = 60.0) -> float:
+    """Honour a Retry-After header when present, otherwise back off exponentially with jitter."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after") if hasattr(headers, "get") else None
+    if retry_after is not None:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    delay = base_delay * (2 ** attempt)
+    return min(max_delay, delay + random.uniform(0, delay / 2))
+
+class AnthropicTokenCounter:
+    """
+    Counts tokens for many files concurrently with one count_tokens call per file,
+    so every result stays attributed to the content that was submitted.
+    The client is injectable: anything exposing beta.messages.count_tokens works,
+    which allows running against a local stand-in server or a fake.
+    """
+
+    def __init__(self, client: Any, model_name: str,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 requests_per_minute: float = DEFAULT_REQUESTS_PER_MINUTE,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 base_delay: float = 0.5):
+        self.client = client
+        self.model_name = model_name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.limiter = TokenBucket(requests_per_minute / 60.0)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency))
+        # Caps the number of files held in memory while waiting for a worker
+        self.slots = threading.BoundedSemaphore(max(1, concurrency) * 4)
+        self.disabled = False
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def count(self, content: str) -> Optional[int]:
+        """Count one text, retrying transient failures. Returns None if it cannot be counted."""
+        attempt = 0
+        while not self.disabled:
+            self.limiter.acquire()
+            try:
+                result = self.client.beta.messages.count_tokens(
+                    model=self.model_name,
+                    messages=[{"role": "user", "content": content}]
+                )
+                return result.input_tokens
+            except Exception as e:
+                if error_status(e) in FATAL_STATUS:
+                    with self.lock:
+                        if not self.disabled:
+                            self.disabled = True
+                            print(f"Warning: Anthropic token counting failed: {e}")
+                            print("Token counting will be disabled for the remaining files.")
+                    return None
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    print(f"Warning: Token counting failed: {e}")
+                    return None
+                with self.lock:
+                    self.retries += 1
+                time.sleep(retry_delay(e, attempt, self.base_delay))
+                attempt += 1
+        return None
+
+    def submit(self, content: str) -> Future:
+        """Queue a text for counting. Blocks while too many requests are already pending."""
+        self.slots.acquire()
+        future = self.executor.submit(self.count, content)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def close(self) -> None:
+        """Wait for outstanding requests and stop the workers."""
+        self.executor.shutdown(wait=True)
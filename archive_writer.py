@@ -0,0 +1,118 @@
+# archive_writer.py
+# ---
+# writes claude_concat.py output as one zip or tar archive instead of a folder of
+# small files, which is much faster on network shares and overlay filesystems.
+# entries are streamed from the source files in chunks, so the archive is never
+# held in memory. zip entries are compressed one by one: formats that are already
+# compressed (PNG, PDF, ...) are stored and everything else is deflated.
+
+import io
+import time
+import shutil
+import tarfile
+import zipfile
+from typing import Optional
+
+# Output names that select an archive, longest first so .tar.gz wins over .gz
+ARCHIVE_EXTENSIONS = [
+    ('.tar.gz', 'tar:gz'),
+    ('.tgz', 'tar:gz'),
+    ('.tar', 'tar'),
+    ('.zip', 'zip'),
+]
+
+# Per-file compression inside a zip; tar archives are compressed as a whole (.tar.gz) or not at all
+COMPRESSION_POLICIES = ('auto', 'deflate', 'store')
+
+# Deflating these gains next to nothing, so 'auto' stores them
+COMPRESSED_EXTENSIONS = (
+    '.png', '.jpg', '.jpeg', '.gif', '.webp', '.pdf',
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.zst', '.7z', '.rar',
+    '.mp3', '.mp4', '.mov', '.woff', '.woff2',
+    '.docx', '.xlsx', '.pptx', '.jar', '.whl',
+)
+
+DEFAULT_COMPRESS_LEVEL = 6
+COPY_CHUNK_SIZE = 1024 * 1024
+
+def archive_format(path: str) -> Optional[str]:
+    """'zip', 'tar' or 'tar:gz' if the output path names an archive, otherwise None."""
+    lower = path.lower()
+    for extension, archive_type in ARCHIVE_EXTENSIONS:
+        if lower.endswith(extension):
+            return archive_type
+    return None
+
+def should_compress(name: str, policy: str = 'auto') -> bool:
+    """Whether a zip entry should be deflated under the given policy."""
+    if policy == 'auto':
+        return not name.lower().endswith(COMPRESSED_EXTENSIONS)
+    return policy == 'deflate'
+
+class ArchiveWriter:
+    """
+    Streams files into a zip or tar archive, one entry at a time.
+    add_file and add_text return how the entry was stored ('deflate', 'store' or
+    'tar'), for the summary. Use as a context manager or call close().
+    """
+
+    def __init__(self, path: str, archive_type: Optional[str] = None, compression: str = 'auto',
+                 level: int = DEFAULT_COMPRESS_LEVEL):
+        self.path = path
+        self.archive_type = archive_type or archive_format(path)
+        self.compression = compression
+        if self.archive_type == 'zip':
+            self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=level)
+            self.tar = None
+        elif self.archive_type in ('tar', 'tar:gz'):
+            mode = 'w:gz' if self.archive_type == 'tar:gz' else 'w'
+            options = {'compresslevel': level} if self.archive_type == 'tar:gz' else {}
+            self.tar = tarfile.open(path, mode, dereference=True, **options)
+            self.zip = None
+        else:
+            raise ValueError(f"unsupported archive type for {path}; use .zip, .tar, .tar.gz or .tgz")
+
+    def add_file(self, src: str, name: str) -> str:
+        """Copy a file into the archive under 'name', reading it in chunks."""
+        if self.zip is not None:
+            info = zipfile.ZipInfo.from_file(src, name, strict_timestamps=False)
+            method = 'deflate' if should_compress(name, self.compression) else 'store'
+            info.compress_type = zipfile.ZIP_DEFLATED if method == 'deflate' else zipfile.ZIP_STORED
+            with open(src, 'rb') as fsrc, self.zip.open(info, 'w', force_zip64=True) as fdst:
+                shutil.copyfileobj(fsrc, fdst, COPY_CHUNK_SIZE)
+            return method
+
+        info = self.tar.gettarinfo(src, arcname=name)
+        with open(src, 'rb') as fsrc:
+            self.tar.addfile(info, fsrc)
+        return 'tar'
+
+    def add_text(self, name: str, text: str) -> str:
+        """Add generated text (a truncated file, a manifest) as a UTF-8 entry."""
+        data = text.encode('utf-8')
+        if self.zip is not None:
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.external_attr = 0o644 << 16
+            method = 'deflate' if should_compress(name, self.compression) else 'store'
+            info.compress_type = zipfile.ZIP_DEFLATED if method == 'deflate' else zipfile.ZIP_STORED
+            self.zip.writestr(info, data)
+            return method
+
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+        return 'tar'
+
+    def close(self) -> None:
+        if self.zip is not None:
+            self.zip.close()
+        if self.tar is not None:
+            self.tar.close()
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
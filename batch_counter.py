@@ -0,0 +1,157 @@
+# batch_counter.py
+# ---
+# multi-core local token counting for claude_concat.py and single_file_concat.py
+# files are read ahead on I/O threads and tokenized in batches on a thread or process pool
+
+import os
+import sys
+import time
+import threading
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_BATCH_BYTES = 4 * 1024 * 1024
+DEFAULT_IO_THREADS = 4
+
+def count_texts(encoder: Any, texts: List[str], log=sys.stdout) -> List[Optional[int]]:
+    """
+    Count tokens for a list of texts. Special-token markers inside files are counted
+    as ordinary text instead of raising, so one file cannot fail a whole batch.
+    """
+    encode = getattr(encoder, "encode_ordinary", None) or encoder.encode
+    counts = []
+    for text in texts:
+        try:
+            counts.append(len(encode(text)))
+        except Exception as e:
+            print(f"Warning: Token counting failed: {e}", file=log)
+            counts.append(None)
+    return counts
+
+# Encoder loaded once per worker process
+_worker_encoder = None
+
+def _init_worker(encoding_name: str) -> None:
+    global _worker_encoder
+    import tiktoken
+    _worker_encoder = tiktoken.get_encoding(encoding_name)
+
+def _count_in_worker(texts: List[str]) -> List[Optional[int]]:
+    # Workers cannot write to the parent's log, and their stdout may be the output
+    return count_texts(_worker_encoder, texts, sys.stderr)
+
+def _timed_call(count_batch: Callable[[List[str]], List[Optional[int]]],
+                texts: List[str]) -> Tuple[List[Optional[int]], float]:
+    """Run count_batch and return its result with the time spent, measured where it ran."""
+    start = time.perf_counter()
+    counts = count_batch(texts)
+    return counts, time.perf_counter() - start
+
+class BatchTokenCounter:
+    """
+    Collects texts into batches and tokenizes them in the background across cores.
+    tiktoken releases the GIL while encoding, so a thread pool scales with cores;
+    use_processes switches to a process pool that loads the encoder once per worker.
+    Results come back as (key, count) pairs from add() and finish(), in completion order.
+    Time spent tokenizing is added to the 'tokenize' stage of 'metrics' when given.
+    Warnings go to 'log'.
+    """
+
+    def __init__(self, encoder: Any, workers: int = DEFAULT_WORKERS, use_processes: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE, batch_bytes: int = DEFAULT_BATCH_BYTES,
+                 metrics: Optional[Any] = None, log=sys.stdout):
+        workers = max(1, workers)
+        self.log = log
+        encoding_name = getattr(encoder, "name", None)
+        if use_processes and encoding_name:
+            self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(encoding_name,))
+            self.count_batch = _count_in_worker
+        else:
+            if use_processes:
+                print("Warning: Encoder cannot be loaded in worker processes. Using threads instead.", file=log)
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+            self.count_batch = partial(count_texts, encoder, log=log)
+
+        self.metrics = metrics
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        # Bounds how many batches are held in memory at once
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.pending = {}
+        self.keys = []
+        self.texts = []
+        self.size = 0
+
+    def add(self, key: Any, text: str) -> List[Tuple[Any, Optional[int]]]:
+        """Queue a text. Returns the results of any batches that have finished meanwhile."""
+        self.keys.append(key)
+        self.texts.append(text)
+        self.size += len(text)
+        if len(self.texts) >= self.batch_size or self.size >= self.batch_bytes:
+            self._flush()
+        return self._collect(block=False)
+
+    def finish(self) -> List[Tuple[Any, Optional[int]]]:
+        """Tokenize whatever is left, wait for every batch and stop the workers."""
+        self._flush()
+        results = self._collect(block=True)
+        self.executor.shutdown(wait=True)
+        return results
+
+    def close(self) -> None:
+        """Stop the workers without collecting results."""
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _flush(self) -> None:
+        if not self.texts:
+            return
+        self.slots.acquire()
+        future = self.executor.submit(_timed_call, self.count_batch, self.texts)
+        future.add_done_callback(lambda _: self.slots.release())
+        self.pending[future] = self.keys
+        self.keys, self.texts, self.size = [], [], 0
+
+    def _collect(self, block: bool) -> List[Tuple[Any, Optional[int]]]:
+        if block:
+            wait(self.pending)
+        done = [future for future in self.pending if future.done()]
+        results = []
+        for future in done:
+            keys = self.pending.pop(future)
+            try:
+                counts, seconds = future.result()
+            except Exception as e:
+                print(f"Warning: Token counting failed for a batch of {len(keys)} files: {e}", file=self.log)
+                counts = [None] * len(keys)
+            else:
+                if self.metrics is not None:
+                    self.metrics.add_time('tokenize', seconds)
+                    self.metrics.count('tokenized_files', len(keys))
+            results.extend(zip(keys, counts))
+        return results
+
+def read_ahead(items: Iterable[Any], reader: Callable[[Any], Any],
+               workers: int = DEFAULT_IO_THREADS, depth: Optional[int] = None) -> Iterator[Tuple[Any, Any, Optional[Exception]]]:
+    """
+    Run reader(item) on I/O threads, a bounded number of items ahead of the consumer.
+    Yields (item, result, error) in the original order.
+    """
+    depth = depth or workers * 4
+    queue = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        for item in items:
+            queue.append((item, executor.submit(reader, item)))
+            if len(queue) >= depth:
+                yield _read_result(*queue.popleft())
+        while queue:
+            yield _read_result(*queue.popleft())
+
+def _read_result(item: Any, future) -> Tuple[Any, Any, Optional[Exception]]:
+    try:
+        return item, future.result(), None
+    except Exception as e:
+        return item, None, e
@@ -0,0 +1,462 @@
+# benchmark.py
+# ---
+# measures the scan, flatten, concat and tokenize stages on a reproducible synthetic tree
+# each stage runs in a fresh process so its peak RSS is its own, and results are written
+# as JSON so runs can be compared with --compare
+#
+# the Anthropic counter is timed against a fake count_tokens endpoint served locally
+
+import os
+import sys
+import json
+import math
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import contextlib
+import urllib.error
+import urllib.request
+import multiprocessing
+from queue import Empty
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('scan', 'flatten', 'concat', 'tokenize', 'anthropic')
+
+# How often an isolated stage is checked on, and the longest it may run by default
+RESULT_POLL_INTERVAL = 1.0
+DEFAULT_STAGE_TIMEOUT = 1800.0
+
+DEFAULT_TREE = {
+    "depth": 3,
+    "fanout": 5,
+    "files_per_dir": 20,
+    "mean_size": 4096,
+    "size_sigma": 1.0,
+    "max_size": 1024 * 1024,
+    "binary_ratio": 0.05,
+    "seed": 0,
+}
+
+TEXT_EXTENSIONS = ('.py', '.md', '.txt', '.json', '.js')
+
+WORDS = (
+    "def class return import self value index data path file token count scan "
+    "result error list dict open read write for while if else try except yield "
+    "lambda None True False print format size buffer stream worker queue cache"
+).split()
+
+def make_line_pool(rng: random.Random, lines: int = 512) -> List[str]:
+    """Code-like lines to build text files from."""
+    pool = []
+    for _ in range(lines):
+        indent = "    " * rng.randint(0, 3)
+        pool.append(indent + " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))) + "\n")
+    return pool
+
+def generate_tree(root: str, depth: int = 3, fanout: int = 5, files_per_dir: int = 20,
+                  mean_size: int = 4096, size_sigma: float = 1.0, max_size: int = 1024 * 1024,
+                  binary_ratio: float = 0.05, seed: int = 0) -> Dict[str, int]:
+    """
+    Write a synthetic project under root. The same arguments always produce the same tree.
+    File sizes follow a log-normal distribution with the given mean, and
+    'binary_ratio' of the files are random bytes instead of text.
+    """
+    rng = random.Random(seed)
+    pool = make_line_pool(rng)
+    # Pick mu so that the distribution's mean is mean_size
+    mu = math.log(max(1, mean_size)) - size_sigma ** 2 / 2
+    stats = {"dirs": 0, "files": 0, "bytes": 0, "binary_files": 0}
+
+    def fill(path: str, level: int) -> None:
+        os.makedirs(path, exist_ok=True)
+        stats["dirs"] += 1
+        for index in range(files_per_dir):
+            size = min(max_size, max(1, int(rng.lognormvariate(mu, size_sigma))))
+            if rng.random() < binary_ratio:
+                # A leading NUL makes sure it is classified as binary
+                data = b"\0" + rng.getrandbits(8 * size).to_bytes(size, 'little')[1:]
+                name = f"blob_{index}.bin"
+                stats["binary_files"] += 1
+            else:
+                chunks, length = [], 0
+                while length < size:
+                    line = rng.choice(pool)
+                    chunks.append(line)
+                    length += len(line)
+                data = "".join(chunks).encode('utf-8')
+                name = f"file_{index}{rng.choice(TEXT_EXTENSIONS)}"
+            with open(os.path.join(path, name), 'wb') as f:
+                f.write(data)
+            stats["files"] += 1
+            stats["bytes"] += len(data)
+        if level < depth:
+            for child in range(fanout):
+                fill(os.path.join(path, f"dir_{child}"), level + 1)
+
+    fill(root, 0)
+    return stats
+
+class FakeCountTokensHandler(BaseHTTPRequestHandler):
+    """Answers count_tokens requests with about one token per 4 characters."""
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('content-length', 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+            throttled = server.rng.random() < server.error_rate
+        if throttled:
+            self.send_response(429)
+            self.send_header('retry-after', '0')
+            self.send_header('content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{"type": "error", "error": {"type": "rate_limit_error"}}')
+            return
+
+        text = "".join(str(m.get("content", "")) for m in body.get("messages", []))
+        payload = json.dumps({"input_tokens": max(1, len(text) // 4)}).encode()
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_fake_endpoint(latency: float = 0.0, error_rate: float = 0.0, seed: int = 0) -> ThreadingHTTPServer:
+    """Serve the fake count_tokens endpoint on a free local port, in a background thread."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeCountTokensHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class EndpointClient:
+    """
+    Minimal stand-in for anthropic.Anthropic: beta.messages.count_tokens over plain HTTP.
+    Used when the anthropic package is not installed.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self.beta = SimpleNamespace(messages=SimpleNamespace(count_tokens=self.count_tokens))
+
+    def count_tokens(self, model: str, messages: List[Dict[str, Any]]):
+        body = json.dumps({"model": model, "messages": messages}).encode()
+        request = urllib.request.Request(f"{self.base_url}/v1/messages/count_tokens", body,
+                                         {'content-type': 'application/json'})
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return SimpleNamespace(**json.load(response))
+        except urllib.error.HTTPError as e:
+            # Shaped like an SDK error so anthropic_counter can read the status and Retry-After
+            e.status_code = e.code
+            e.response = SimpleNamespace(status_code=e.code, headers=e.headers)
+            raise
+
+def make_endpoint_client(base_url: str) -> Any:
+    """The real SDK client pointed at base_url when it is installed, otherwise EndpointClient."""
+    try:
+        import anthropic
+        return anthropic.Anthropic(base_url=base_url, api_key="benchmark", max_retries=0)
+    except ImportError:
+        return EndpointClient(base_url)
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def list_files(table: Dict[str, Dict[str, list]]) -> List[str]:
+    return [os.path.join(root, name) for root, listing in table.items() for name in listing["files"]]
+
+def run_stage(stage: str, tree: str, workdir: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one stage on the generated tree and time it. Called in a fresh process."""
+    import dir_scanner
+    import claude_concat
+    import single_file_concat
+    from batch_counter import BatchTokenCounter
+    from anthropic_counter import AnthropicTokenCounter
+    from metrics import QUIET, Metrics
+
+    with open(os.path.join(workdir, 'scan.json')) as f:
+        table = json.load(f)
+    paths = list_files(table)
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    result = {"files": len(paths), "bytes": total_bytes}
+    metrics = Metrics(QUIET)
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if stage == 'scan':
+            start = time.perf_counter()
+            scanned = dir_scanner.create_directory_lookup_table(tree, dir_scanner.DEFAULT_IGNORE.copy(),
+                                                                options["scan_workers"], verbose=False)
+            wall = time.perf_counter() - start
+            result["dirs"] = len(scanned)
+
+        elif stage == 'flatten':
+            output_dir = os.path.join(workdir, 'flatten')
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            claude_concat.concat_dir_data(table, output_dir, copy_mode=options["copy_mode"], metrics=metrics)
+            wall = time.perf_counter() - start
+
+        elif stage == 'concat':
+            start = time.perf_counter()
+            with open(os.path.join(workdir, 'combined.txt'), 'w', buffering=single_file_concat.WRITE_BUFFER_SIZE) as out:
+                single_file_concat.write_concat_dir_data(table, out, log=devnull, metrics=metrics)
+            wall = time.perf_counter() - start
+
+        elif stage == 'tokenize':
+            enabled, encoder = single_file_concat.setup_tiktoken_counter(True)
+            if not enabled:
+                return {"skipped": "tiktoken is not installed"}
+            texts = read_texts(paths)
+            start = time.perf_counter()
+            counter = BatchTokenCounter(encoder, options["workers"], options["processes"])
+            results = []
+            for index, text in enumerate(texts):
+                results.extend(counter.add(index, text))
+            results.extend(counter.finish())
+            wall = time.perf_counter() - start
+            result.update(files=len(texts), bytes=sum(len(t.encode('utf-8')) for t in texts),
+                          tokens=sum(count or 0 for _, count in results))
+
+        elif stage == 'anthropic':
+            texts = read_texts(paths)[:options["anthropic_files"]]
+            client = make_endpoint_client(options["endpoint"])
+            start = time.perf_counter()
+            counter = AnthropicTokenCounter(client, "claude-3-5-sonnet-latest",
+                                            options["api_concurrency"], options["api_rpm"], base_delay=0.01)
+            futures = [counter.submit(text) for text in texts]
+            counts = [future.result() for future in futures]
+            counter.close()
+            wall = time.perf_counter() - start
+            result.update(files=len(texts), bytes=sum(len(t.encode('utf-8')) for t in texts),
+                          tokens=sum(c or 0 for c in counts), failed=sum(c is None for c in counts),
+                          retries=counter.retries)
+        else:
+            raise ValueError(f"unknown stage: {stage}")
+
+    result["wall_seconds"] = round(wall, 6)
+    result["files_per_sec"] = round(result["files"] / wall, 1) if wall > 0 else None
+    result["mb_per_sec"] = round(result["bytes"] / wall / (1024 * 1024), 2) if wall > 0 else None
+    result["peak_rss_mb"] = peak_rss_mb()
+    if metrics.stages:
+        # Where the time went inside the tool, from its own instrumentation
+        result["breakdown"] = metrics.as_dict()["stages"]
+    return result
+
+def read_texts(paths: List[str]) -> List[str]:
+    """Contents of the text files among paths; binaries are left out as the tools do."""
+    texts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if b"\0" not in data[:8192]:
+            texts.append(data.decode('utf-8', errors='replace'))
+    return texts
+
+def _stage_worker(queue, stage, tree, workdir, options):
+    try:
+        queue.put(run_stage(stage, tree, workdir, options))
+    except Exception as e:
+        queue.put({"error": f"{type(e).__name__}: {e}"})
+
+def run_stage_isolated(stage: str, tree: str, workdir: str, options: Dict[str, Any],
+                       timeout: float = DEFAULT_STAGE_TIMEOUT) -> Dict[str, Any]:
+    """
+    Run a stage in a newly spawned interpreter so peak RSS is not shared with other stages.
+    If the interpreter dies without a result (a crash, or the OOM killer) or runs past
+    'timeout' seconds, the stage is reported as an error instead of waiting forever.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_stage_worker, args=(queue, stage, tree, workdir, options))
+    process.start()
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                return queue.get(timeout=RESULT_POLL_INTERVAL)
+            except Empty:
+                pass
+            if not process.is_alive():
+                # A result put just before exiting may still be in flight
+                try:
+                    return queue.get(timeout=RESULT_POLL_INTERVAL)
+                except Empty:
+                    return {"error": f"stage process exited with status {process.exitcode} without a result"}
+            if time.monotonic() > deadline:
+                process.kill()
+                return {"error": f"stage did not finish within {timeout:g}s"}
+    finally:
+        process.join()
+
+def summarize_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Keep the fastest run, with every run's wall time alongside for spread."""
+    timed = [run for run in runs if "wall_seconds" in run]
+    if not timed:
+        return runs[0]
+    best = dict(min(timed, key=lambda run: run["wall_seconds"]))
+    best["runs"] = [run["wall_seconds"] for run in timed]
+    peaks = [run["peak_rss_mb"] for run in timed if run.get("peak_rss_mb") is not None]
+    if peaks:
+        best["peak_rss_mb"] = round(max(peaks), 1)
+    return best
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """One line per stage with the change in wall time and peak RSS against a baseline run."""
+    lines = []
+    for stage, result in current["stages"].items():
+        old = baseline.get("stages", {}).get(stage)
+        if not old or "wall_seconds" not in old or "wall_seconds" not in result:
+            continue
+        change = (result["wall_seconds"] - old["wall_seconds"]) / old["wall_seconds"] * 100 if old["wall_seconds"] else 0.0
+        line = f"- {stage}: {old['wall_seconds']:.3f}s -> {result['wall_seconds']:.3f}s ({change:+.1f}%)"
+        if old.get("peak_rss_mb") and result.get("peak_rss_mb"):
+            line += f", peak RSS {old['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB"
+        lines.append(line)
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the toolkit on a synthetic directory tree.')
+    parser.add_argument('-o', '--output', metavar='FILE', help='Write results as JSON to FILE (default: stdout)')
+    parser.add_argument('--compare', metavar='FILE', help='Baseline results JSON to compare against')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f'Comma-separated stages (default: {",".join(STAGES)})')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage; the fastest is reported (default: 3)')
+    parser.add_argument('--stage-timeout', type=float, default=DEFAULT_STAGE_TIMEOUT,
+                        help=f'Seconds a single run may take before it is reported as failed (default: {DEFAULT_STAGE_TIMEOUT:g})')
+    parser.add_argument('--tree', metavar='DIR', help='Generate the tree here and keep it (default: a temporary directory)')
+    parser.add_argument('--depth', type=int, default=DEFAULT_TREE["depth"], help='Directory levels below the root')
+    parser.add_argument('--fanout', type=int, default=DEFAULT_TREE["fanout"], help='Subdirectories per directory')
+    parser.add_argument('--files-per-dir', type=int, default=DEFAULT_TREE["files_per_dir"], help='Files per directory')
+    parser.add_argument('--mean-size', type=int, default=DEFAULT_TREE["mean_size"], help='Mean file size in bytes')
+    parser.add_argument('--size-sigma', type=float, default=DEFAULT_TREE["size_sigma"],
+                        help='Spread of the log-normal file size distribution')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_TREE["max_size"], help='Largest file size in bytes')
+    parser.add_argument('--binary-ratio', type=float, default=DEFAULT_TREE["binary_ratio"], help='Fraction of binary files')
+    parser.add_argument('--seed', type=int, default=DEFAULT_TREE["seed"], help='Random seed for the tree')
+    parser.add_argument('--scan-workers', type=int, default=None, help='Scanner threads (default: dir_scanner default)')
+    parser.add_argument('--workers', type=int, default=None, help='Tokenizer threads (default: all cores)')
+    parser.add_argument('--processes', action='store_true', help='Tokenize in worker processes')
+    parser.add_argument('--copy-mode', default='copy', help='copy, reflink or hardlink for the flatten stage')
+    parser.add_argument('--anthropic-files', type=int, default=500, help='Files sent to the fake endpoint (default: 500)')
+    parser.add_argument('--api-concurrency', type=int, default=8, help='Concurrent requests to the fake endpoint')
+    parser.add_argument('--api-rpm', type=float, default=0, help='Request rate limit, 0 for none (default: 0)')
+    parser.add_argument('--api-latency', type=float, default=0.02, help='Seconds the fake endpoint waits per request')
+    parser.add_argument('--api-error-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+
+    args = parser.parse_args()
+    stages = [stage.strip() for stage in args.stages.split(',') if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    import dir_scanner
+    from batch_counter import DEFAULT_WORKERS
+
+    workdir = tempfile.mkdtemp(prefix='data-ai-toolkit-bench-')
+    tree = os.path.abspath(args.tree) if args.tree else os.path.join(workdir, 'tree')
+    server = None
+    try:
+        if args.tree and os.path.exists(tree):
+            print(f"Error: '{tree}' already exists", file=sys.stderr)
+            sys.exit(1)
+        tree_options = {key: getattr(args, key) for key in DEFAULT_TREE}
+        print("Generating tree...", file=sys.stderr)
+        start = time.perf_counter()
+        generated = generate_tree(tree, **tree_options)
+        print(f"Generated {generated['files']:,} files in {generated['dirs']:,} directories "
+              f"({generated['bytes'] / (1024 * 1024):.1f} MB) in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        # Every stage after the scan starts from the same scan result
+        with open(os.path.join(workdir, 'scan.json'), 'w') as f:
+            json.dump(dir_scanner.create_directory_lookup_table(tree, dir_scanner.DEFAULT_IGNORE.copy(), verbose=False), f)
+
+        options = {
+            "scan_workers": args.scan_workers or dir_scanner.DEFAULT_WORKERS,
+            "workers": args.workers or DEFAULT_WORKERS,
+            "processes": args.processes,
+            "copy_mode": args.copy_mode,
+            "anthropic_files": args.anthropic_files,
+            "api_concurrency": args.api_concurrency,
+            "api_rpm": args.api_rpm,
+        }
+        if 'anthropic' in stages:
+            server = start_fake_endpoint(args.api_latency, args.api_error_rate, args.seed)
+            options["endpoint"] = f"http://127.0.0.1:{server.server_address[1]}"
+
+        results = {}
+        for stage in stages:
+            runs = []
+            for run in range(max(1, args.repeat)):
+                print(f"Running {stage} ({run + 1}/{args.repeat})...", file=sys.stderr)
+                runs.append(run_stage_isolated(stage, tree, workdir, options, args.stage_timeout))
+                if "wall_seconds" not in runs[-1]:
+                    break
+            results[stage] = summarize_runs(runs)
+    finally:
+        if server is not None:
+            server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "tree": dict(tree_options, **generated),
+        "options": {key: value for key, value in options.items() if key != "endpoint"},
+        "stages": results,
+    }
+
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+        print(f"Wrote results to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    for stage, result in results.items():
+        if "wall_seconds" in result:
+            print(f"{stage}: {result['wall_seconds']:.3f}s, {result['files_per_sec']:,} files/sec, "
+                  f"peak RSS {result.get('peak_rss_mb')} MB", file=sys.stderr)
+        else:
+            print(f"{stage}: {result.get('skipped') or result.get('error')}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"\nCompared with {args.compare}:", file=sys.stderr)
+        for line in compare_results(baseline, report):
+            print(line, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,46 @@
 import sys
 import json
 import os
+import shutil
+import time
+import hashlib
 import argparse
-from typing import Tuple, List, Optional, Any
+import threading
+import contextlib
+from typing import Dict, Iterator, Tuple, List, Optional, Any
+
+from concurrent.futures import as_completed
+
+from token_cache import TokenCache, content_digest, open_token_cache
+from batch_counter import BatchTokenCounter, DEFAULT_WORKERS
+from dir_scanner import iter_dir_items, load_ignore_file, load_scan
+from file_sniffer import classify_file, limits_from_ignore, read_classified, skip_summary
+from metrics import VERBOSE, Metrics, add_metrics_arguments, finish_metrics, metrics_from_args
+from file_selection import DEFAULT_WEIGHTS, estimate_tokens, load_weights_file, select_within_budget
+from dedup import DuplicateFinder, report_duplicates, tokens_saved
+from archive_writer import ArchiveWriter, COMPRESSION_POLICIES, archive_format
+from anthropic_counter import AnthropicTokenCounter, DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_MINUTE
+
+# Sync manifest, stored next to the output directory
+SYNC_MANIFEST_SUFFIX = '.manifest.json'
+SYNC_MANIFEST_VERSION = 1
+
+# Lists the files left out as duplicates; flattened names never start with '@'
+DUPLICATES_MANIFEST = '@duplicates.txt'
+DUPLICATES_HEADER = "# Files not copied because their content is identical to another file in this folder\n"
+
+# How flattened files are created from their sources
+COPY_MODES = ('copy', 'reflink', 'hardlink')
+COPY_CHUNK_SIZE = 1024 * 1024
+COPY_RANGE_SIZE = 64 * 1024 * 1024
+
+TIKTOKEN_MODEL = "gpt-4o"
+
+# Rough cost of an image or PDF page when selecting files for a token budget
+VISUAL_FILE_TOKENS = 1600
+
+# Linux ioctl used to clone a file on copy-on-write filesystems
+FICLONE = 0x40049409
 
 def transform_path(parent_dir: str, filepath: str) -> str:
     # If it's the root directory file, just return the filename
@@ -41,10 +79,24 @@ def is_visual_file(filepath: str) -> bool:
     visual_extensions = ('.png', '.jpg', '.jpeg', '.pdf')
     return filepath.lower().endswith(visual_extensions)
 
-def setup_anthropic_counter(count_tokens: bool, model_name: str) -> Tuple[bool, Optional[Any]]:
-    """Initialize Anthropic token counting if enabled."""
+def estimate_file_tokens(path: str, size: int) -> int:
+    """Token estimate used for budget selection; visual files have a fixed cost."""
+    if is_visual_file(path):
+        return VISUAL_FILE_TOKENS
+    return estimate_tokens(path, size)
+
+def setup_anthropic_counter(count_tokens: bool, model_name: str, client: Optional[Any] = None) -> Tuple[bool, Optional[Any]]:
+    """
+    Initialize Anthropic token counting if enabled.
+    A ready-made client can be passed in (e.g. one pointed at a local stand-in server).
+    No test request is made; authentication problems surface on the first count.
+    """
     if not count_tokens:
         return False, None
+
+    if client is not None:
+        print(f"Using Anthropic API tokenizer with {model_name}")
+        return True, client
     
     try:
         from anthropic import Anthropic
@@ -54,12 +106,8 @@ def setup_anthropic_counter(count_tokens: bool, model_name: str) -> Tuple[bool,
         return False, None
     
     try:
-        client = Anthropic()
-        # Test the client with a simple count
-        client.beta.messages.count_tokens(
-            model=model_name,
-            messages=[{"role": "user", "content": "test"}]
-        )
+        # AnthropicCounter does the retrying, under the rate limit; the SDK's own retries would bypass it
+        client = Anthropic(max_retries=0)
         print(f"Using Anthropic API tokenizer with {model_name}")
         return True, client
     except Exception as e:
@@ -74,7 +122,7 @@ def setup_tiktoken_counter(count_tokens: bool) -> Tuple[bool, Optional[Any]]:
     
     try:
         import tiktoken
-        model_name = "gpt-4o"
+        model_name = TIKTOKEN_MODEL
         encoder = tiktoken.encoding_for_model(model_name)
         print(f"Using tiktoken tokenizer with {model_name} encoder")
         return True, encoder
@@ -114,13 +162,14 @@ def count_tiktoken_tokens(encoder: Optional[Any], content: str) -> Optional[int]
         print(f"Warning: Token counting failed: {e}")
         return None
 
-def setup_token_counter(count_tokens: bool, tokenizer: str, model_name: str = None) -> Tuple[bool, Optional[Any], str]:
+def setup_token_counter(count_tokens: bool, tokenizer: str, model_name: str = None,
+                        anthropic_client: Optional[Any] = None) -> Tuple[bool, Optional[Any], str]:
     """Setup the appropriate token counter based on tokenizer choice."""
     if not count_tokens:
         return False, None, tokenizer
     
     if tokenizer == 'anthropic':
-        is_enabled, counter = setup_anthropic_counter(count_tokens, model_name)
+        is_enabled, counter = setup_anthropic_counter(count_tokens, model_name, anthropic_client)
         if not is_enabled and count_tokens:
             print("Falling back to tiktoken...")
             is_enabled, counter = setup_tiktoken_counter(count_tokens)
@@ -138,28 +187,317 @@ def count_file_tokens(tokenizer: str, counter: Any, model_name: str, content: st
     else:  # tiktoken
         return count_tiktoken_tokens(counter, content)
 
-def concat_dir_data(dir_data: dict, output_dir: str, count_tokens: bool = False, 
+def folder_limits(ignore_patterns: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Limits for a flattened folder. Unlike the single-file bundle, a folder can hold
+    binary files, so they are copied (without a token count) unless the ignore file
+    sets skip_binary.
+    """
+    return limits_from_ignore(dict(ignore_patterns, skip_binary=ignore_patterns.get('skip_binary', False)))
+
+def sync_manifest_path(output_dir: str) -> str:
+    """Location of the sync manifest for an output directory."""
+    return os.path.normpath(output_dir) + SYNC_MANIFEST_SUFFIX
+
+def load_sync_manifest(filename: str) -> Dict[str, Any]:
+    """Load the sync manifest, or return an empty one if it is missing or unreadable."""
+    empty = {'version': SYNC_MANIFEST_VERSION, 'files': {}}
+    if not os.path.exists(filename):
+        return empty
+    try:
+        with open(filename, 'r') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read sync manifest '{filename}': {e}. Copying all files.")
+        return empty
+    if manifest.get('version') != SYNC_MANIFEST_VERSION or not isinstance(manifest.get('files'), dict):
+        print("Warning: Sync manifest has an unknown format. Copying all files.")
+        return empty
+    return manifest
+
+def save_sync_manifest(filename: str, manifest: Dict[str, Any]) -> None:
+    """Write the sync manifest for the next run."""
+    with open(filename, 'w') as f:
+        json.dump(manifest, f)
+
+def file_digest(path: str) -> str:
+    """Content hash used to detect files that were touched but not changed. Reads in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_text_for_counting(path: str, kind: str, encoding: Optional[str], size: int,
+                           limits: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Read and decode a classified file for token counting.
+    Returns None for binary files, which were already detected from their
+    first block so they are never loaded whole.
+    """
+    if kind == 'binary':
+        return None
+    return read_classified(path, kind, encoding, size, limits)
+
+@contextlib.contextmanager
+def replacing(dst: str) -> Iterator[str]:
+    """
+    Yield a temporary path next to dst and move it over dst once the block succeeds.
+    dst is never opened for writing, so an output hard-linked to its source by
+    --copy-mode hardlink is replaced instead of written through.
+    """
+    folder, name = os.path.split(dst)
+    tmp = os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        yield tmp
+        os.replace(tmp, dst)
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+
+def write_truncated_copy(src: str, dst: str, size: int, encoding: Optional[str],
+                         limits: Dict[str, Any], content: Optional[str] = None) -> str:
+    """Write the first max_file_size bytes of a text file, with a note that it was cut short."""
+    if content is None:
+        content = read_classified(src, 'truncate', encoding, size, limits)
+    with replacing(dst) as tmp, open(tmp, "w", encoding='utf-8') as f:
+        f.write(content)
+    return 'truncated'
+
+def kernel_copy(src: str, dst: str) -> str:
+    """
+    Copy a file inside the kernel with copy_file_range, falling back to
+    shutil.copyfile (which itself uses sendfile or a chunked copy).
+    Returns the name of the method that was used.
+    """
+    with replacing(dst) as tmp:
+        if hasattr(os, "copy_file_range"):
+            try:
+                with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                    remaining = os.fstat(fsrc.fileno()).st_size
+                    while remaining > 0:
+                        copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), min(remaining, COPY_RANGE_SIZE))
+                        if copied == 0:
+                            break
+                        remaining -= copied
+                    if remaining == 0:
+                        return "copy_file_range"
+            except OSError:
+                pass
+        shutil.copyfile(src, tmp)
+        return "copy"
+
+def reflink_copy(src: str, dst: str) -> bool:
+    """Clone a file with the FICLONE ioctl (btrfs, XFS, ...). Returns False if unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with replacing(dst) as tmp, open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return True
+    except OSError:
+        return False
+
+def transfer_file(src: str, dst: str, mode: str = 'copy') -> str:
+    """
+    Place src at dst using the requested copy mode, falling back to a
+    kernel copy when links or clones are not supported.
+    Returns the name of the method that was used.
+    """
+    if mode == 'hardlink':
+        try:
+            if os.path.lexists(dst):
+                os.remove(dst)
+            os.link(src, dst)
+            return "hardlink"
+        except OSError:
+            pass
+    elif mode == 'reflink':
+        if reflink_copy(src, dst):
+            return "reflink"
+    return kernel_copy(src, dst)
+
+def source_unchanged(entry: Optional[Dict[str, Any]], full_path: str, st: os.stat_result,
+                     copy_mode: str = 'copy') -> bool:
+    """Check a manifest entry against the current stat of its source file and the copy mode in use."""
+    return (entry is not None and entry['source'] == full_path and same_copy_mode(entry, copy_mode)
+            and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns)
+
+def same_copy_mode(entry: Dict[str, Any], copy_mode: str) -> bool:
+    """Whether an output was made with copy_mode; manifests from before it was recorded used 'copy'."""
+    return entry.get('copy_mode', 'copy') == copy_mode
+
+def existing_outputs(output_dir: str) -> Dict[str, Any]:
+    """
+    Flattened files already in output_dir, as manifest-like entries: files at the top
+    level and visual files in visual/. Used when there is no manifest to go by.
+    """
+    entries = {}
+    for folder, visual in ((output_dir, False), (os.path.join(output_dir, "visual"), True)):
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if (entry.is_file(follow_symlinks=False) and entry.name != DUPLICATES_MANIFEST
+                            and is_visual_file(entry.name) == visual):
+                        entries[entry.name] = {'visual': visual}
+        except FileNotFoundError:
+            pass
+    return entries
+
+def remove_stale_outputs(output_dir: str, old_entries: Dict[str, Any], new_entries: Dict[str, Any]) -> int:
+    """
+    Delete flattened files whose source no longer exists. Returns the number removed.
+    Without old entries (the first sync into a folder), every flattened file in the
+    folder that this run did not write is stale, such as those left by an earlier
+    run without --sync.
+    """
+    if not old_entries:
+        old_entries = existing_outputs(output_dir)
+    removed = 0
+    for name, entry in old_entries.items():
+        if name in new_entries:
+            continue
+        folder = os.path.join(output_dir, "visual") if entry.get('visual') else output_dir
+        try:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Warning: Could not remove stale file {name}: {e}")
+    return removed
+
+def write_duplicates_manifest(output_dir: str, duplicates: List[Tuple[str, str]],
+                              archive: Optional[ArchiveWriter] = None) -> None:
+    """List each left-out duplicate next to the flattened file it matches, or remove an old list."""
+    text = DUPLICATES_HEADER + "".join(f"{name} -> {original}\n" for name, original in duplicates)
+    if archive is not None:
+        if duplicates:
+            archive.add_text(DUPLICATES_MANIFEST, text)
+        return
+    path = os.path.join(output_dir, DUPLICATES_MANIFEST)
+    if not duplicates:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, "w", encoding='utf-8') as f:
+        f.write(text)
+
+def concat_dir_data(dir_data, output_dir: str, count_tokens: bool = False, 
                    tokenizer: str = 'anthropic',
-                   model_name: str = "claude-3-5-sonnet-latest") -> Tuple[List[str], List[str]]:
+                   model_name: str = "claude-3-5-sonnet-latest",
+                   sync_manifest: Optional[Dict[str, Any]] = None,
+                   copy_mode: str = 'copy',
+                   token_cache: Optional[TokenCache] = None,
+                   anthropic_client: Optional[Any] = None,
+                   api_concurrency: int = DEFAULT_CONCURRENCY,
+                   api_rpm: float = DEFAULT_REQUESTS_PER_MINUTE,
+                   workers: int = DEFAULT_WORKERS,
+                   use_processes: bool = False,
+                   limits: Optional[Dict[str, Any]] = None,
+                   metrics: Optional[Metrics] = None,
+                   dedup: bool = False,
+                   archive: Optional[ArchiveWriter] = None) -> Tuple[List[str], List[str]]:
+    """
+    Copy every file into output_dir under its flattened name.
+    dir_data is the scan dictionary or a lazy stream of (root, listing) pairs.
+    When a sync manifest is given, files whose source is unchanged are not
+    rewritten, flattened files whose source disappeared are deleted, and the
+    manifest is updated in place for the next run.
+    Files are copied with copy_mode (see transfer_file) rather than read into memory.
+    Token counts are looked up in token_cache first when one is given.
+    Anthropic counts run concurrently (api_concurrency requests, at most api_rpm
+    per minute) while files are being copied, and are collected at the end.
+    tiktoken counts are batched across 'workers' threads (or processes) the same way.
+    'limits' (see file_sniffer.py) decides which binary or oversized files are skipped,
+    or truncated, from their size and first block before anything is copied.
+    Per-file lines are printed only when metrics is at the verbose level; without
+    metrics every file is reported, as before.
+    With dedup, a file whose content matches an earlier one is neither copied nor
+    counted; it is listed in DUPLICATES_MANIFEST next to the file it matches.
+    With an archive, the flattened files (and visual/) are streamed into it as
+    entries instead of being written to output_dir; sync is not supported then.
+    """
+    if archive is not None and sync_manifest is not None:
+        raise ValueError("sync mode cannot be used with archive output")
+    metrics = metrics or Metrics(VERBOSE)
+    limits = limits or folder_limits({})
+    skipped = {}
     created_files = []
     visual_files = []
     total_tokens = 0
+    old_entries = sync_manifest['files'] if sync_manifest is not None else {}
+    new_entries = {}
+    written = 0
+    unchanged = 0
+    copy_methods = {}
+    finder = DuplicateFinder() if dedup else None
+    duplicates = []
+    token_counts = {}
     
     # Initialize token counting
     token_counting_enabled, counter, active_tokenizer = setup_token_counter(
-        count_tokens, tokenizer, model_name
+        count_tokens, tokenizer, model_name, anthropic_client
     )
     
+    cache_model = model_name if active_tokenizer == 'anthropic' else TIKTOKEN_MODEL
+    api_counter = None
+    batch_counter = None
+    pending_counts = {}
+    finished_counts = []
+    if token_counting_enabled and active_tokenizer == 'anthropic':
+        api_counter = AnthropicTokenCounter(counter, model_name, api_concurrency, api_rpm)
+    elif token_counting_enabled:
+        batch_counter = BatchTokenCounter(counter, workers, use_processes, metrics=metrics)
+    
     visual_dir = None
-    parent_dir = next(iter(dir_data.keys()))
+    parent_dir = None
     
-    for base_dir, content in dir_data.items():
+    for base_dir, content in iter_dir_items(dir_data):
+        # The first directory in a scan is its root
+        if parent_dir is None:
+            parent_dir = base_dir
         for filepath in content["files"]:
             full_path = os.path.join(base_dir, filepath)
             relative_path = os.path.relpath(full_path, parent_dir)
             transformed_name = transform_path(parent_dir, relative_path)
+            visual = is_visual_file(transformed_name)
+
+            file_start = time.perf_counter()
+
+            # Images and PDFs are binary by nature, so only their size is checked
+            try:
+                with metrics.timer('read'):
+                    st = os.stat(full_path)
+                    kind, encoding, size = classify_file(full_path, limits, st.st_size, sniff=not visual)
+            except OSError as e:
+                metrics.count('errors')
+                print(f"Error processing {full_path}: {e}")
+                continue
+            if kind == 'oversize' or (kind == 'binary' and limits['skip_binary']):
+                reason = "binary" if kind == 'binary' else f"larger than max_file_size, {size:,} bytes"
+                metrics.detail(f"\nSkipping: {full_path} ({reason})")
+                metrics.count(f"skipped_{kind}")
+                skipped[kind] = skipped.get(kind, 0) + 1
+                continue
+
+            if finder is not None:
+                try:
+                    with metrics.timer('dedup'):
+                        original = finder.check(full_path, size, transformed_name)
+                except OSError:
+                    original = None
+                if original is not None:
+                    metrics.detail(f"\nDuplicate: {full_path} has the same content as {original}")
+                    duplicates.append((transformed_name, original))
+                    continue
             
-            if is_visual_file(transformed_name):
+            if archive is not None:
+                output_path = f"visual/{transformed_name}" if visual else transformed_name
+                (visual_files if visual else created_files).append(transformed_name)
+            elif visual:
                 if visual_dir is None:
                     visual_dir = os.path.join(output_dir, "visual")
                     os.makedirs(visual_dir, exist_ok=True)
@@ -169,57 +507,207 @@ def concat_dir_data(dir_data: dict, output_dir: str, count_tokens: bool = False,
                 output_path = os.path.join(output_dir, transformed_name)
                 created_files.append(transformed_name)
             
-            print(f"\nProcessing: {full_path} -> {transformed_name}")
+            metrics.detail(f"\nProcessing: {full_path} -> {transformed_name}")
+            metrics.count('files')
+            metrics.count('bytes', size)
             
             try:
-                # Read file content
-                with open(full_path, "rb") as f:
-                    file_content = f.read()
+                previous = old_entries.get(transformed_name)
+                decoded_content = None
+                source_same = False
+                if sync_manifest is not None:
+                    source_same = source_unchanged(previous, full_path, st, copy_mode) and os.path.exists(output_path)
+                    if source_same:
+                        new_entries[transformed_name] = previous
+                        unchanged += 1
                 
                 # Count tokens if enabled and not a visual file
-                if token_counting_enabled and not is_visual_file(transformed_name):
-                    try:
-                        # Decode content for token counting
-                        decoded_content = file_content.decode('utf-8')
-                        token_count = count_file_tokens(active_tokenizer, counter, model_name, decoded_content)
+                if token_counting_enabled and not visual:
+                    with metrics.timer('read'):
+                        decoded_content = read_text_for_counting(full_path, kind, encoding, size, limits)
+                    if decoded_content is None:
+                        metrics.detail("Warning: File appears to be binary. Skipping token count.")
+                    else:
+                        digest = content_digest(decoded_content)
+                        token_count = token_cache.get(active_tokenizer, cache_model, digest) if token_cache else None
                         if token_count is not None:
                             total_tokens += token_count
-                            print(f"Tokens: {token_count:,}")
-                    except UnicodeDecodeError:
-                        print("Warning: File appears to be binary. Skipping token count.")
+                            metrics.detail(f"Tokens: {token_count:,}")
+                            if finder is not None:
+                                token_counts[transformed_name] = token_count
+                        elif api_counter is not None:
+                            # Time from submission to answer, including rate limiting and retries
+                            submitted = time.perf_counter()
+                            future = api_counter.submit(decoded_content)
+                            future.add_done_callback(
+                                lambda _, start=submitted: metrics.add_time('tokenize', time.perf_counter() - start)
+                            )
+                            pending_counts[future] = (transformed_name, digest)
+                        else:
+                            finished_counts.extend(batch_counter.add((transformed_name, digest), decoded_content))
+                    # Only truncated files reuse the decoded text when writing the output
+                    if kind != 'truncate':
+                        decoded_content = None
+
+                if source_same:
+                    metrics.record_file(full_path, time.perf_counter() - file_start)
+                    continue
+
+                if sync_manifest is not None:
+                    with metrics.timer('read'):
+                        digest = file_digest(full_path)
+                    new_entries[transformed_name] = {
+                        'source': full_path,
+                        'size': st.st_size,
+                        'mtime_ns': st.st_mtime_ns,
+                        'sha256': digest,
+                        'visual': visual,
+                        'copy_mode': copy_mode,
+                    }
+                    if (previous is not None and previous['sha256'] == digest and same_copy_mode(previous, copy_mode)
+                            and os.path.exists(output_path)):
+                        unchanged += 1
+                        metrics.record_file(full_path, time.perf_counter() - file_start)
+                        continue
                 
-                # Write the file
-                with open(output_path, "wb") as out_f:
-                    out_f.write(file_content)
+                with metrics.timer('write'):
+                    if kind == 'truncate':
+                        skipped['truncate'] = skipped.get('truncate', 0) + 1
+                        if archive is not None:
+                            if decoded_content is None:
+                                decoded_content = read_classified(full_path, kind, encoding, size, limits)
+                            method = archive.add_text(output_path, decoded_content)
+                        else:
+                            method = write_truncated_copy(full_path, output_path, size, encoding, limits, decoded_content)
+                    elif archive is not None:
+                        # Streamed into the archive in chunks
+                        method = archive.add_file(full_path, output_path)
+                    else:
+                        # Copy the file without passing it through Python memory
+                        method = transfer_file(full_path, output_path, copy_mode)
+                copy_methods[method] = copy_methods.get(method, 0) + 1
+                written += 1
+                metrics.record_file(full_path, time.perf_counter() - file_start)
                     
             except Exception as e:
+                metrics.count('errors')
                 print(f"Error processing {full_path}: {e}")
                 continue
+
+    if api_counter is not None:
+        if pending_counts:
+            metrics.info(f"\nWaiting for {len(pending_counts):,} token counts from the Anthropic API...")
+        for future in as_completed(pending_counts):
+            finished_counts.append((pending_counts[future], future.result()))
+        api_counter.close()
+        if api_counter.retries:
+            metrics.count('api_retries', api_counter.retries)
+            metrics.info(f"Anthropic API requests retried: {api_counter.retries:,}")
+    if batch_counter is not None:
+        finished_counts.extend(batch_counter.finish())
+
+    for (name, digest), token_count in finished_counts:
+        if token_count is None:
+            continue
+        total_tokens += token_count
+        metrics.detail(f"Tokens ({name}): {token_count:,}")
+        if finder is not None:
+            token_counts[name] = token_count
+        if token_cache is not None:
+            token_cache.put(active_tokenizer, cache_model, digest, token_count)
+
+    skipped_summary = skip_summary(skipped)
+    if skipped_summary:
+        metrics.info(f"\n{skipped_summary}")
+
+    try:
+        write_duplicates_manifest(output_dir, duplicates, archive)
+    except OSError as e:
+        print(f"Warning: Could not write {DUPLICATES_MANIFEST}: {e}")
+    report_duplicates(finder, metrics, tokens_saved(duplicates, token_counts))
+
+    if copy_methods:
+        summary = ", ".join(f"{method}: {count:,}" for method, count in sorted(copy_methods.items()))
+        label = "Archived files" if archive is not None else "Copied files"
+        metrics.info(f"\n{label} ({summary})")
+    metrics.count('written', written)
+
+    if sync_manifest is not None:
+        with metrics.timer('write'):
+            removed = remove_stale_outputs(output_dir, old_entries, new_entries)
+        sync_manifest['files'] = new_entries
+        metrics.count('unchanged', unchanged)
+        metrics.count('removed', removed)
+        metrics.info(f"\nSync: {written:,} written, {unchanged:,} unchanged, {removed:,} removed")
     
     if token_counting_enabled and total_tokens > 0:
+        metrics.count('tokens', total_tokens)
         tokenizer_name = "Anthropic API" if active_tokenizer == 'anthropic' else "tiktoken"
-        print(f"\nTotal tokens processed ({tokenizer_name}): {total_tokens:,}")
+        metrics.info(f"\nTotal tokens processed ({tokenizer_name}): {total_tokens:,}")
         
         if total_tokens > 80000:
             print("\nWARNING: Total tokens exceed 80,000. This may be too large for some models.")
+
+    if token_counting_enabled and token_cache is not None:
+        metrics.info(token_cache.summary())
     
     return created_files, visual_files
 
-def main():
-    parser = argparse.ArgumentParser(description='Process directory structure into Claude-friendly format.')
-    parser.add_argument('json_file', help='Input JSON file containing directory structure')
-    parser.add_argument('output_dir', help='Output directory for processed files')
+def add_flatten_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options for flattening and counting, shared with pipeline.py's claude command."""
     parser.add_argument('-c', '--count-tokens', action='store_true', help='Enable token counting')
     parser.add_argument('-m', '--model', default="claude-3-5-sonnet-latest", 
                       help='Model name for token counting (default: claude-3-5-sonnet-latest)')
     parser.add_argument('-t', '--tokenizer', choices=['anthropic', 'tiktoken'], default='anthropic',
                       help='Choose tokenizer for counting (default: anthropic)')
+    parser.add_argument('-s', '--sync', action='store_true',
+                      help='Update the output directory in place, only copying changed files')
+    parser.add_argument('--copy-mode', choices=COPY_MODES, default='copy',
+                      help='How to create output files: kernel copy, reflink clone or hardlink (default: copy)')
+    parser.add_argument('--api-concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                      help=f'Concurrent Anthropic token counting requests (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--api-rpm', type=float, default=DEFAULT_REQUESTS_PER_MINUTE,
+                      help=f'Maximum Anthropic token counting requests per minute (default: {DEFAULT_REQUESTS_PER_MINUTE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Threads used for tiktoken counting (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--processes', action='store_true', help='Count tiktoken tokens in worker processes instead of threads')
+    parser.add_argument('-b', '--token-budget', type=int, metavar='N',
+                      help='Only include the most valuable files that fit in N tokens (estimated from file sizes)')
+    parser.add_argument('--weights', metavar='FILE', help='JSON file with priority weights for --token-budget')
+    parser.add_argument('--token-cache', metavar='PATH', help='Token count cache database (default: ~/.cache/data-ai-toolkit)')
+    parser.add_argument('--no-token-cache', action='store_true', help='Always re-count tokens instead of using the cache')
+    parser.add_argument('--dedup', action='store_true',
+                      help=f'Copy files with identical content once and list the others in {DUPLICATES_MANIFEST}')
+    parser.add_argument('--compression', choices=COMPRESSION_POLICIES, default='auto',
+                      help='Zip entry compression: auto stores already compressed files and deflates the rest (default: auto)')
+
+def main():
+    parser = argparse.ArgumentParser(description='Process directory structure into Claude-friendly format.')
+    parser.add_argument('json_file', help="Input JSON or NDJSON file from dir_scanner.py, '-' for stdin")
+    parser.add_argument('output_dir', help='Output directory for processed files, or a .zip, .tar or .tar.gz archive')
     parser.add_argument('-y', '--yes', action='store_true', help='Skip confirmation prompts')
+    parser.add_argument('-i', '--ignore', metavar='FILE',
+                      help='Ignore file to take max_file_size, oversize_action and skip_binary from')
+    add_flatten_arguments(parser)
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
+    metrics = metrics_from_args(args)
+    limits = folder_limits(load_ignore_file(args.ignore) if args.ignore else {})
+    archive_type = archive_format(args.output_dir)
+
+    if archive_type is not None:
+        if args.sync:
+            parser.error("--sync cannot be used with archive output")
+        if os.path.exists(args.output_dir) and not args.yes:
+            confirm = input(f"Output archive '{args.output_dir}' already exists. Overwrite? (y/N): ")
+            if confirm.lower() != 'y':
+                print("Operation cancelled.")
+                sys.exit(0)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output_dir)), exist_ok=True)
 
     # Confirm output directory with user and handle deletion
-    if os.path.exists(args.output_dir):
+    elif os.path.exists(args.output_dir) and not args.sync:
         if not args.yes:
             confirm = input(f"Output directory '{args.output_dir}' already exists. Delete and continue? (y/N): ")
             if confirm.lower() != 'y':
@@ -228,38 +716,95 @@ def main():
         
         # Remove existing output directory
         try:
-            import shutil
             shutil.rmtree(args.output_dir)
         except Exception as e:
             print(f"Error removing directory {args.output_dir}: {e}")
             sys.exit(1)
 
     # Create fresh output directory
-    os.makedirs(args.output_dir, exist_ok=True)
+    if archive_type is None:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    sync_manifest = None
+    if args.sync:
+        manifest_file = sync_manifest_path(args.output_dir)
+        sync_manifest = load_sync_manifest(manifest_file)
 
-    with open(args.json_file, 'r') as json_file:
-        dir_data = json.load(json_file)
+    try:
+        with metrics.timer('load'):
+            dir_data = load_scan(args.json_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.json_file}: {e}")
+        sys.exit(1)
+
+    if isinstance(dir_data, dict):
         if not validate_json(dir_data):
             sys.exit(1)
-        
-        print("JSON is valid. Processing files...")
+        metrics.info("JSON is valid. Processing files...")
+    else:
+        metrics.info("Reading NDJSON scan stream. Processing files...")
+
+    if args.token_budget is not None:
+        try:
+            weights = load_weights_file(args.weights) if args.weights else DEFAULT_WEIGHTS
+        except Exception as e:
+            print(f"Error reading weights file {args.weights}: {e}")
+            sys.exit(1)
+        dir_data = select_within_budget(dict(iter_dir_items(dir_data)), args.token_budget, weights,
+                                        estimate_file_tokens)
+
+    token_cache = open_token_cache(args.count_tokens and not args.no_token_cache, args.token_cache)
+    archive = None
+    try:
+        if archive_type is not None:
+            archive = ArchiveWriter(args.output_dir, archive_type, args.compression)
         created_files, visual_files = concat_dir_data(
             dir_data, 
             args.output_dir,
             count_tokens=args.count_tokens,
             tokenizer=args.tokenizer,
-            model_name=args.model
+            model_name=args.model,
+            sync_manifest=sync_manifest,
+            copy_mode=args.copy_mode,
+            token_cache=token_cache,
+            api_concurrency=args.api_concurrency,
+            api_rpm=args.api_rpm,
+            workers=args.workers,
+            use_processes=args.processes,
+            limits=limits,
+            metrics=metrics,
+            dedup=args.dedup,
+            archive=archive
         )
+    except ValueError as e:
+        print(f"Error reading {args.json_file}: {e}")
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error writing {args.output_dir}: {e}")
+        sys.exit(1)
+    finally:
+        if archive is not None:
+            archive.close()
+        if token_cache is not None:
+            token_cache.close()
+
+    if sync_manifest is not None:
+        try:
+            save_sync_manifest(manifest_file, sync_manifest)
+        except Exception as e:
+            print(f"Warning: Could not write sync manifest '{manifest_file}': {e}")
+
+    finish_metrics(metrics, args.metrics_json)
+    
+    # don't print these for now, just look in the folder to see what was made
+    # print("\nCreated files:")
+    # for f in created_files:
+    #     print(f"- {f}")
         
-        # don't print these for now, just look in the folder to see what was made
-        # print("\nCreated files:")
-        # for f in created_files:
-        #     print(f"- {f}")
-            
-        # if visual_files:
-        #     print("\nVisual files (in 'visual' subdirectory):")
-        #     for f in visual_files:
-        #         print(f"- {f}")
+    # if visual_files:
+    #     print("\nVisual files (in 'visual' subdirectory):")
+    #     for f in visual_files:
+    #         print(f"- {f}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+# dedup.py
+# ---
+# finds files whose content is identical to one seen earlier in the same run
+# (vendored copies, generated fixtures, repeated license files), so the concat
+# tools can emit each body once and refer back to it for the rest.
+# files are grouped by size first; only files that share a size are ever hashed.
+
+import os
+import time
+import hashlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from metrics import Metrics
+
+# Smaller files cost about as much as the reference that would replace them
+DEFAULT_MIN_SIZE = 256
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def fast_digest(path: str) -> str:
+    """BLAKE2b hash of a file's bytes, read in chunks."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DuplicateFinder:
+    """
+    Tracks the files seen so far in a run, grouped by size. A file is only
+    hashed once another file of the same size turns up, and each file is hashed
+    at most once. The first file with a given content is the original; check()
+    returns its key for every later copy.
+    """
+
+    def __init__(self, min_size: int = DEFAULT_MIN_SIZE):
+        self.min_size = min_size
+        # size -> [key, path, digest or None] for each distinct content seen
+        self.by_size = {}
+        # key -> (original key, size) for every duplicate found
+        self.found = {}
+
+    def _digest(self, entry: list) -> str:
+        if entry[2] is None:
+            try:
+                entry[2] = fast_digest(entry[1])
+            except OSError:
+                # Cannot be compared, so it matches nothing
+                entry[2] = f"unreadable:{entry[1]}"
+        return entry[2]
+
+    def check(self, path: str, size: int, key: Optional[str] = None) -> Optional[str]:
+        """
+        Return the key of an earlier file with the same content, or None if this
+        content is new (it then becomes the original for later copies).
+        'key' is how the file is referred to, and defaults to its path.
+        """
+        key = key or path
+        if size < self.min_size:
+            return None
+        group = self.by_size.get(size)
+        if group is None:
+            self.by_size[size] = [[key, path, None]]
+            return None
+
+        digest = fast_digest(path)
+        for entry in group:
+            if self._digest(entry) == digest:
+                self.found[key] = (entry[0], size)
+                return entry[0]
+        group.append([key, path, digest])
+        return None
+
+    def discard(self, key: str) -> None:
+        """Stop counting a duplicate, e.g. one left out because its original was skipped."""
+        self.found.pop(key, None)
+
+    @property
+    def duplicates(self) -> int:
+        return len(self.found)
+
+    @property
+    def bytes_saved(self) -> int:
+        return sum(size for _, size in self.found.values())
+
+def mark_duplicates(paths: Iterable[str], finder: Optional[DuplicateFinder],
+                    metrics: Optional[Metrics] = None) -> Iterator[Tuple[str, Optional[str]]]:
+    """
+    Yield (path, original) for each path, where original is the earlier path with
+    the same content, or None. Runs in order, so the first copy is always the original.
+    """
+    for path in paths:
+        if finder is None:
+            yield path, None
+            continue
+        start = time.perf_counter() if metrics is not None else None
+        try:
+            original = finder.check(path, os.stat(path).st_size)
+        except OSError:
+            # Left for the reader to report
+            original = None
+        if metrics is not None:
+            metrics.add_time('dedup', time.perf_counter() - start)
+        yield path, original
+
+def tokens_saved(duplicates: List[Tuple[str, str]], token_counts: dict) -> int:
+    """Tokens the originals would have cost again, less what their references cost."""
+    saved = 0
+    for key, original in duplicates:
+        if original in token_counts:
+            saved += token_counts[original] - token_counts.get(key, 0)
+    return max(saved, 0)
+
+def report_duplicates(finder: Optional[DuplicateFinder], metrics: Metrics, saved_tokens: Optional[int] = None) -> None:
+    """Print and record how many duplicates were replaced and what that saved."""
+    if finder is None or not finder.duplicates:
+        return
+    metrics.count('duplicates', finder.duplicates)
+    metrics.count('duplicate_bytes', finder.bytes_saved)
+    text = f"Duplicates: {finder.duplicates:,} files replaced by references, saving {finder.bytes_saved:,} bytes"
+    if saved_tokens:
+        metrics.count('duplicate_tokens', saved_tokens)
+        text += f" and {saved_tokens:,} tokens"
+    metrics.info(f"\n{text}")
@@ -1,7 +1,18 @@
 import os
+import re
 import sys
+import time
 import json
-from typing import Dict, Any
+import hashlib
+import argparse
+import itertools
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from file_sniffer import limits_from_ignore
+from git_index import GitError, git_file_list, group_by_directory
+from metrics import add_metrics_arguments, finish_metrics, metrics_from_args, timed_iter
 
 # Optional TOML support
 try:
@@ -17,6 +28,19 @@ DEFAULT_IGNORE = {
     "ignore_hidden": False
 }
 
+# Default number of threads used by the parallel scanner
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# Incremental scan manifest, stored next to the output JSON
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+
+# Output formats: one JSON document, or one JSON record per line
+SCAN_FORMATS = ('json', 'ndjson')
+# Where the file list comes from: walking the tree, or the git index
+SCAN_SOURCES = ('walk', 'git')
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+
 def detect_file_format(filename: str) -> str:
     """
     Detect the format of the ignore file based on extension.
@@ -27,13 +51,13 @@ def detect_file_format(filename: str) -> str:
         return 'toml'
     return 'json'
 
-def load_ignore_file(filename: str) -> Dict[str, Any]:
+def load_ignore_file(filename: str, log=sys.stdout) -> Dict[str, Any]:
     """
     Load and parse the ignore file, supporting both JSON and TOML formats.
     Returns the parsed ignore patterns or DEFAULT_IGNORE if loading fails.
     """
     if not os.path.exists(filename):
-        print(f"Warning: Ignore file '{filename}' not found. Using default patterns.")
+        print(f"Warning: Ignore file '{filename}' not found. Using default patterns.", file=log)
         return DEFAULT_IGNORE
 
     format_type = detect_file_format(filename)
@@ -41,8 +65,8 @@ def load_ignore_file(filename: str) -> Dict[str, Any]:
     try:
         if format_type == 'toml':
             if not HAS_TOML:
-                print("Warning: TOML file detected but tomli package not installed.")
-                print("Install with: pip install tomli")
+                print("Warning: TOML file detected but tomli package not installed.", file=log)
+                print("Install with: pip install tomli", file=log)
                 return DEFAULT_IGNORE
                 
             with open(filename, 'rb') as f:
@@ -55,28 +79,42 @@ def load_ignore_file(filename: str) -> Dict[str, Any]:
         required_keys = ['files', 'folders', 'extensions']
         for key in required_keys:
             if key not in ignore_patterns:
-                print(f"Warning: Missing required key '{key}' in ignore file.")
+                print(f"Warning: Missing required key '{key}' in ignore file.", file=log)
                 return DEFAULT_IGNORE
             if not isinstance(ignore_patterns[key], list):
-                print(f"Warning: '{key}' must be a list in ignore file.")
+                print(f"Warning: '{key}' must be a list in ignore file.", file=log)
                 return DEFAULT_IGNORE
         
         # Ensure all entries are strings
         for key in required_keys:
             if not all(isinstance(item, str) for item in ignore_patterns[key]):
-                print(f"Warning: All entries in '{key}' must be strings.")
+                print(f"Warning: All entries in '{key}' must be strings.", file=log)
                 return DEFAULT_IGNORE
         
-        # Set default for optional ignore_hidden flag
+        # Optional gitignore-style patterns
+        patterns = ignore_patterns.get('patterns', [])
+        if not isinstance(patterns, list) or not all(isinstance(item, str) for item in patterns):
+            print("Warning: 'patterns' must be a list of strings in ignore file.", file=log)
+            return DEFAULT_IGNORE
+
+        # Optional size and binary limits applied before files are read
+        try:
+            limits_from_ignore(ignore_patterns)
+        except ValueError as e:
+            print(f"Warning: {e} in ignore file.", file=log)
+            return DEFAULT_IGNORE
+
+        # Set default for optional flags
         ignore_patterns.setdefault('ignore_hidden', False)
+        ignore_patterns.setdefault('use_gitignore', False)
         
         return ignore_patterns
         
     except (json.JSONDecodeError, tomli.TOMLDecodeError) as e:
-        print(f"Warning: Invalid {format_type.upper()} in '{filename}': {e}")
+        print(f"Warning: Invalid {format_type.upper()} in '{filename}': {e}", file=log)
         return DEFAULT_IGNORE
     except Exception as e:
-        print(f"Warning: Error reading '{filename}': {e}")
+        print(f"Warning: Error reading '{filename}': {e}", file=log)
         return DEFAULT_IGNORE
 
 def should_ignore(name: str, ignore_patterns: Dict[str, Any]) -> bool:
@@ -91,25 +129,641 @@ def should_ignore(name: str, ignore_patterns: Dict[str, Any]) -> bool:
         return True
     return False
 
-def create_directory_lookup_table(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE) -> Dict[str, Dict[str, list]]:
-    """Create a lookup table of directories and their contents."""
-    directory_dict = {}
+GLOB_CHARS = re.compile(r'[*?\[\\]')
+
+def glob_to_regex(pattern: str) -> str:
+    """
+    Translate a gitignore-style glob into a regex fragment.
+    '*' and '?' never cross a '/', while '**' spans any number of directories.
+    """
+    i, n = 0, len(pattern)
+    out = []
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 2] == '**' and (i == 0 or pattern[i - 1] == '/'):
+                j = i + 2
+                if j == n:
+                    out.append('.*')
+                    i = j
+                    continue
+                if pattern[j] == '/':
+                    out.append('(?:.*/)?')
+                    i = j + 1
+                    continue
+            while i < n and pattern[i] == '*':
+                i += 1
+            out.append('[^/]*')
+            continue
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            j = i + 1
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            j = pattern.find(']', j)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:j].replace('\\', '\\\\')
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                out.append(f'[{body}]')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+def parse_ignore_rule(line: str, base: str = '') -> Optional[Dict[str, Any]]:
+    """
+    Parse one gitignore-style line into a rule dict, or None for blanks and comments.
+    'base' is the directory (relative to the scan root, '/' separated) the rule belongs to.
+    """
+    if line.endswith('\n'):
+        line = line[:-1]
+    if not line.endswith('\\ '):
+        line = line.rstrip()
+    if not line or line.startswith('#'):
+        return None
+
+    negate = line.startswith('!')
+    if negate:
+        line = line[1:]
+    elif line.startswith('\\!') or line.startswith('\\#'):
+        line = line[1:]
+
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+
+    anchored = '/' in line
+    line = line.lstrip('/')
+
+    rule = {'negate': negate, 'dir_only': dir_only, 'literal': None, 'regex': None}
+    if not anchored and not base and not GLOB_CHARS.search(line):
+        # Plain names go into hash lookups instead of the regex
+        rule['literal'] = line
+        return rule
+
+    prefix = re.escape(base) + '/' if base else ''
+    if not anchored:
+        prefix += '(?:.*/)?'
+    rule['regex'] = prefix + glob_to_regex(line)
+    return rule
+
+class IgnoreMatcher:
+    """
+    Compiled form of the ignore patterns for one directory level.
+    Literal names and extensions are kept in hash maps and every other pattern
+    is folded into a single regex, so lookups do not slow down as patterns are added.
+    When several rules match, the one defined last wins, as in .gitignore.
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], extensions: List[str],
+                 ignore_hidden: bool = False, use_gitignore: bool = False):
+        self.rules = rules
+        self.extensions = set(extensions)
+        self.ignore_hidden = ignore_hidden
+        self.use_gitignore = use_gitignore
+
+        self.names = {}
+        self.dir_names = {}
+        dir_groups = []
+        file_groups = []
+        for index, rule in enumerate(rules):
+            if rule['literal'] is not None:
+                target = self.dir_names if rule['dir_only'] else self.names
+                target[rule['literal']] = (index, rule['negate'])
+            else:
+                dir_groups.append(index)
+                if not rule['dir_only']:
+                    file_groups.append(index)
+
+        self.dir_regex, self.dir_group_rules = self._compile(dir_groups)
+        self.file_regex, self.file_group_rules = self._compile(file_groups)
+
+    def _compile(self, indexes: List[int]):
+        """Build one alternation with the highest priority rule tried first."""
+        if not indexes:
+            return None, []
+        ordered = list(reversed(indexes))
+        regex = re.compile('|'.join(f"({self.rules[i]['regex']})" for i in ordered), re.DOTALL)
+        return regex, [None] + [(i, self.rules[i]['negate']) for i in ordered]
+
+    def ignored(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        """Check whether an entry is ignored. 'rel_path' is '/' separated and relative to the scan root."""
+        if self.ignore_hidden and name.startswith('.'):
+            return True
+
+        best, negate = -2, False
+        if os.path.splitext(name)[1] in self.extensions:
+            best = -1
+
+        for table in ((self.names, self.dir_names) if is_dir else (self.names,)):
+            hit = table.get(name)
+            if hit is not None and hit[0] > best:
+                best, negate = hit
+
+        regex, group_rules = (self.dir_regex, self.dir_group_rules) if is_dir else (self.file_regex, self.file_group_rules)
+        if regex is not None:
+            match = regex.fullmatch(rel_path)
+            if match is not None:
+                index, rule_negate = group_rules[match.lastindex]
+                if index > best:
+                    best, negate = index, rule_negate
+
+        return best > -2 and not negate
+
+    def child(self, rel_dir: str, abs_dir: str) -> 'IgnoreMatcher':
+        """Return the matcher for a directory, adding the rules of its .gitignore if there is one."""
+        if not self.use_gitignore:
+            return self
+        try:
+            with open(os.path.join(abs_dir, '.gitignore'), 'r', encoding='utf-8', errors='replace') as f:
+                lines = f.readlines()
+        except OSError:
+            return self
+
+        rules = [rule for rule in (parse_ignore_rule(line, rel_dir) for line in lines) if rule]
+        if not rules:
+            return self
+        return IgnoreMatcher(self.rules + rules, list(self.extensions), self.ignore_hidden, self.use_gitignore)
+
+def compile_ignore_patterns(ignore_patterns: Dict[str, Any]) -> IgnoreMatcher:
+    """Compile a loaded ignore file (JSON/TOML dict) into an IgnoreMatcher."""
+    lines = list(ignore_patterns.get("files", [])) + list(ignore_patterns.get("folders", []))
+    lines += ignore_patterns.get("patterns", [])
+    rules = [rule for rule in (parse_ignore_rule(line) for line in lines) if rule]
+    return IgnoreMatcher(
+        rules,
+        ignore_patterns.get("extensions", []),
+        ignore_patterns.get("ignore_hidden", False),
+        ignore_patterns.get("use_gitignore", False),
+    )
+
+def join_relative(rel_dir: str, name: str) -> str:
+    """Join a name onto a '/' separated path relative to the scan root."""
+    return f"{rel_dir}/{name}" if rel_dir else name
+
+def scan_single_directory(path: str, rel_dir: str,
+                          matcher: IgnoreMatcher) -> Tuple[List[str], List[str], List[Tuple[str, str]], IgnoreMatcher]:
+    """
+    List one directory with os.scandir.
+    Returns (dirs, files, subdirs_to_descend, matcher), using the DirEntry cached
+    type information so no extra stat calls are made. Symlinked directories are
+    listed but not descended into, matching os.walk's default behaviour.
+    """
+    matcher = matcher.child(rel_dir, path)
+    dirs = []
+    files = []
+    descend = []
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            rel_path = join_relative(rel_dir, entry.name)
+            if matcher.ignored(rel_path, entry.name, is_dir):
+                continue
+
+            if is_dir:
+                dirs.append(entry.name)
+                try:
+                    if not entry.is_symlink():
+                        descend.append((entry.path, rel_path))
+                except OSError:
+                    pass
+            else:
+                files.append(entry.name)
+    return dirs, files, descend, matcher
+
+def iter_directory_parallel(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE,
+                            workers: int = DEFAULT_WORKERS, verbose: bool = False) -> Iterator[Tuple[str, Dict[str, list]]]:
+    """
+    Scan a directory tree by fanning subdirectories out to a bounded thread pool.
+    Yields (root, {'dirs', 'files'}) in the same top-down order as os.walk, each
+    directory as soon as it and every directory before it have been listed.
+    """
+    listings = {}
+    failed = set()
+    stack = [directory]
+    matcher = compile_ignore_patterns(ignore_patterns)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(scan_single_directory, directory, '', matcher): directory}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                try:
+                    dirs, files, descend, matcher = future.result()
+                except OSError:
+                    # Unreadable directories are skipped, like os.walk does
+                    failed.add(root)
+                    continue
+
+                if verbose:
+                    print(f"Processing directory: {root}")
+
+                listings[root] = ({'dirs': dirs, 'files': files}, [subdir for subdir, _ in descend])
+                for subdir, rel_dir in descend:
+                    pending[executor.submit(scan_single_directory, subdir, rel_dir, matcher)] = subdir
+
+            # Hand out everything that is ready in os.walk order
+            while stack and (stack[-1] in listings or stack[-1] in failed):
+                root = stack.pop()
+                if root in failed:
+                    failed.discard(root)
+                    continue
+                listing, subdirs = listings.pop(root)
+                stack.extend(reversed(subdirs))
+                yield root, listing
+
+def scan_directory_parallel(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE,
+                            workers: int = DEFAULT_WORKERS, verbose: bool = False) -> Dict[str, Dict[str, list]]:
+    """
+    Scan a directory tree by fanning subdirectories out to a bounded thread pool.
+    The result has the same shape and key order as the os.walk based scan.
+    """
+    return dict(iter_directory_parallel(directory, ignore_patterns, workers, verbose))
+
+def order_listings(directory: str, listings: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Rebuild the top-down os.walk ordering from per-directory results so output
+    is deterministic no matter in which order the directories were scanned.
+    """
+    ordered = {}
+    stack = [directory]
+    while stack:
+        root = stack.pop()
+        if root not in listings:
+            continue
+        listing = listings.pop(root)
+        ordered[root] = listing
+        stack.extend(os.path.join(root, d) for d in reversed(listing['dirs']))
+    return ordered
+
+def manifest_path_for(output_file: str) -> str:
+    """Location of the incremental scan manifest stored next to the output JSON."""
+    return output_file + MANIFEST_SUFFIX
+
+def ignore_fingerprint(ignore_patterns: Dict[str, Any]) -> str:
+    """Hash of the ignore settings; a manifest built with different settings cannot be reused."""
+    return hashlib.sha1(json.dumps(ignore_patterns, sort_keys=True).encode('utf-8')).hexdigest()
+
+def load_manifest(filename: str, directory: str, ignore_patterns: Dict[str, Any]) -> Dict[str, Any]:
+    """Load a previous scan manifest, or return an empty one if it is missing or stale."""
+    empty = {'dirs': {}}
+    if not os.path.exists(filename):
+        return empty
+    try:
+        with open(filename, 'r') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read manifest '{filename}': {e}. Doing a full scan.")
+        return empty
+
+    if (manifest.get('version') != MANIFEST_VERSION or manifest.get('root') != directory
+            or manifest.get('ignore') != ignore_fingerprint(ignore_patterns)):
+        print("Manifest does not match this scan. Doing a full scan.")
+        return empty
+    return manifest
+
+def save_manifest(filename: str, directory: str, ignore_patterns: Dict[str, Any], records: Dict[str, Any]) -> None:
+    """Write the manifest for the next incremental scan."""
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'root': directory,
+        'ignore': ignore_fingerprint(ignore_patterns),
+        'dirs': records,
+    }
+    with open(filename, 'w') as f:
+        json.dump(manifest, f)
+
+def gitignore_mtime(path: str, matcher: IgnoreMatcher) -> Optional[int]:
+    """mtime of a directory's .gitignore when .gitignore files are in use."""
+    if not matcher.use_gitignore:
+        return None
+    try:
+        return os.stat(os.path.join(path, '.gitignore')).st_mtime_ns
+    except OSError:
+        return None
+
+def rescan_single_directory(path: str, rel_dir: str, matcher: IgnoreMatcher,
+                            old: Optional[Dict[str, Any]], force: bool):
+    """
+    Bring one directory's manifest record up to date.
+    The directory is only re-listed when its mtime, inode or .gitignore changed;
+    otherwise the previous listing is reused and only the known files are stat'ed.
+    Returns (record, descend, matcher, relisted, changes, force_children).
+    """
+    st = os.stat(path)
+    gi_mtime = gitignore_mtime(path, matcher)
+    matcher = matcher.child(rel_dir, path)
+    changes = {'added': [], 'removed': [], 'modified': []}
+    old_files = old['files'] if old else {}
+
+    unchanged = (old is not None and not force and old['mtime_ns'] == st.st_mtime_ns
+                 and old['ino'] == st.st_ino and old.get('gitignore') == gi_mtime)
+    force_children = force or (old is not None and old.get('gitignore') != gi_mtime)
+
+    files = {}
+    if unchanged:
+        dirs = old['dirs']
+        symlinks = old['symlinks']
+        for name, (size, mtime_ns) in old_files.items():
+            try:
+                fst = os.stat(os.path.join(path, name))
+            except OSError:
+                changes['removed'].append(name)
+                continue
+            files[name] = [fst.st_size, fst.st_mtime_ns]
+            if fst.st_size != size or fst.st_mtime_ns != mtime_ns:
+                changes['modified'].append(name)
+    else:
+        dirs = []
+        symlinks = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if matcher.ignored(join_relative(rel_dir, entry.name), entry.name, is_dir):
+                    continue
+                if is_dir:
+                    dirs.append(entry.name)
+                    try:
+                        if entry.is_symlink():
+                            symlinks.append(entry.name)
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    fst = entry.stat()
+                except OSError:
+                    continue
+                files[entry.name] = [fst.st_size, fst.st_mtime_ns]
+                previous = old_files.get(entry.name)
+                if previous is None:
+                    changes['added'].append(entry.name)
+                elif previous != files[entry.name]:
+                    changes['modified'].append(entry.name)
+        changes['removed'] = [name for name in old_files if name not in files]
+
+    record = {
+        'mtime_ns': st.st_mtime_ns,
+        'ino': st.st_ino,
+        'gitignore': gi_mtime,
+        'dirs': dirs,
+        'symlinks': symlinks,
+        'files': files,
+    }
+    descend = [(os.path.join(path, d), join_relative(rel_dir, d)) for d in dirs if d not in symlinks]
+    return record, descend, matcher, not unchanged, changes, force_children
+
+def incremental_scan(directory: str, ignore_patterns: Dict[str, Any], manifest: Dict[str, Any],
+                     workers: int = DEFAULT_WORKERS, verbose: bool = False,
+                     matcher: Optional[IgnoreMatcher] = None):
+    """
+    Rescan a tree against a previous manifest.
+    Returns (directory_dict, records, changes, relisted) where changes holds the
+    added, removed and modified file paths and relisted counts re-listed directories.
+    A matcher already compiled from ignore_patterns can be passed in to reuse it.
+    """
+    old_records = manifest.get('dirs', {})
+    records = {}
+    changes = {'added': [], 'removed': [], 'modified': []}
+    relisted = 0
+    matcher = matcher or compile_ignore_patterns(ignore_patterns)
+
+    def submit(executor, path, rel_dir, matcher, force):
+        return executor.submit(rescan_single_directory, path, rel_dir, matcher, old_records.get(path), force)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {submit(executor, directory, '', matcher, False): directory}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root = pending.pop(future)
+                try:
+                    record, descend, child_matcher, was_relisted, dir_changes, force = future.result()
+                except OSError:
+                    continue
+
+                if verbose and was_relisted:
+                    print(f"Processing directory: {root}")
+
+                relisted += was_relisted
+                records[root] = record
+                for kind, names in dir_changes.items():
+                    changes[kind].extend(os.path.join(root, name) for name in names)
+                for subdir, rel_dir in descend:
+                    pending[submit(executor, subdir, rel_dir, child_matcher, force)] = subdir
+
+    # Directories that disappeared take their files with them
+    for root, record in old_records.items():
+        if root not in records:
+            changes['removed'].extend(os.path.join(root, name) for name in record['files'])
+
+    records = order_listings(directory, records)
+    directory_dict = {root: {'dirs': r['dirs'], 'files': list(r['files'])} for root, r in records.items()}
+    for kind in changes:
+        changes[kind].sort()
+    return directory_dict, records, changes, relisted
+
+def iter_directory_lookup_table(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE,
+                                workers: int = 1, verbose: bool = True) -> Iterator[Tuple[str, Dict[str, list]]]:
+    """Yield (root, {'dirs', 'files'}) for each directory as it is scanned, in os.walk order."""
+    if workers > 1:
+        yield from iter_directory_parallel(directory, ignore_patterns, workers, verbose)
+        return
+
+    levels = {directory: ('', compile_ignore_patterns(ignore_patterns))}
     for root, dirs, files in os.walk(directory):
-        print(f"Processing directory: {root}")
+        if verbose:
+            print(f"Processing directory: {root}")
+
+        rel_dir, matcher = levels.pop(root)
+        matcher = matcher.child(rel_dir, root)
 
         # Filter out hidden files/folders and ignored patterns
-        dirs[:] = [d for d in dirs if not should_ignore(d, ignore_patterns)]
-        files = [f for f in files if not should_ignore(f, ignore_patterns)]
+        dirs[:] = [d for d in dirs if not matcher.ignored(join_relative(rel_dir, d), d, True)]
+        files = [f for f in files if not matcher.ignored(join_relative(rel_dir, f), f, False)]
+        for d in dirs:
+            levels[os.path.join(root, d)] = (join_relative(rel_dir, d), matcher)
         
-        directory_dict[root] = {'dirs': dirs, 'files': files}
-    return directory_dict
+        yield root, {'dirs': dirs, 'files': files}
+
+def path_ignored(matcher: IgnoreMatcher, rel_path: str, is_dir: bool, dir_cache: Dict[str, bool]) -> bool:
+    """
+    Check a '/' separated path and every directory above it, the way a scan that
+    reached it would. Results for directories are kept in dir_cache.
+    """
+    if is_dir and rel_path in dir_cache:
+        return dir_cache[rel_path]
+    parent, _, name = rel_path.rpartition('/')
+    ignored = (bool(parent) and path_ignored(matcher, parent, True, dir_cache)) or matcher.ignored(rel_path, name, is_dir)
+    if is_dir:
+        dir_cache[rel_path] = ignored
+    return ignored
+
+def iter_git_lookup_table(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE,
+                          changed_since: Optional[str] = None, untracked: bool = True,
+                          verbose: bool = True) -> Iterator[Tuple[str, Dict[str, list]]]:
+    """
+    Yield the same (root, {'dirs', 'files'}) pairs as a scan, listed from the git index
+    instead of the filesystem. .gitignore is applied by git; the ignore patterns are
+    applied on top. With changed_since, only files that differ from that commit are
+    listed. Raises GitError if the directory is not a git checkout.
+    """
+    paths = git_file_list(directory, changed_since, untracked)
+    matcher = compile_ignore_patterns(ignore_patterns)
+    dir_cache = {}
+    paths = [path for path in paths if not path_ignored(matcher, path, False, dir_cache)]
+    for root, listing in group_by_directory(directory, paths):
+        if verbose:
+            print(f"Processing directory: {root}")
+        yield root, listing
+
+def create_directory_lookup_table(directory: str, ignore_patterns: Dict[str, Any] = DEFAULT_IGNORE,
+                                  workers: int = 1, verbose: bool = True) -> Dict[str, Dict[str, list]]:
+    """Create a lookup table of directories and their contents."""
+    return dict(iter_directory_lookup_table(directory, ignore_patterns, workers, verbose))
+
+def detect_scan_format(filename: Optional[str]) -> str:
+    """Pick the scan output format from the file extension: 'ndjson' for .ndjson/.jsonl, else 'json'."""
+    if filename and os.path.splitext(filename)[1].lower() in NDJSON_EXTENSIONS:
+        return 'ndjson'
+    return 'json'
+
+def iter_dir_items(dir_data) -> Iterable[Tuple[str, Dict[str, list]]]:
+    """Iterate a scan given either as the legacy dictionary or as a stream of (root, listing) pairs."""
+    return dir_data.items() if isinstance(dir_data, dict) else dir_data
+
+def write_ndjson(entries: Iterable[Tuple[str, Dict[str, list]]], out: TextIO,
+                 with_stats: bool = False, flush: bool = False) -> int:
+    """
+    Write a scan as line-delimited JSON: one {"dir", "dirs"} record per directory
+    followed by one {"file"} record per file it contains, optionally with size and mtime.
+    Records are written as directories are scanned, so a reader on the other end
+    of a pipe can start straight away. Returns the number of files written.
+    """
+    count = 0
+    for root, listing in entries:
+        out.write(json.dumps({'dir': root, 'dirs': listing['dirs']}) + '\n')
+        for name in listing['files']:
+            record = {'file': name}
+            if with_stats:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                    record['size'] = st.st_size
+                    record['mtime'] = st.st_mtime
+                except OSError:
+                    pass
+            out.write(json.dumps(record) + '\n')
+            count += 1
+        if flush:
+            out.flush()
+    return count
+
+def iter_ndjson(lines: Iterable[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Parse line-delimited scan records lazily, yielding (root, listing) per directory.
+    When records carry sizes, listing['stats'] maps file names to [size, mtime].
+    """
+    root = None
+    listing = None
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid scan record on line {number}: {e}")
+
+        if isinstance(record, dict) and isinstance(record.get('dir'), str):
+            if root is not None:
+                yield root, listing
+            dirs = record.get('dirs', [])
+            if not isinstance(dirs, list):
+                raise ValueError(f"Invalid 'dirs' in scan record on line {number}")
+            root = record['dir']
+            listing = {'dirs': dirs, 'files': []}
+        elif isinstance(record, dict) and isinstance(record.get('file'), str) and root is not None:
+            listing['files'].append(record['file'])
+            if 'size' in record:
+                listing.setdefault('stats', {})[record['file']] = [record['size'], record.get('mtime')]
+        else:
+            raise ValueError(f"Unexpected scan record on line {number}")
+    if root is not None:
+        yield root, listing
+
+def _iter_ndjson_stream(stream: TextIO, first_line: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    try:
+        yield from iter_ndjson(itertools.chain([first_line], stream))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+def load_scan(filename: str):
+    """
+    Open the output of dir_scanner.py, in either format ('-' reads stdin).
+    Legacy JSON is returned as a dictionary; NDJSON is returned as a lazy
+    iterator of (root, listing) pairs so processing can start before the scan ends.
+    """
+    stream = sys.stdin if filename == '-' else open(filename, 'r')
+    first_line = stream.readline()
+    try:
+        record = json.loads(first_line)
+    except json.JSONDecodeError:
+        record = None
+    if isinstance(record, dict) and isinstance(record.get('dir'), str):
+        return _iter_ndjson_stream(stream, first_line)
+
+    try:
+        return json.loads(first_line + stream.read())
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
 def main():
-    if not (2 <= len(sys.argv) <= 4):
-        print("Usage: python script.py <directory_path> [output_file] [ignore_patterns_file]")
-        return
+    parser = argparse.ArgumentParser(description='Scan a directory into a JSON lookup table.')
+    parser.add_argument('directory', help='Directory to scan')
+    parser.add_argument('output_file', nargs='?', help="Output file, '-' for stdout (optional)")
+    parser.add_argument('ignore_file', nargs='?', help='Ignore patterns file, JSON or TOML (optional)')
+    parser.add_argument('-w', '--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Number of scanner threads, 1 uses a plain os.walk (default: {DEFAULT_WORKERS})')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print each directory as it is scanned')
+    parser.add_argument('-g', '--gitignore', action='store_true', help='Also honour .gitignore files found while scanning')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                      help='Only re-list directories changed since the last run, using a manifest next to the output file')
+    parser.add_argument('-f', '--format', choices=SCAN_FORMATS,
+                      help='Output format (default: ndjson for .ndjson/.jsonl files, json otherwise)')
+    parser.add_argument('--stat', action='store_true', help='Include file size and mtime in NDJSON records')
+    parser.add_argument('-s', '--source', choices=SCAN_SOURCES, default='walk',
+                      help='List files by walking the directory or from the git index (default: walk)')
+    parser.add_argument('--changed-since', metavar='REF',
+                      help='Only list files changed since a git commit, branch or tag (implies --source git)')
+    parser.add_argument('--tracked-only', action='store_true',
+                      help='With --source git, leave out untracked files that are not ignored')
+    add_metrics_arguments(parser, verbose=False, slowest=False)
 
-    dir = sys.argv[1]
+    args = parser.parse_args()
+    if args.tracked_only and args.source != 'git' and not args.changed_since:
+        parser.error("--tracked-only only applies to --source git or --changed-since")
+
+    dir = args.directory
     if not os.path.isdir(dir):
         print(f"{dir} is not a directory.")
         return
@@ -118,24 +772,98 @@ def main():
     ignore_patterns = DEFAULT_IGNORE.copy()
 
     # Check if ignore patterns file is provided
-    if len(sys.argv) >= 4:
-        ignore_file = sys.argv[3]
-        ignore_patterns = load_ignore_file(ignore_file)
+    if args.ignore_file:
+        ignore_patterns = load_ignore_file(args.ignore_file)
+
+    if args.gitignore:
+        ignore_patterns = dict(ignore_patterns, use_gitignore=True)
 
-    dir_dict = create_directory_lookup_table(dir, ignore_patterns)
+    output_file = None if args.output_file == '-' else args.output_file
+    scan_format = args.format or detect_scan_format(output_file)
+    # Progress goes to stderr whenever the scan itself goes to stdout
+    metrics = metrics_from_args(args, sys.stdout if output_file else sys.stderr)
 
-    # Handle output
-    if len(sys.argv) >= 3:  
-        output_file = sys.argv[2]
+    use_git = args.source == 'git' or bool(args.changed_since)
+    if use_git and args.incremental:
+        print("Error: --incremental cannot be combined with --source git or --changed-since.")
+        sys.exit(1)
+    if use_git:
+        try:
+            # git reports everything at once, so the listing is complete before it is written
+            with metrics.timer('scan'):
+                dir_dict = dict(iter_git_lookup_table(dir, ignore_patterns, args.changed_since,
+                                                      not args.tracked_only, args.verbose))
+        except GitError as e:
+            if args.changed_since:
+                print(f"Error: {e}")
+                sys.exit(1)
+            print(f"Warning: {e}. Walking the directory instead.")
+            with metrics.timer('scan'):
+                dir_dict = create_directory_lookup_table(dir, ignore_patterns, args.workers, args.verbose)
+    elif args.incremental:
+        if not output_file:
+            print("Error: --incremental requires an output file to store the manifest next to.")
+            sys.exit(1)
+        manifest_file = manifest_path_for(output_file)
+        manifest = load_manifest(manifest_file, dir, ignore_patterns)
+        with metrics.timer('scan'):
+            dir_dict, records, changes, relisted = incremental_scan(
+                dir, ignore_patterns, manifest, args.workers, args.verbose
+            )
+        if args.verbose:
+            for kind in ('added', 'removed', 'modified'):
+                for path in changes[kind]:
+                    print(f"{kind.capitalize()}: {path}")
+        metrics.count('relisted_dirs', relisted)
+        metrics.info(f"Re-listed {relisted:,} of {len(records):,} directories: "
+                     f"{len(changes['added']):,} added, {len(changes['removed']):,} removed, "
+                     f"{len(changes['modified']):,} modified")
+        try:
+            save_manifest(manifest_file, dir, ignore_patterns, records)
+        except Exception as e:
+            print(f"Warning: Could not write manifest '{manifest_file}': {e}")
+    elif scan_format == 'ndjson':
+        # Stream records out while the scan is still running
+        dir_dict = timed_iter(iter_directory_lookup_table(dir, ignore_patterns, args.workers, args.verbose),
+                              metrics, 'scan')
+    else:
+        with metrics.timer('scan'):
+            dir_dict = create_directory_lookup_table(dir, ignore_patterns, args.workers, args.verbose)
+
+    def counted(items):
+        for root, listing in items:
+            metrics.count('dirs')
+            metrics.count('files', len(listing['files']))
+            yield root, listing
+
+    # Handle output; for NDJSON the write time includes the streamed scan, which is subtracted after
+    write_start = time.perf_counter()
+    if scan_format == 'ndjson' and not output_file:
+        # Keep progress messages out of the record stream
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            write_ndjson(counted(iter_dir_items(dir_dict)), out, args.stat, flush=True)
+    elif output_file:
         try:
             with open(output_file, 'w') as f:
-                json.dump(dir_dict, f, indent=4)
-            print(f"Successfully wrote directory structure to {output_file}")
+                if scan_format == 'ndjson':
+                    write_ndjson(counted(iter_dir_items(dir_dict)), f, args.stat)
+                else:
+                    for _ in counted(iter_dir_items(dir_dict)):
+                        pass
+                    json.dump(dir_dict, f, indent=4)
+            metrics.info(f"Successfully wrote directory structure to {output_file}")
         except Exception as e:
             print(f"Error writing to {output_file}: {e}")
             sys.exit(1)
     else:  
+        for _ in counted(iter_dir_items(dir_dict)):
+            pass
         print(json.dumps(dir_dict, indent=4))
+    streamed_scan = metrics.seconds('scan') if scan_format == 'ndjson' and not (args.incremental or use_git) else 0.0
+    metrics.add_time('write', time.perf_counter() - write_start - streamed_scan)
+
+    finish_metrics(metrics, args.metrics_json)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,170 @@
+# file_selection.py
+# ---
+# picks the subset of scanned files that fits a token budget
+# each file gets a priority weight (by path pattern, extension, depth and recency)
+# and files are chosen to maximize the total weight that fits, using a greedy knapsack approximation
+
+import os
+import re
+import sys
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dir_scanner import glob_to_regex
+
+# Rough size of a token for source code and prose, used before exact counts exist
+BYTES_PER_TOKEN = 4
+
+DEFAULT_WEIGHTS = {
+    # Multiplier per file extension; anything not listed uses 'default_extension_weight'
+    "extensions": {},
+    "default_extension_weight": 1.0,
+    # Gitignore-style path patterns relative to the scanned root; the last match wins
+    "paths": {},
+    # Multiplier applied once per directory level below the root
+    "depth_decay": 1.0,
+    # Files changed recently get up to (1 + recency_boost) times their weight,
+    # halving every recency_half_life_days
+    "recency_boost": 0.0,
+    "recency_half_life_days": 30.0,
+}
+
+def load_weights_file(filename: str, log=sys.stdout) -> Dict[str, Any]:
+    """Load priority weights from a JSON file, filling in defaults for missing keys."""
+    with open(filename, 'r') as f:
+        weights = json.load(f)
+    if not isinstance(weights, dict):
+        raise ValueError("weights file must contain a JSON object")
+    unknown = set(weights) - set(DEFAULT_WEIGHTS)
+    if unknown:
+        print(f"Warning: Unknown keys in weights file: {', '.join(sorted(unknown))}", file=log)
+    weights = {**DEFAULT_WEIGHTS, **weights}
+    half_life = weights["recency_half_life_days"]
+    if isinstance(half_life, bool) or not isinstance(half_life, (int, float)) or half_life <= 0:
+        raise ValueError(f"recency_half_life_days must be a positive number of days, got {half_life!r}")
+    return weights
+
+def compile_path_weights(paths: Dict[str, float]) -> List[Tuple[re.Pattern, float]]:
+    """Compile gitignore-style path patterns into (regex, weight) pairs."""
+    compiled = []
+    for pattern, weight in paths.items():
+        anchored = '/' in pattern.rstrip('/')
+        body = glob_to_regex(pattern.strip('/'))
+        prefix = '' if anchored else '(?:.*/)?'
+        # A pattern naming a directory also covers everything below it
+        compiled.append((re.compile(f"{prefix}{body}(?:/.*)?", re.DOTALL), float(weight)))
+    return compiled
+
+def file_weight(rel_path: str, mtime: float, weights: Dict[str, Any],
+                path_weights: List[Tuple[re.Pattern, float]], now: float) -> float:
+    """Priority of one file; higher is more important, 0 excludes it."""
+    ext = os.path.splitext(rel_path)[1].lower()
+    weight = weights["extensions"].get(ext, weights["default_extension_weight"])
+
+    for regex, path_weight in reversed(path_weights):
+        if regex.fullmatch(rel_path):
+            weight *= path_weight
+            break
+
+    depth = rel_path.count('/')
+    weight *= weights["depth_decay"] ** depth
+
+    if weights["recency_boost"]:
+        age_days = max(0.0, now - mtime) / 86400.0
+        weight *= 1.0 + weights["recency_boost"] * 0.5 ** (age_days / weights["recency_half_life_days"])
+    return weight
+
+def estimate_tokens(path: str, size: int) -> int:
+    """Token estimate from the file size alone."""
+    return max(1, -(-size // BYTES_PER_TOKEN))
+
+def collect_candidates(dir_data: dict, weights: Dict[str, Any],
+                       estimate: Callable[[str, int], int] = estimate_tokens) -> List[Dict[str, Any]]:
+    """Stat every file in the scan and compute its estimated tokens and priority weight."""
+    if not dir_data:
+        return []
+    parent_dir = next(iter(dir_data.keys()))
+    path_weights = compile_path_weights(weights["paths"])
+    now = time.time()
+    candidates = []
+    for base_dir, content in dir_data.items():
+        for filename in content["files"]:
+            full_path = os.path.join(base_dir, filename)
+            try:
+                st = os.stat(full_path)
+            except OSError:
+                continue
+            rel_path = os.path.relpath(full_path, parent_dir).replace(os.sep, '/')
+            candidates.append({
+                'base_dir': base_dir,
+                'file': filename,
+                'path': full_path,
+                'tokens': estimate(full_path, st.st_size),
+                'weight': file_weight(rel_path, st.st_mtime, weights, path_weights, now),
+            })
+    return candidates
+
+def select_candidates(candidates: List[Dict[str, Any]], budget: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Greedy 0/1 knapsack: take files in order of weight per token, skipping any
+    that no longer fit, then compare against the single most valuable file that
+    fits on its own, topped up the same way (which bounds the result at half the
+    optimum or better).
+    Runs in O(n log n). Returns (selected, dropped).
+    """
+    eligible = [c for c in candidates if c['weight'] > 0 and c['tokens'] <= budget]
+    ordered = sorted(eligible, key=lambda c: (-c['weight'] / c['tokens'], c['tokens']))
+
+    selected_ids = set()
+    used = 0
+    value = 0.0
+    for c in ordered:
+        if used + c['tokens'] <= budget:
+            selected_ids.add(id(c))
+            used += c['tokens']
+            value += c['weight']
+
+    if eligible:
+        best = max(eligible, key=lambda c: c['weight'])
+        if best['weight'] > value:
+            # Start from the heavy file instead and fill the remaining space greedily
+            selected_ids = {id(best)}
+            used = best['tokens']
+            for c in ordered:
+                if c is not best and used + c['tokens'] <= budget:
+                    selected_ids.add(id(c))
+                    used += c['tokens']
+
+    selected = [c for c in candidates if id(c) in selected_ids]
+    dropped = [c for c in candidates if id(c) not in selected_ids]
+    return selected, dropped
+
+def apply_selection(dir_data: dict, selected: List[Dict[str, Any]]) -> dict:
+    """Rebuild the scan dictionary keeping only the selected files."""
+    keep = {(c['base_dir'], c['file']) for c in selected}
+    return {
+        base_dir: {'dirs': content['dirs'], 'files': [f for f in content['files'] if (base_dir, f) in keep]}
+        for base_dir, content in dir_data.items()
+    }
+
+def report_selection(selected: List[Dict[str, Any]], dropped: List[Dict[str, Any]], budget: int,
+                     show: int = 20, log=sys.stdout) -> None:
+    """Print what fits and the largest files that were left out."""
+    used = sum(c['tokens'] for c in selected)
+    dropped_tokens = sum(c['tokens'] for c in dropped)
+    print(f"\nSelected {len(selected):,} files (~{used:,} of {budget:,} tokens); "
+          f"dropped {len(dropped):,} files (~{dropped_tokens:,} tokens)", file=log)
+    for c in sorted(dropped, key=lambda c: -c['tokens'])[:show]:
+        print(f"- dropped {c['path']} (~{c['tokens']:,} tokens, weight {c['weight']:.2f})", file=log)
+    if len(dropped) > show:
+        print(f"- ... and {len(dropped) - show:,} more", file=log)
+
+def select_within_budget(dir_data: dict, budget: int, weights: Optional[Dict[str, Any]] = None,
+                         estimate: Callable[[str, int], int] = estimate_tokens, log=sys.stdout) -> dict:
+    """Return a copy of the scan dictionary trimmed to the most valuable files within budget."""
+    weights = weights or DEFAULT_WEIGHTS
+    candidates = collect_candidates(dir_data, weights, estimate)
+    selected, dropped = select_candidates(candidates, budget)
+    report_selection(selected, dropped, budget, log=log)
+    return apply_selection(dir_data, selected)
@@ -0,0 +1,153 @@
+# file_sniffer.py
+# ---
+# classifies files from their size and first few KB before they are read,
+# so binaries and huge data files are skipped (or truncated) without being loaded
+# limits come from the ignore file, see limits_from_ignore
+
+import os
+import re
+import codecs
+from typing import Any, Dict, Optional, Tuple
+
+# Bytes read from the start of a file to decide whether it is text
+SNIFF_SIZE = 8192
+
+DEFAULT_LIMITS = {
+    # Files larger than this are skipped or truncated; None means no limit
+    "max_file_size": None,
+    # What to do with files over max_file_size: 'skip' or 'truncate'
+    "oversize_action": "skip",
+    # Skip files that look binary (NUL bytes or many control bytes in the first block)
+    "skip_binary": True,
+}
+
+OVERSIZE_ACTIONS = ('skip', 'truncate')
+
+# Bytes that are rare in text of any encoding; a first block with more than
+# MAX_CONTROL_RATIO of them is binary
+CONTROL_BYTES = bytes(sorted(set(range(32)) - set(b'\t\n\r\f\v\x1b'))) + b'\x7f'
+MAX_CONTROL_RATIO = 0.1
+
+# Longest first, since the UTF-32 LE mark starts with the UTF-16 LE one
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+SIZE_UNITS = {'': 1, 'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2, 'G': 1024 ** 3, 'GB': 1024 ** 3}
+
+TRUNCATION_NOTE = "\n[... truncated: showing the first {:,} of {:,} bytes ...]\n"
+
+class SkippedFile(ValueError):
+    """Raised instead of reading a file that is binary or too large. 'kind' is 'binary' or 'oversize'."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+def parse_size(value: Any) -> Optional[int]:
+    """Byte count from an integer or a string such as '512KB' or '5 MB'."""
+    if value is None:
+        return None
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    if isinstance(value, str):
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?B?)\s*", value.upper())
+        if match:
+            return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+    raise ValueError(f"invalid file size: {value!r}")
+
+def limits_from_ignore(ignore_patterns: Dict[str, Any]) -> Dict[str, Any]:
+    """Read the pre-read limits from an ignore file's settings, filling in defaults."""
+    limits = {key: ignore_patterns.get(key, default) for key, default in DEFAULT_LIMITS.items()}
+    limits["max_file_size"] = parse_size(limits["max_file_size"])
+    if limits["oversize_action"] not in OVERSIZE_ACTIONS:
+        raise ValueError(f"'oversize_action' must be one of {', '.join(OVERSIZE_ACTIONS)}")
+    if not isinstance(limits["skip_binary"], bool):
+        raise ValueError("'skip_binary' must be true or false")
+    return limits
+
+def sniff_encoding(head: bytes) -> Optional[str]:
+    """
+    Encoding of a file from its first block, or None if it looks binary. Text that
+    is not valid UTF-8 (latin-1, say) is still text; it is read as UTF-8 with
+    replacement characters.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    if b"\0" in head:
+        return None
+    controls = len(head) - len(head.translate(None, CONTROL_BYTES))
+    if controls > MAX_CONTROL_RATIO * len(head):
+        return None
+    return 'utf-8'
+
+def classify_file(path: str, limits: Optional[Dict[str, Any]] = None, size: Optional[int] = None,
+                  sniff: bool = True) -> Tuple[str, Optional[str], int]:
+    """
+    Decide how to handle a file without reading all of it.
+    Returns (kind, encoding, size) where kind is 'text', 'truncate', 'binary' or 'oversize'.
+    Oversized files that will be skipped are not opened at all. With sniff=False the
+    contents are not inspected, and oversized files are always skipped.
+    """
+    limits = limits or DEFAULT_LIMITS
+    if size is None:
+        size = os.stat(path).st_size
+    max_size = limits["max_file_size"]
+    oversize = max_size is not None and size > max_size
+    if oversize and (limits["oversize_action"] == 'skip' or not sniff):
+        return 'oversize', None, size
+    if not sniff:
+        return 'text', None, size
+
+    with open(path, "rb") as f:
+        head = f.read(SNIFF_SIZE)
+    encoding = sniff_encoding(head)
+    if encoding is None:
+        return 'binary', None, size
+    return ('truncate' if oversize else 'text'), encoding, size
+
+def read_classified(path: str, kind: str, encoding: Optional[str], size: int,
+                    limits: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Read a file that classify_file accepted. Truncated files keep their first
+    max_file_size bytes and end with a note saying so. Bytes that do not decode
+    become replacement characters.
+    """
+    limits = limits or DEFAULT_LIMITS
+    if kind == 'truncate':
+        max_size = limits["max_file_size"]
+        with open(path, "rb") as f:
+            raw = f.read(max_size)
+        # Drop a character cut in half at the limit, and normalize newlines like text mode does
+        content = codecs.getincrementaldecoder(encoding)(errors='replace').decode(raw, final=False)
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return content + TRUNCATION_NOTE.format(max_size, size)
+
+    with open(path, "r", encoding=encoding or 'utf-8', errors='replace') as f:
+        return f.read()
+
+def read_text_file(path: str, limits: Optional[Dict[str, Any]] = None) -> Tuple[str, bool, int]:
+    """
+    Classify and read a file as text. Returns (content, truncated, size in bytes).
+    Raises SkippedFile for binary and oversized files the limits exclude.
+    """
+    limits = limits or DEFAULT_LIMITS
+    kind, encoding, size = classify_file(path, limits)
+    if kind == 'oversize':
+        raise SkippedFile(kind, f"file is larger than max_file_size ({size:,} bytes)")
+    if kind == 'binary' and limits["skip_binary"]:
+        raise SkippedFile(kind, "file appears to be binary")
+    return read_classified(path, kind, encoding, size, limits), kind == 'truncate', size
+
+def skip_summary(skipped: Dict[str, int]) -> Optional[str]:
+    """One line describing files that were skipped or truncated, or None if there were none."""
+    labels = [('binary', "binary"), ('oversize', "oversized"), ('truncate', "truncated")]
+    parts = [f"{skipped[key]:,} {label}" for key, label in labels if skipped.get(key)]
+    if not parts:
+        return None
+    return f"Files skipped or truncated before reading: {', '.join(parts)}"
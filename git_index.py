@@ -0,0 +1,113 @@
+# git_index.py
+# ---
+# lists the files of a git checkout from the index instead of walking the tree.
+# git already knows which files are tracked and which untracked ones .gitignore
+# excludes, so ignored build output is never visited. also lists only the files
+# changed since a commit, so a bundle can scale with the size of a diff.
+
+import os
+import subprocess
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Mode of a submodule entry in the index; its path is a directory, not a file
+GITLINK_MODE = '160000'
+
+class GitError(RuntimeError):
+    """A git command failed, or the directory is not inside a git checkout."""
+
+def run_git(directory: str, args: List[str]) -> bytes:
+    """Run a git command in 'directory' and return its output."""
+    try:
+        result = subprocess.run(['git', '-C', directory] + args, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, check=False)
+    except OSError as e:
+        raise GitError(f"could not run git: {e}")
+    if result.returncode != 0:
+        message = result.stderr.decode('utf-8', errors='replace').strip()
+        raise GitError(message or f"git {args[0]} exited with status {result.returncode}")
+    return result.stdout
+
+def split_nul(output: bytes) -> List[str]:
+    """Paths from the -z output of a git command."""
+    return [os.fsdecode(path) for path in output.split(b'\0') if path]
+
+def is_git_checkout(directory: str) -> bool:
+    """Check whether 'directory' is inside a git working tree."""
+    try:
+        return run_git(directory, ['rev-parse', '--is-inside-work-tree']).strip() == b'true'
+    except GitError:
+        return False
+
+def list_untracked_files(directory: str) -> List[str]:
+    """Untracked files that .gitignore does not exclude, relative to 'directory'."""
+    return split_nul(run_git(directory, ['ls-files', '-z', '--others', '--exclude-standard']))
+
+def list_index_files(directory: str, untracked: bool = True) -> List[str]:
+    """
+    Files under 'directory' as git sees them, relative to it and '/' separated.
+    Tracked files come from the index, leaving out submodules and files deleted
+    from the working tree. With 'untracked', files that are not ignored are added too.
+    """
+    paths = set()
+    for line in run_git(directory, ['ls-files', '-z', '--stage']).split(b'\0'):
+        if not line:
+            continue
+        # "<mode> <object> <stage>\t<path>"; conflicted files appear once per stage
+        info, _, path = line.partition(b'\t')
+        if info.split(b' ', 1)[0].decode() != GITLINK_MODE:
+            paths.add(os.fsdecode(path))
+    paths.difference_update(split_nul(run_git(directory, ['ls-files', '-z', '--deleted'])))
+    if untracked:
+        paths.update(list_untracked_files(directory))
+    return sorted(paths)
+
+def list_changed_files(directory: str, ref: str, untracked: bool = True) -> List[str]:
+    """
+    Files under 'directory' that differ from commit 'ref', staged or not, relative
+    to it. Deleted files are left out. With 'untracked', new files that have not
+    been added yet count as changed too.
+    """
+    try:
+        run_git(directory, ['rev-parse', '--verify', '--quiet', f"{ref}^{{commit}}"])
+    except GitError:
+        raise GitError(f"unknown commit: {ref}")
+    paths = set(split_nul(run_git(directory, ['diff', '--name-only', '--relative', '-z',
+                                              '--diff-filter=d', ref, '--'])))
+    if untracked:
+        paths.update(list_untracked_files(directory))
+    return sorted(paths)
+
+def group_by_directory(directory: str, paths: Iterable[str]) -> Iterator[Tuple[str, Dict[str, list]]]:
+    """
+    Turn '/' separated relative file paths into (root, {'dirs', 'files'}) pairs,
+    top-down like os.walk, with the directory itself first. Only directories that
+    lead to one of the files are listed.
+    """
+    files = defaultdict(list)
+    dirs = defaultdict(set)
+    for path in paths:
+        parent, _, name = path.rpartition('/')
+        files[parent].append(name)
+        while parent:
+            above, _, child = parent.rpartition('/')
+            if child in dirs[above]:
+                break
+            dirs[above].add(child)
+            parent = above
+
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        subdirs = sorted(dirs.get(rel_dir, ()))
+        root = os.path.join(directory, *rel_dir.split('/')) if rel_dir else directory
+        yield root, {'dirs': subdirs, 'files': sorted(files.get(rel_dir, []))}
+        stack.extend(f"{rel_dir}/{d}" if rel_dir else d for d in reversed(subdirs))
+
+def git_file_list(directory: str, changed_since: Optional[str] = None, untracked: bool = True) -> List[str]:
+    """The index listing, or only the files changed since a commit when one is given."""
+    if not is_git_checkout(directory):
+        raise GitError(f"{directory} is not inside a git checkout")
+    if changed_since:
+        return list_changed_files(directory, changed_since, untracked)
+    return list_index_files(directory, untracked)
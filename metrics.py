@@ -0,0 +1,162 @@
+# metrics.py
+# ---
+# instrumentation shared by the tools: per-stage timers (scan, read, tokenize, write),
+# file and byte counters, the slowest files, and leveled progress output
+# per-file lines are only printed at the verbose level; --metrics-json writes everything as JSON
+
+import sys
+import json
+import time
+import heapq
+import threading
+import contextlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+QUIET = 0
+NORMAL = 1
+VERBOSE = 2
+
+DEFAULT_SLOWEST = 10
+
+class Metrics:
+    """
+    Collects timings and counters for one run and prints progress at a given level.
+    QUIET prints nothing but warnings and errors, NORMAL adds summaries, and VERBOSE
+    adds a line per file or directory. Safe to update from worker threads.
+    Stage times add up the time spent in a stage on every thread, so stages that
+    run in parallel can exceed the wall time.
+    """
+
+    def __init__(self, level: int = NORMAL, log=sys.stdout, slowest: int = DEFAULT_SLOWEST):
+        self.level = level
+        self.log = log
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.slowest_limit = slowest
+        # Min-heap of (seconds, path), so the fastest of the kept files is dropped first
+        self.slowest = []
+        self.lock = threading.Lock()
+
+    def detail(self, message: str) -> None:
+        """Per-file or per-directory progress, shown only at the verbose level."""
+        if self.level >= VERBOSE:
+            print(message, file=self.log)
+
+    def info(self, message: str) -> None:
+        """Progress and summaries, hidden in quiet mode."""
+        if self.level >= NORMAL:
+            print(message, file=self.log)
+
+    @contextlib.contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Time a block of work as part of a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1) -> None:
+        with self.lock:
+            entry = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += calls
+
+    def seconds(self, stage: str) -> float:
+        """Time recorded for a stage so far."""
+        with self.lock:
+            return self.stages.get(stage, {}).get('seconds', 0.0)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_file(self, path: str, seconds: float) -> None:
+        """Remember how long one file took, keeping only the slowest few."""
+        if self.slowest_limit <= 0:
+            return
+        with self.lock:
+            if len(self.slowest) < self.slowest_limit:
+                heapq.heappush(self.slowest, (seconds, path))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, path))
+
+    def slowest_files(self) -> List[Dict[str, Any]]:
+        with self.lock:
+            ranked = sorted(self.slowest, reverse=True)
+        return [{'path': path, 'seconds': round(seconds, 6)} for seconds, path in ranked]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Everything collected so far, ready to be written as JSON."""
+        wall = time.perf_counter() - self.started
+        with self.lock:
+            stages = {name: {'seconds': round(entry['seconds'], 6), 'calls': entry['calls']}
+                      for name, entry in self.stages.items()}
+            counters = dict(self.counters)
+        result = {
+            'wall_seconds': round(wall, 6),
+            'stages': stages,
+            'counters': counters,
+            'slowest_files': self.slowest_files(),
+        }
+        if wall > 0 and counters.get('files'):
+            result['files_per_sec'] = round(counters['files'] / wall, 1)
+        if wall > 0 and counters.get('bytes'):
+            result['bytes_per_sec'] = round(counters['bytes'] / wall)
+        return result
+
+    def report(self) -> None:
+        """Print the stage timings, counters and slowest files."""
+        if self.level < NORMAL:
+            return
+        data = self.as_dict()
+        parts = [f"{name} {entry['seconds']:.2f}s" for name, entry in data['stages'].items()]
+        print(f"\nTime: {data['wall_seconds']:.2f}s wall" + (f" ({', '.join(parts)})" if parts else ""), file=self.log)
+        if data['counters']:
+            counted = ", ".join(f"{name.replace('_', ' ')} {value:,}" for name, value in sorted(data['counters'].items()))
+            print(f"Counts: {counted}", file=self.log)
+        if data['slowest_files'] and self.level >= VERBOSE:
+            print("Slowest files:", file=self.log)
+            for entry in data['slowest_files']:
+                print(f"- {entry['path']}: {entry['seconds'] * 1000:.1f} ms", file=self.log)
+
+    def write_json(self, filename: str) -> None:
+        with open(filename, 'w') as f:
+            json.dump(self.as_dict(), f, indent=4)
+
+def timed_iter(iterable: Iterable[Any], metrics: Metrics, stage: str) -> Iterator[Any]:
+    """Pass items through, adding the time spent producing each one to 'stage'."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            metrics.add_time(stage, time.perf_counter() - start, calls=0)
+            return
+        metrics.add_time(stage, time.perf_counter() - start)
+        yield item
+
+def add_metrics_arguments(parser, verbose: bool = True, slowest: bool = True) -> None:
+    """Add --quiet/--verbose, --slowest and --metrics-json to a tool's argument parser."""
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print warnings and errors')
+    if verbose:
+        parser.add_argument('-v', '--verbose', action='store_true', help='Print a line for every file')
+    if slowest:
+        parser.add_argument('--slowest', type=int, default=DEFAULT_SLOWEST, metavar='N',
+                            help=f'Number of slowest files to keep in the metrics (default: {DEFAULT_SLOWEST})')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Write stage timings and counters as JSON to FILE')
+
+def metrics_from_args(args, log=sys.stdout) -> Metrics:
+    level = QUIET if args.quiet else VERBOSE if getattr(args, 'verbose', False) else NORMAL
+    return Metrics(level, log, getattr(args, 'slowest', DEFAULT_SLOWEST))
+
+def finish_metrics(metrics: Metrics, filename: Optional[str] = None) -> None:
+    """Print the summary and write the JSON file if one was asked for."""
+    metrics.report()
+    if filename:
+        try:
+            metrics.write_json(filename)
+        except OSError as e:
+            print(f"Warning: Could not write metrics to '{filename}': {e}", file=metrics.log)
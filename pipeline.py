@@ -0,0 +1,254 @@
+# pipeline.py
+# ---
+# runs dir_scanner.py -> single_file_concat.py / claude_concat.py in one process
+# the scan is streamed straight into the bundling stage as (root, listing) pairs,
+# so there is no JSON round trip and no second pass over the filesystem metadata.
+# a scan file (legacy JSON or NDJSON) can still be used as input or saved as output.
+#
+# library use:
+#   from pipeline import scan_entries, bundle_to_file
+#   bundle_to_file(scan_entries("./my_project", ignore_file="ignore.json"), "combined.txt")
+
+import os
+import sys
+import json
+import shutil
+import argparse
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import dir_scanner
+import claude_concat
+import single_file_concat
+from token_cache import TokenCache, open_token_cache
+from file_sniffer import limits_from_ignore
+from git_index import GitError
+from archive_writer import ArchiveWriter, archive_format
+from metrics import Metrics, add_metrics_arguments, finish_metrics, metrics_from_args, timed_iter
+from file_selection import DEFAULT_WEIGHTS, load_weights_file, select_within_budget
+from batch_counter import DEFAULT_WORKERS
+
+Entries = Iterable[Tuple[str, Dict[str, Any]]]
+
+def scan_entries(directory: str, ignore_patterns: Optional[Dict[str, Any]] = None,
+                 ignore_file: Optional[str] = None, gitignore: bool = False,
+                 workers: int = dir_scanner.DEFAULT_WORKERS, verbose: bool = False,
+                 file_source: str = 'walk', changed_since: Optional[str] = None, untracked: bool = True,
+                 log=sys.stdout) -> Entries:
+    """
+    Scan a directory, yielding (root, listing) pairs as directories are listed.
+    With file_source='git' the files come from the git index instead (falling back to a
+    walk outside a checkout), and with changed_since only files changed since that
+    commit are listed, which raises GitError if it cannot be done.
+    """
+    if ignore_patterns is None:
+        ignore_patterns = dir_scanner.load_ignore_file(ignore_file, log) if ignore_file else dir_scanner.DEFAULT_IGNORE.copy()
+    if gitignore:
+        ignore_patterns = dict(ignore_patterns, use_gitignore=True)
+    if file_source == 'git' or changed_since:
+        try:
+            # Listed up front so git errors surface here rather than half way through bundling
+            return list(dir_scanner.iter_git_lookup_table(directory, ignore_patterns, changed_since, untracked, verbose))
+        except GitError as e:
+            if changed_since:
+                raise
+            print(f"Warning: {e}. Walking the directory instead.", file=log)
+    return dir_scanner.iter_directory_lookup_table(directory, ignore_patterns, workers, verbose)
+
+def open_entries(source: str, **scan_options) -> Entries:
+    """Scan 'source' if it is a directory, otherwise read it as a saved scan file (JSON or NDJSON)."""
+    if os.path.isdir(source):
+        return scan_entries(source, **scan_options)
+    dir_data = dir_scanner.load_scan(source)
+    if isinstance(dir_data, dict) and not claude_concat.validate_json(dir_data):
+        raise ValueError(f"{source} is not a valid scan file")
+    return dir_data
+
+def save_scan(entries: Entries, filename: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Pass entries through unchanged while saving them as a scan file.
+    NDJSON files are written as entries go by; legacy JSON is written once the scan is complete.
+    """
+    if dir_scanner.detect_scan_format(filename) == 'ndjson':
+        with open(filename, 'w') as f:
+            for root, listing in dir_scanner.iter_dir_items(entries):
+                dir_scanner.write_ndjson([(root, listing)], f)
+                yield root, listing
+        return
+
+    collected = {}
+    for root, listing in dir_scanner.iter_dir_items(entries):
+        collected[root] = {'dirs': listing['dirs'], 'files': listing['files']}
+        yield root, listing
+    with open(filename, 'w') as f:
+        json.dump(collected, f, indent=4)
+
+def select_entries(entries: Entries, budget: int, weights: Optional[Dict[str, Any]] = None,
+                   estimate=single_file_concat.estimate_framed_tokens, log=sys.stdout) -> dict:
+    """Keep only the most valuable files that fit in the token budget (needs the whole scan)."""
+    return select_within_budget(dict(dir_scanner.iter_dir_items(entries)), budget, weights, estimate, log=log)
+
+def bundle_to_file(entries: Entries, output_file: Optional[str] = None, count_tokens: bool = False,
+                   token_cache: Optional[TokenCache] = None, workers: int = DEFAULT_WORKERS,
+                   use_processes: bool = False, max_tokens_per_shard: Optional[int] = None,
+                   log=sys.stdout, limits: Optional[Dict[str, Any]] = None,
+                   metrics: Optional[Metrics] = None, dedup: bool = False) -> Optional[List[Tuple[str, int, int]]]:
+    """
+    Write entries as a single START/END-framed bundle (stdout when output_file is None),
+    or as token-budgeted part files when max_tokens_per_shard is given.
+    'limits' come from limits_from_ignore and control binary and oversized files.
+    With dedup, repeated file contents are written once and referenced after that.
+    """
+    if max_tokens_per_shard is not None:
+        return single_file_concat.write_sharded_dir_data(entries, output_file, max_tokens_per_shard, log,
+                                                         token_cache, workers, limits, metrics, dedup)
+    if output_file is None:
+        single_file_concat.write_concat_dir_data(entries, sys.stdout, count_tokens, log, token_cache,
+                                                 workers, use_processes, limits, metrics, dedup)
+        return None
+    with open(output_file, 'w', buffering=single_file_concat.WRITE_BUFFER_SIZE) as out:
+        single_file_concat.write_concat_dir_data(entries, out, count_tokens, log, token_cache,
+                                                 workers, use_processes, limits, metrics, dedup)
+    return None
+
+def bundle_to_directory(entries: Entries, output_dir: str, count_tokens: bool = False,
+                        tokenizer: str = 'anthropic', model_name: str = "claude-3-5-sonnet-latest",
+                        token_cache: Optional[TokenCache] = None, sync: bool = False,
+                        copy_mode: str = 'copy', compression: str = 'auto', **options) -> Tuple[List[str], List[str]]:
+    """
+    Flatten entries into output_dir the way claude_concat.py does, optionally syncing in place.
+    An output_dir ending in .zip, .tar or .tar.gz is written as a single archive instead.
+    """
+    archive_type = archive_format(output_dir)
+    if archive_type is not None:
+        if sync:
+            raise ValueError("sync mode cannot be used with archive output")
+        os.makedirs(os.path.dirname(os.path.abspath(output_dir)), exist_ok=True)
+        with ArchiveWriter(output_dir, archive_type, compression) as archive:
+            return claude_concat.concat_dir_data(
+                entries, output_dir, count_tokens, tokenizer, model_name,
+                token_cache=token_cache, archive=archive, **options
+            )
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = claude_concat.sync_manifest_path(output_dir)
+    sync_manifest = claude_concat.load_sync_manifest(manifest_file) if sync else None
+
+    result = claude_concat.concat_dir_data(
+        entries, output_dir, count_tokens, tokenizer, model_name,
+        sync_manifest=sync_manifest, copy_mode=copy_mode, token_cache=token_cache, **options
+    )
+    if sync_manifest is not None:
+        claude_concat.save_sync_manifest(manifest_file, sync_manifest)
+    return result
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('source', help='Directory to scan, or a saved scan file (JSON or NDJSON)')
+    parser.add_argument('-i', '--ignore', metavar='FILE', help='Ignore patterns file, JSON or TOML')
+    parser.add_argument('-g', '--gitignore', action='store_true', help='Also honour .gitignore files found while scanning')
+    parser.add_argument('--scan-workers', type=int, default=dir_scanner.DEFAULT_WORKERS,
+                        help=f'Number of scanner threads (default: {dir_scanner.DEFAULT_WORKERS})')
+    parser.add_argument('--source', dest='file_source', choices=dir_scanner.SCAN_SOURCES, default='walk',
+                        help='List files by walking the directory or from the git index (default: walk)')
+    parser.add_argument('--changed-since', metavar='REF',
+                        help='Only bundle files changed since a git commit, branch or tag')
+    parser.add_argument('--tracked-only', action='store_true', help='With the git index, leave out untracked files')
+    parser.add_argument('--save-scan', metavar='FILE', help='Also save the scan (.json for legacy JSON, .ndjson for NDJSON)')
+    parser.add_argument('-y', '--yes', action='store_true', help='Skip confirmation prompts')
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='Scan a directory and bundle it for an AI assistant in one step.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    # The bundling options come from the tools themselves, so both entry points stay in step
+    single = subparsers.add_parser('single', help='Concatenate into one file, like single_file_concat.py')
+    add_common_arguments(single)
+    single.add_argument('output_file', nargs='?', help="Output file ('-' or none for stdout)")
+    single_file_concat.add_concat_arguments(single)
+    add_metrics_arguments(single)
+
+    claude = subparsers.add_parser('claude', help='Flatten into a folder, like claude_concat.py')
+    add_common_arguments(claude)
+    claude.add_argument('output_dir', help='Output directory for processed files, or a .zip, .tar or .tar.gz archive')
+    claude_concat.add_flatten_arguments(claude)
+    add_metrics_arguments(claude)
+    return parser
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+    if args.command == 'single' and args.output_file == '-':
+        args.output_file = None
+    output = args.output_file if args.command == 'single' else args.output_dir
+    log = sys.stdout if output else sys.stderr
+    metrics = metrics_from_args(args, log)
+
+    if args.command == 'single' and args.max_tokens_per_shard is not None and not args.output_file:
+        parser.error("--max-tokens-per-shard requires an output file")
+    if args.tracked_only and args.file_source != 'git' and not args.changed_since:
+        parser.error("--tracked-only only applies to --source git or --changed-since")
+    if (args.file_source == 'git' or args.changed_since) and not os.path.isdir(args.source):
+        parser.error("--source git and --changed-since need a directory to list")
+
+    if output and os.path.exists(output) and not args.yes and not getattr(args, 'sync', False):
+        if args.source == '-':
+            # The answer would be read from the piped scan
+            parser.error(f"output '{output}' already exists; pass -y to overwrite it when the scan comes from stdin")
+        confirm = input(f"Output '{output}' already exists. Overwrite? (y/N): ")
+        if confirm.lower() != 'y':
+            print("Operation cancelled.")
+            sys.exit(0)
+    if args.command == 'claude' and os.path.isdir(output) and not args.sync:
+        shutil.rmtree(output)
+
+    ignore_patterns = dir_scanner.load_ignore_file(args.ignore, log) if args.ignore else dir_scanner.DEFAULT_IGNORE.copy()
+    limits = limits_from_ignore(ignore_patterns)
+    try:
+        entries = open_entries(args.source, ignore_patterns=ignore_patterns, gitignore=args.gitignore,
+                               workers=args.scan_workers, file_source=args.file_source,
+                               changed_since=args.changed_since, untracked=not args.tracked_only, log=log)
+    except (OSError, ValueError, GitError) as e:
+        print(f"Error reading {args.source}: {e}", file=log)
+        sys.exit(1)
+    # The scan runs lazily as the bundling stage pulls directories from it
+    entries = timed_iter(entries, metrics, 'scan')
+
+    if args.save_scan:
+        entries = save_scan(entries, args.save_scan)
+
+    if args.token_budget is not None:
+        try:
+            weights = load_weights_file(args.weights, log) if args.weights else DEFAULT_WEIGHTS
+        except Exception as e:
+            print(f"Error reading weights file {args.weights}: {e}", file=log)
+            sys.exit(1)
+        estimate = (single_file_concat.estimate_framed_tokens if args.command == 'single'
+                    else claude_concat.estimate_file_tokens)
+        entries = select_entries(entries, args.token_budget, weights, estimate, log=log)
+
+    counting = args.count_tokens or getattr(args, 'max_tokens_per_shard', None) is not None
+    token_cache = open_token_cache(counting and not args.no_token_cache, args.token_cache, log)
+    try:
+        if args.command == 'single':
+            bundle_to_file(entries, args.output_file, args.count_tokens, token_cache, args.workers,
+                           args.processes, max_tokens_per_shard=args.max_tokens_per_shard, log=log,
+                           limits=limits, metrics=metrics, dedup=args.dedup)
+            if args.output_file:
+                metrics.info("\nSuccessfully wrote to file.")
+        else:
+            bundle_to_directory(entries, args.output_dir, args.count_tokens, args.tokenizer, args.model,
+                                token_cache, sync=args.sync, copy_mode=args.copy_mode,
+                                compression=args.compression, workers=args.workers,
+                                use_processes=args.processes, api_concurrency=args.api_concurrency,
+                                api_rpm=args.api_rpm, limits=claude_concat.folder_limits(ignore_patterns),
+                                metrics=metrics, dedup=args.dedup)
+    except (RuntimeError, ValueError) as e:
+        print(f"Error: {e}", file=log)
+        sys.exit(1)
+    finally:
+        if token_cache is not None:
+            token_cache.close()
+
+    finish_metrics(metrics, args.metrics_json)
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,21 @@
 # and concatenates all the files in the directory into one file
 
 import sys
-import json
 import os
+import shutil
 import argparse
-from typing import Optional, Tuple
+import time
+import tempfile
+import contextlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from token_cache import TokenCache, content_digest, count_with_cache, open_token_cache
+from batch_counter import BatchTokenCounter, DEFAULT_WORKERS, count_texts, read_ahead
+from dir_scanner import iter_dir_items, load_ignore_file, load_scan
+from file_sniffer import SkippedFile, limits_from_ignore, read_text_file, skip_summary
+from metrics import VERBOSE, Metrics, add_metrics_arguments, finish_metrics, metrics_from_args
+from file_selection import DEFAULT_WEIGHTS, estimate_tokens, load_weights_file, select_within_budget
+from dedup import DuplicateFinder, mark_duplicates, report_duplicates, tokens_saved
 
 FILE_HEADER = """
 --- {} START ---
@@ -15,27 +26,49 @@ FILE_FOOTER = """
 --- {} END ---
 """
 
-def setup_tiktoken_counter(count_tokens: bool) -> Tuple[bool, Optional[object]]:
-    """Initialize tiktoken counter if enabled."""
+PART_HEADER = """
+--- {} START (part {}) ---
+"""
+
+PART_FOOTER = """
+--- {} END (part {}) ---
+"""
+
+# Written in place of a file whose content already appears earlier in the bundle
+DUPLICATE_NOTE = "[same content as {} above]"
+
+SHARD_INDEX_HEADER = """--- SHARD {} INDEX ---
+"""
+
+SHARD_INDEX_FOOTER = """--- SHARD {} INDEX END ---
+"""
+
+# Buffer size used when streaming the bundle to disk
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+TIKTOKEN_MODEL = "gpt-4o"
+
+def setup_tiktoken_counter(count_tokens: bool, log=sys.stdout) -> Tuple[bool, Optional[object]]:
+    """Initialize tiktoken counter if enabled, reporting to 'log'."""
     if not count_tokens:
         return False, None
     
     try:
         import tiktoken
-        model_name = "gpt-4o"
+        model_name = TIKTOKEN_MODEL
         encoder = tiktoken.encoding_for_model(model_name)
-        print(f"Using tiktoken tokenizer with {model_name} encoder")
+        print(f"Using tiktoken tokenizer with {model_name} encoder", file=log)
         return True, encoder
     except ImportError:
-        print("Warning: Token counting requested but tiktoken package not installed.")
-        print("Install with: pip install tiktoken")
+        print("Warning: Token counting requested but tiktoken package not installed.", file=log)
+        print("Install with: pip install tiktoken", file=log)
         return False, None
     except Exception as e:
-        print(f"Warning: Token counting initialization failed: {e}")
-        print("Token counting will be disabled.")
+        print(f"Warning: Token counting initialization failed: {e}", file=log)
+        print("Token counting will be disabled.", file=log)
         return False, None
 
-def validate_json(dir_data):
+def validate_json(dir_data, log=sys.stdout):
     # check if json file was made using format that dir_scanner.py uses
     # format:
     # is a dictionary with each key being the directory path (ex: C:\Users\... on windows, /Users/... on linux, etc.)
@@ -43,29 +76,29 @@ def validate_json(dir_data):
     # and "files" is a list of files inside the base directory. 
 
     if not isinstance(dir_data, dict):
-        print("Error: Invalid JSON format. Expected a dictionary.")
+        print("Error: Invalid JSON format. Expected a dictionary.", file=log)
         return False
     
     for k, v in dir_data.items():
         if not os.path.isdir(k):
-            print(f"Error: Invalid directory path: {k}")
+            print(f"Error: Invalid directory path: {k}", file=log)
             return False
 
         if not isinstance(v, dict):
-            print(f"Error: Invalid JSON format for directory: {k}")
+            print(f"Error: Invalid JSON format for directory: {k}", file=log)
             return False
         
         if not isinstance(v["dirs"], list):
-            print(f"Error: Invalid JSON format for directory: {k}")
+            print(f"Error: Invalid JSON format for directory: {k}", file=log)
             return False
         
         if not isinstance(v["files"], list):
-            print(f"Error: Invalid JSON format for directory: {k}")
+            print(f"Error: Invalid JSON format for directory: {k}", file=log)
             return False
     
     return True
 
-def count_file_tokens(encoder, content: str) -> Optional[int]:
+def count_file_tokens(encoder, content: str, log=sys.stdout) -> Optional[int]:
     """Count tokens in file content if token counting is enabled."""
     if not encoder:
         return None
@@ -74,91 +107,528 @@ def count_file_tokens(encoder, content: str) -> Optional[int]:
         num_tokens = len(encoder.encode(content))
         return num_tokens
     except Exception as e:
-        print(f"Warning: Token counting failed: {e}")
+        print(f"Warning: Token counting failed: {e}", file=log)
         return None
 
-def concat_dir_data(dir_data, token_counting_enabled=False):
-    concat_data = ""
+def read_source_file(filepath: str, limits: Optional[Dict[str, Any]] = None) -> Tuple[str, bool, int]:
+    """
+    Read one source file as text. Returns (content, truncated, size in bytes).
+    Binary and oversized files are detected from their size and first block
+    and raise SkippedFile instead of being loaded.
+    """
+    return read_text_file(filepath, limits)
+
+def timed_reader(limits: Optional[Dict[str, Any]], metrics: Metrics) -> Callable[[str], Tuple[str, bool, int]]:
+    """read_source_file, adding each read to the 'read' stage and the slowest files."""
+    def read(filepath: str) -> Tuple[str, bool, int]:
+        start = time.perf_counter()
+        try:
+            return read_source_file(filepath, limits)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.add_time('read', elapsed)
+            metrics.record_file(filepath, elapsed)
+    return read
+
+def unless_duplicate(read: Callable[[str], Any]) -> Callable[[Tuple[str, Optional[str]]], Any]:
+    """Reader for (path, original) items from mark_duplicates that skips reading duplicates."""
+    def read_item(item: Tuple[str, Optional[str]]) -> Any:
+        filepath, original = item
+        return None if original is not None else read(filepath)
+    return read_item
+
+def report_read_error(filepath: str, error: Exception, skipped: Dict[str, int], metrics: Metrics) -> None:
+    """Print why a file was left out of the bundle."""
+    if isinstance(error, SkippedFile):
+        skipped[error.kind] = skipped.get(error.kind, 0) + 1
+        metrics.count(f"skipped_{error.kind}")
+        metrics.detail(f"Skipping {filepath}: {error}")
+        return
+    metrics.count('errors')
+    print(f"Error: {error}", file=metrics.log)
+    print(f"skipping file {filepath}", file=metrics.log)
+
+def frame_file(filepath: str, content: str) -> str:
+    """Wrap a file's content in its START/END markers."""
+    return (
+        f"{FILE_HEADER.format(filepath)}\n"
+        f"{content}\n"
+        f"{FILE_FOOTER.format(filepath)}\n"
+    )
+
+def estimate_framed_tokens(path: str, size: int) -> int:
+    """Token estimate used for budget selection, including the START/END markers."""
+    return estimate_tokens(path, size + len(FILE_HEADER) + len(FILE_FOOTER) + 2 * len(path) + 3)
+
+def iter_concat_dir_data(dir_data, token_counting_enabled=False, log=sys.stdout,
+                         token_cache: Optional[TokenCache] = None,
+                         workers: int = DEFAULT_WORKERS, use_processes: bool = False,
+                         limits: Optional[Dict[str, Any]] = None,
+                         metrics: Optional[Metrics] = None, dedup: bool = False) -> Iterator[str]:
+    """
+    Yield the START/END-framed content of each file one at a time.
+    Only a few files are held in memory at any point, so callers can stream
+    the bundle straight to disk instead of building it up as one string.
+    Files are read ahead on I/O threads and tokens are counted in batches on
+    'workers' threads (or processes) while the bundle is being written.
+    Token counts are looked up in token_cache first when one is given.
+    'limits' (see file_sniffer.py) decides which binary or oversized files are
+    skipped or truncated before they are read.
+    Per-file lines are printed only when metrics is at the verbose level; without
+    metrics every file is reported, as before.
+    With dedup, a file whose content matches an earlier one is not read again and
+    is written as a short reference to that file instead.
+    """
+    metrics = metrics or Metrics(VERBOSE, log)
     total_tokens = 0
+    skipped = {}
+    finder = DuplicateFinder() if dedup else None
+    duplicates = []
+    failed = {}
+    token_counts = {}
     
     # Initialize token counting if enabled
-    token_counting_enabled, encoder = setup_tiktoken_counter(token_counting_enabled)
-    
-    for k, v in dir_data.items():
-        for f in v["files"]:
-            filepath = os.path.join(k, f)
-            print(f"\nProcessing: {filepath}")
+    token_counting_enabled, encoder = setup_tiktoken_counter(token_counting_enabled, log)
+    batch_counter = BatchTokenCounter(encoder, workers, use_processes, metrics=metrics, log=log) if token_counting_enabled else None
 
-            try:
-                # Read file content
-                with open(filepath, "r") as f:
-                    file_content = f.read()
-                    
-                    # Format the complete content including headers and footers
-                    formatted_content = (
-                        f"{FILE_HEADER.format(filepath)}\n"
-                        f"{file_content}\n"
-                        f"{FILE_FOOTER.format(filepath)}\n"
-                    )
-                    
-                    # Add to concatenated data
-                    concat_data += formatted_content
-                    
-                    # Count tokens if enabled for the complete formatted content
-                    if token_counting_enabled:
-                        try:
-                            token_count = count_file_tokens(encoder, formatted_content)
-                            if token_count is not None:
-                                total_tokens += token_count
-                                print(f"Tokens: {token_count:,}")
-                        except Exception as e:
-                            print(f"Warning: Token counting failed for {filepath}: {e}")
-                            
-            except Exception as e:
-                print(f"Error: {e}")
-                print(f"skipping file {filepath}")
-                pass
+    def record_counts(results):
+        nonlocal total_tokens
+        for (filepath, digest), token_count in results:
+            if token_count is None:
+                continue
+            total_tokens += token_count
+            metrics.detail(f"Tokens ({filepath}): {token_count:,}")
+            if finder is not None:
+                token_counts[filepath] = token_count
+            if token_cache is not None:
+                token_cache.put('tiktoken', TIKTOKEN_MODEL, digest, token_count)
+
+    paths = (os.path.join(k, f) for k, v in iter_dir_items(dir_data) for f in v["files"])
+    try:
+        for (filepath, original), result, error in read_ahead(mark_duplicates(paths, finder, metrics),
+                                                             unless_duplicate(timed_reader(limits, metrics))):
+            metrics.detail(f"\nProcessing: {filepath}")
+            if original in failed:
+                # Same bytes as a file that was left out, so it is left out for the same reason
+                error = failed[original]
+                finder.discard(filepath)
+            if error is not None:
+                failed[filepath] = error
+                report_read_error(filepath, error, skipped, metrics)
+                continue
+
+            if original is not None:
+                metrics.detail(f"Same content as {original}; writing a reference")
+                duplicates.append((filepath, original))
+                formatted_content = frame_file(filepath, DUPLICATE_NOTE.format(original))
+            else:
+                file_content, truncated, size = result
+                metrics.count('files')
+                metrics.count('bytes', size)
+                if truncated:
+                    skipped['truncate'] = skipped.get('truncate', 0) + 1
+                    metrics.detail("Warning: File exceeds max_file_size and was truncated")
+
+                # Format the complete content including headers and footers
+                formatted_content = frame_file(filepath, file_content)
+                del file_content
+            
+            # Count tokens if enabled for the complete formatted content
+            if batch_counter is not None:
+                digest = content_digest(formatted_content) if token_cache is not None else None
+                token_count = token_cache.get('tiktoken', TIKTOKEN_MODEL, digest) if token_cache is not None else None
+                if token_count is not None:
+                    total_tokens += token_count
+                    metrics.detail(f"Tokens: {token_count:,}")
+                    if finder is not None:
+                        token_counts[filepath] = token_count
+                else:
+                    record_counts(batch_counter.add((filepath, digest), formatted_content))
+
+            yield formatted_content
+
+        if batch_counter is not None:
+            record_counts(batch_counter.finish())
+            batch_counter = None
+    finally:
+        if batch_counter is not None:
+            batch_counter.close()
+
+    summary = skip_summary(skipped)
+    if summary:
+        metrics.info(f"\n{summary}")
+    report_duplicates(finder, metrics, tokens_saved(duplicates, token_counts))
     
     if token_counting_enabled and total_tokens > 0:
-        print(f"\nTotal tokens processed: {total_tokens:,}")
+        metrics.count('tokens', total_tokens)
+        metrics.info(f"\nTotal tokens processed: {total_tokens:,}")
         
         if total_tokens > 80000:
-            print("\nWARNING: Total tokens exceed 80,000. This may be too large for some models.")
-    
-    return concat_data
+            print("\nWARNING: Total tokens exceed 80,000. This may be too large for some models.", file=log)
+
+    if token_counting_enabled and token_cache is not None:
+        metrics.info(token_cache.summary())
+
+def write_concat_dir_data(dir_data, out: TextIO, token_counting_enabled=False, log=sys.stdout,
+                          token_cache: Optional[TokenCache] = None,
+                          workers: int = DEFAULT_WORKERS, use_processes: bool = False,
+                          limits: Optional[Dict[str, Any]] = None,
+                          metrics: Optional[Metrics] = None, dedup: bool = False) -> int:
+    """Stream the concatenated files into an open text stream. Returns the number of files written."""
+    metrics = metrics or Metrics(VERBOSE, log)
+    written = 0
+    for chunk in iter_concat_dir_data(dir_data, token_counting_enabled, log, token_cache, workers, use_processes,
+                                      limits, metrics, dedup):
+        with metrics.timer('write'):
+            out.write(chunk)
+        written += 1
+    with metrics.timer('write'):
+        out.flush()
+    return written
+
+def shard_path(output_file: str, index: int) -> str:
+    """Name of the numbered part file for a shard, e.g. combined.part001.txt."""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}.part{index:03d}{ext}"
+
+def split_to_budget(filepath: str, content: str, max_tokens: int,
+                    count: Callable[[str], int]) -> List[Tuple[str, int]]:
+    """
+    Split a file that is too large for one shard into framed parts of at most max_tokens.
+    Parts are cut at line boundaries, and overlong lines are cut by characters.
+    Returns (framed_part, tokens) pairs.
+    """
+    overhead = count(PART_HEADER.format(filepath, 0) + "\n\n" + PART_FOOTER.format(filepath, 0) + "\n")
+    budget = max(1, max_tokens - overhead)
+
+    pieces = []
+    for line in content.splitlines(keepends=True):
+        line_tokens = count(line)
+        while line_tokens > budget and len(line) > 1:
+            cut = max(1, len(line) * budget // line_tokens)
+            while cut > 1 and count(line[:cut]) > budget:
+                cut = max(1, cut * 9 // 10)
+            pieces.append((line[:cut], count(line[:cut])))
+            line = line[cut:]
+            line_tokens = count(line)
+        pieces.append((line, line_tokens))
+
+    chunks = []
+    current, current_tokens = [], 0
+    for piece, piece_tokens in pieces:
+        if current and current_tokens + piece_tokens > budget:
+            chunks.append("".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current or not chunks:
+        chunks.append("".join(current))
+
+    parts = []
+    for number, chunk in enumerate(chunks, 1):
+        label = f"{number}/{len(chunks)}"
+        framed = (
+            f"{PART_HEADER.format(filepath, label)}\n"
+            f"{chunk}\n"
+            f"{PART_FOOTER.format(filepath, label)}\n"
+        )
+        parts.append((framed, count(framed)))
+    return parts
+
+def index_line(label: str, tokens: int) -> str:
+    """A file's line in its shard index."""
+    return f"{label} ({tokens:,} tokens)\n"
+
+def split_for_shards(filepath: str, content: str, writer: 'ShardWriter',
+                     count: Callable[[str], int]) -> List[Tuple[str, str, int]]:
+    """
+    Split a file that does not fit in one shard so each part fits next to its own
+    index line. The part labels, index lines and shard numbers all grow with the
+    number of parts, so the split is checked against the real counts and repeated
+    with a smaller budget until every part fits.
+    Returns (label, framed_part, tokens) triples.
+    """
+    budget = (writer.max_tokens - writer.overhead(writer.index + 1)
+              - writer.index_tokens(f"{filepath} (part 1/1)", writer.max_tokens))
+    while True:
+        parts = split_to_budget(filepath, content, max(1, budget), count)
+        labelled = [(f"{filepath} (part {number}/{len(parts)})", part, tokens)
+                    for number, (part, tokens) in enumerate(parts, 1)]
+        largest = max(tokens + writer.index_tokens(label, tokens) for label, _, tokens in labelled)
+        excess = largest + writer.overhead(writer.index + len(parts)) - writer.max_tokens
+        if excess <= 0 or budget <= 1:
+            return labelled
+        budget -= excess
+
+class ShardWriter:
+    """
+    Streams framed files into numbered part files holding at most max_tokens each.
+    Each shard body is spooled to a temporary file so its index header, which lists
+    the files it contains, can be written first once the shard is complete.
+    """
+
+    def __init__(self, output_file: str, max_tokens: int, count: Callable[[str], int]):
+        self.output_file = output_file
+        self.max_tokens = max_tokens
+        self.count = count
+        self.index = 0
+        self.body = None
+        self.entries = []
+        self.tokens = 0
+        self.paths = []
+
+    def overhead(self, index: int) -> int:
+        """Tokens taken by the index header and footer of shard 'index'."""
+        return self.count(SHARD_INDEX_HEADER.format(index) + SHARD_INDEX_FOOTER.format(index))
+
+    def index_tokens(self, label: str, tokens: int) -> int:
+        """Tokens of the index line an entry will get."""
+        return self.count(index_line(label, tokens))
+
+    def fits_alone(self, label: str, tokens: int) -> bool:
+        """Whether an entry, with its own index line, fits in an otherwise empty shard."""
+        return tokens + self.index_tokens(label, tokens) + self.overhead(self.index + 1) <= self.max_tokens
+
+    def add(self, label: str, framed: str, tokens: int) -> None:
+        """Append one framed file (or file part), starting a new shard if it would not fit."""
+        line = index_line(label, tokens)
+        entry_tokens = tokens + self.count(line)
+        if self.body is not None and self.entries and self.tokens + entry_tokens > self.max_tokens:
+            self._close_shard()
+        if self.body is None:
+            self._open_shard()
+        self.body.write(framed)
+        self.entries.append(line)
+        self.tokens += entry_tokens
+
+    def close(self) -> List[str]:
+        """Finish the last shard and return the paths of all part files."""
+        if self.body is not None:
+            self._close_shard()
+        return self.paths
+
+    def _open_shard(self) -> None:
+        self.index += 1
+        directory = os.path.dirname(os.path.abspath(self.output_file))
+        self.body = tempfile.TemporaryFile('w+', dir=directory, buffering=WRITE_BUFFER_SIZE)
+        self.entries = []
+        self.tokens = self.overhead(self.index)
+
+    def _close_shard(self) -> None:
+        path = shard_path(self.output_file, self.index)
+        self.body.seek(0)
+        with open(path, 'w', buffering=WRITE_BUFFER_SIZE) as out:
+            out.write(SHARD_INDEX_HEADER.format(self.index))
+            out.writelines(self.entries)
+            out.write(SHARD_INDEX_FOOTER.format(self.index))
+            shutil.copyfileobj(self.body, out, WRITE_BUFFER_SIZE)
+        self.body.close()
+        self.body = None
+        self.paths.append((path, self.tokens, len(self.entries)))
+
+def write_sharded_dir_data(dir_data, output_file: str, max_tokens: int, log=sys.stdout,
+                           token_cache: Optional[TokenCache] = None,
+                           workers: int = DEFAULT_WORKERS,
+                           limits: Optional[Dict[str, Any]] = None,
+                           metrics: Optional[Metrics] = None, dedup: bool = False) -> List[Tuple[str, int, int]]:
+    """
+    Split the bundle into part files of at most max_tokens tokens each, in one streaming pass.
+    Files are read and counted ahead on 'workers' threads and assigned to shards in order;
+    a file is only split when it is larger than a whole shard.
+    With dedup, repeated content is written once and referenced after that, as in iter_concat_dir_data.
+    Returns (path, tokens, entries) for every part file written.
+    """
+    metrics = metrics or Metrics(VERBOSE, log)
+    enabled, encoder = setup_tiktoken_counter(True, log)
+    if not enabled:
+        raise RuntimeError("Sharding by token budget requires tiktoken.")
+
+    def count(text: str) -> int:
+        return count_texts(encoder, [text], log)[0] or 0
+
+    read = timed_reader(limits, metrics)
+
+    def read_and_count(item: Tuple[str, Optional[str]]) -> Tuple[str, int, bool, int]:
+        filepath, original = item
+        if original is not None:
+            content, truncated, size = DUPLICATE_NOTE.format(original), False, 0
+        else:
+            content, truncated, size = read(filepath)
+        framed = frame_file(filepath, content)
+        with metrics.timer('tokenize'):
+            tokens = count_with_cache(token_cache, 'tiktoken', TIKTOKEN_MODEL, framed, count) or 0
+        return framed, tokens, truncated, size
+
+    skipped = {}
+    finder = DuplicateFinder() if dedup else None
+    duplicates = []
+    failed = {}
+    token_counts = {}
+    writer = ShardWriter(output_file, max_tokens, count)
+    paths = (os.path.join(k, f) for k, v in iter_dir_items(dir_data) for f in v["files"])
+    for (filepath, original), result, error in read_ahead(mark_duplicates(paths, finder, metrics),
+                                                         read_and_count, workers):
+        metrics.detail(f"\nProcessing: {filepath}")
+        if original in failed:
+            error = failed[original]
+            finder.discard(filepath)
+        if error is not None:
+            failed[filepath] = error
+            report_read_error(filepath, error, skipped, metrics)
+            continue
+
+        framed, tokens, truncated, size = result
+        if original is not None:
+            metrics.detail(f"Same content as {original}; writing a reference")
+            duplicates.append((filepath, original))
+        else:
+            metrics.count('files')
+            metrics.count('bytes', size)
+        if finder is not None:
+            token_counts[filepath] = tokens
+        metrics.count('tokens', tokens)
+        if truncated:
+            skipped['truncate'] = skipped.get('truncate', 0) + 1
+            metrics.detail("Warning: File exceeds max_file_size and was truncated")
+        metrics.detail(f"Tokens: {tokens:,}")
+        with metrics.timer('tokenize'):
+            fits = writer.fits_alone(filepath, tokens)
+        if fits:
+            with metrics.timer('write'):
+                writer.add(filepath, framed, tokens)
+            continue
+
+        # Only files bigger than a whole shard are split
+        content = framed[len(FILE_HEADER.format(filepath)) + 1:-(len(FILE_FOOTER.format(filepath)) + 2)]
+        with metrics.timer('tokenize'):
+            parts = split_for_shards(filepath, content, writer, count)
+        metrics.info(f"File {filepath} exceeds the shard budget; split into {len(parts)} parts")
+        with metrics.timer('write'):
+            for label, part, part_tokens in parts:
+                writer.add(label, part, part_tokens)
+
+    with metrics.timer('write'):
+        shards = writer.close()
+    summary = skip_summary(skipped)
+    if summary:
+        metrics.info(f"\n{summary}")
+    report_duplicates(finder, metrics, tokens_saved(duplicates, token_counts))
+    metrics.info(f"\nWrote {len(shards)} shards of at most {max_tokens:,} tokens:")
+    for path, tokens, entries in shards:
+        metrics.info(f"- {path}: {entries:,} entries, {tokens:,} tokens")
+    if token_cache is not None:
+        metrics.info(token_cache.summary())
+    return shards
+
+def concat_dir_data(dir_data, token_counting_enabled=False, dedup=False):
+    """Return the whole bundle as a single string (kept for callers that need it in memory)."""
+    return "".join(iter_concat_dir_data(dir_data, token_counting_enabled, dedup=dedup))
+
+def add_concat_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options for writing the bundle, shared with pipeline.py's single command."""
+    parser.add_argument('-c', '--count-tokens', action='store_true', help='Enable token counting using tiktoken')
+    parser.add_argument('--token-cache', metavar='PATH', help='Token count cache database (default: ~/.cache/data-ai-toolkit)')
+    parser.add_argument('--no-token-cache', action='store_true', help='Always re-count tokens instead of using the cache')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                      help=f'Threads used for token counting (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--processes', action='store_true', help='Count tokens in worker processes instead of threads')
+    parser.add_argument('--max-tokens-per-shard', type=int, metavar='N',
+                      help='Split the output into numbered part files of at most N tokens each')
+    parser.add_argument('-b', '--token-budget', type=int, metavar='N',
+                      help='Only include the most valuable files that fit in N tokens (estimated from file sizes)')
+    parser.add_argument('--weights', metavar='FILE', help='JSON file with priority weights for --token-budget')
+    parser.add_argument('--dedup', action='store_true',
+                      help='Write files with identical content once, and a reference to it for the others')
 
 def main():
     parser = argparse.ArgumentParser(description='Concatenate directory files into a single file.')
-    parser.add_argument('json_file', help='Input JSON file containing directory structure')
-    parser.add_argument('output_file', nargs='?', help='Output file (optional)')
-    parser.add_argument('-c', '--count-tokens', action='store_true', help='Enable token counting using tiktoken')
+    parser.add_argument('json_file', help="Input JSON or NDJSON file from dir_scanner.py, '-' for stdin")
+    parser.add_argument('output_file', nargs='?', help="Output file (optional; '-' or none for stdout)")
     parser.add_argument('-y', '--yes', action='store_true', help='Skip confirmation prompts')
+    parser.add_argument('-i', '--ignore', metavar='FILE',
+                      help='Ignore file to take max_file_size, oversize_action and skip_binary from')
+    add_concat_arguments(parser)
+    add_metrics_arguments(parser)
     
     args = parser.parse_args()
+    if args.output_file == '-':
+        args.output_file = None
+
+    if args.max_tokens_per_shard is not None:
+        if not args.output_file:
+            parser.error("--max-tokens-per-shard requires an output file")
+        if args.max_tokens_per_shard <= 0:
+            parser.error("--max-tokens-per-shard must be positive")
 
     # Check if output file exists and handle confirmation
     if args.output_file and os.path.exists(args.output_file):
+        if not args.yes and args.json_file == '-':
+            # The answer would be read from the piped scan
+            parser.error(f"output file '{args.output_file}' already exists; pass -y to overwrite it when the scan comes from stdin")
         if not args.yes:
             confirm = input(f"Output file '{args.output_file}' already exists. Overwrite? (y/N): ")
             if confirm.lower() != 'y':
                 print("Operation cancelled.")
                 sys.exit(0)
 
-    with open(args.json_file, 'r') as json_file:
-        dir_data = json.load(json_file)
-        if not validate_json(dir_data):
+    log = sys.stdout if args.output_file else sys.stderr
+    metrics = metrics_from_args(args, log)
+    try:
+        with metrics.timer('load'):
+            dir_data = load_scan(args.json_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.json_file}: {e}", file=log)
+        sys.exit(1)
+
+    # Legacy JSON is checked up front; NDJSON records are checked as they stream in
+    if isinstance(dir_data, dict) and not validate_json(dir_data, log):
+        sys.exit(1)
+
+    with contextlib.redirect_stdout(log):
+        limits = limits_from_ignore(load_ignore_file(args.ignore, log) if args.ignore else {})
+
+    if args.token_budget is not None:
+        try:
+            weights = load_weights_file(args.weights, log) if args.weights else DEFAULT_WEIGHTS
+        except Exception as e:
+            print(f"Error reading weights file {args.weights}: {e}", file=log)
             sys.exit(1)
-        
-        print("JSON is valid. Concatenating...")
-        concat_data = concat_dir_data(dir_data, args.count_tokens)
-
-    if args.output_file:
-        with open(args.output_file, 'w') as output_file:
-            output_file.write(concat_data)
-            print("\nSuccessfully wrote to file.")
-            sys.exit(0)
-    else:
-        print(concat_data)
+        dir_data = select_within_budget(dict(iter_dir_items(dir_data)), args.token_budget, weights,
+                                        estimate_framed_tokens, log=log)
+
+    counting = args.count_tokens or args.max_tokens_per_shard is not None
+    token_cache = open_token_cache(counting and not args.no_token_cache, args.token_cache, log)
+    try:
+        if args.max_tokens_per_shard is not None:
+            metrics.info("Scan is valid. Sharding...")
+            try:
+                write_sharded_dir_data(dir_data, args.output_file, args.max_tokens_per_shard,
+                                       token_cache=token_cache, workers=args.workers, limits=limits,
+                                       metrics=metrics, dedup=args.dedup)
+            except RuntimeError as e:
+                print(f"Error: {e}", file=log)
+                sys.exit(1)
+        elif args.output_file:
+            metrics.info("Scan is valid. Concatenating...")
+            with open(args.output_file, 'w', buffering=WRITE_BUFFER_SIZE) as output_file:
+                write_concat_dir_data(dir_data, output_file, args.count_tokens, token_cache=token_cache,
+                                      workers=args.workers, use_processes=args.processes, limits=limits,
+                                      metrics=metrics, dedup=args.dedup)
+            metrics.info("\nSuccessfully wrote to file.")
+        else:
+            # The bundle goes to stdout, so keep progress messages out of it
+            metrics.info("Scan is valid. Concatenating...")
+            write_concat_dir_data(dir_data, sys.stdout, args.count_tokens, log=sys.stderr, token_cache=token_cache,
+                                  workers=args.workers, use_processes=args.processes, limits=limits,
+                                  metrics=metrics, dedup=args.dedup)
+    except ValueError as e:
+        print(f"Error reading {args.json_file}: {e}", file=log)
+        sys.exit(1)
+    finally:
+        if token_cache is not None:
+            token_cache.close()
+
+    finish_metrics(metrics, args.metrics_json)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,17 @@
+import re
+
+import pytest
+
+
+class WordEncoder:
+    """Stands in for a tiktoken encoding: one token per word or punctuation mark."""
+
+    def encode_ordinary(self, text):
+        return re.findall(r"\w+|[^\w\s]", text)
+
+    encode = encode_ordinary
+
+
+@pytest.fixture
+def encoder():
+    return WordEncoder()
@@ -0,0 +1,107 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from anthropic_counter import AnthropicTokenCounter, TokenBucket, is_retryable, retry_delay
+
+
+class StatusError(Exception):
+    def __init__(self, status, headers=None):
+        super().__init__(f"status {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class FakeClient:
+    """Counts words, failing each text with the given errors first."""
+
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        self.beta = SimpleNamespace(messages=SimpleNamespace(count_tokens=self.count_tokens))
+
+    def count_tokens(self, model, messages):
+        content = messages[0]["content"]
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            errors = self.failures.get(content)
+            error = errors.pop(0) if errors else None
+        try:
+            if error is not None:
+                raise error
+            return SimpleNamespace(input_tokens=len(content.split()))
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+def make_counter(client, **options):
+    options.setdefault("requests_per_minute", 0)
+    return AnthropicTokenCounter(client, "model", base_delay=0.001, **options)
+
+
+def test_results_stay_with_their_texts():
+    client = FakeClient()
+    counter = make_counter(client, concurrency=4)
+    texts = ["word " * i for i in range(40)]
+    futures = [counter.submit(text) for text in texts]
+    assert [future.result() for future in futures] == list(range(40))
+    counter.close()
+    assert client.peak <= 4
+
+
+def test_transient_errors_are_retried():
+    client = FakeClient({"a b": [StatusError(429), StatusError(503)]})
+    counter = make_counter(client, concurrency=1)
+    assert counter.count("a b") == 2
+    assert counter.retries == 2
+
+
+def test_errors_that_cannot_succeed_fail_the_file(capsys):
+    client = FakeClient({"bad": [StatusError(400)], "slow": [StatusError(500)] * 3})
+    counter = make_counter(client, max_retries=2)
+    assert counter.count("bad") is None
+    assert counter.count("slow") is None
+    assert counter.count("fine") == 1
+    assert "Warning: Token counting failed" in capsys.readouterr().out
+
+
+def test_authentication_errors_disable_counting():
+    client = FakeClient({"a": [StatusError(401)]})
+    counter = make_counter(client)
+    assert counter.count("a") is None
+    assert counter.disabled
+    assert counter.count("b") is None
+    assert client.calls == 1
+
+
+def test_retry_policy():
+    assert is_retryable(StatusError(429)) and is_retryable(StatusError(502))
+    assert not is_retryable(StatusError(400))
+    assert is_retryable(ConnectionError())
+    assert retry_delay(StatusError(429, {"retry-after": "3"}), 0, 0.5) == 3.0
+    assert 0.5 <= retry_delay(StatusError(429), 0, 0.5) <= 0.75
+    assert retry_delay(StatusError(429), 20, 0.5) == 60.0
+
+
+def test_token_bucket_limits_the_rate(monkeypatch):
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("anthropic_counter.time.monotonic", lambda: now[0])
+    monkeypatch.setattr("anthropic_counter.time.sleep", sleep)
+    bucket = TokenBucket(rate=2.0)
+    for _ in range(6):
+        bucket.acquire()
+    # A burst of two, then one every half second
+    assert now[0] == pytest.approx(2.0)
@@ -0,0 +1,54 @@
+import tarfile
+import zipfile
+
+import pytest
+
+from archive_writer import ArchiveWriter, archive_format, should_compress
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("out.zip", "zip"), ("OUT.ZIP", "zip"), ("out.tar", "tar"),
+    ("out.tar.gz", "tar:gz"), ("out.tgz", "tar:gz"), ("out", None), ("out.gz", None),
+])
+def test_archive_format(path, expected):
+    assert archive_format(path) == expected
+
+
+def test_should_compress():
+    assert should_compress("a.py")
+    assert not should_compress("logo.PNG")
+    assert should_compress("logo.png", "deflate")
+    assert not should_compress("a.py", "store")
+
+
+def test_zip_entries_are_stored_or_deflated_by_policy(tmp_path):
+    (tmp_path / "a.txt").write_text("text " * 200)
+    (tmp_path / "b.png").write_bytes(b"\x89PNG" + bytes(range(256)) * 4)
+    path = str(tmp_path / "out.zip")
+    with ArchiveWriter(path) as archive:
+        assert archive.add_file(str(tmp_path / "a.txt"), "a.txt") == "deflate"
+        assert archive.add_file(str(tmp_path / "b.png"), "visual/b.png") == "store"
+        assert archive.add_text("notes.md", "é\n") == "deflate"
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.getinfo("a.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo("visual/b.png").compress_type == zipfile.ZIP_STORED
+        assert archive.read("a.txt") == (tmp_path / "a.txt").read_bytes()
+        assert archive.read("notes.md") == "é\n".encode("utf-8")
+
+
+@pytest.mark.parametrize("name", ["out.tar", "out.tar.gz"])
+def test_tar_round_trip(tmp_path, name):
+    (tmp_path / "a.txt").write_text("alpha\n")
+    path = str(tmp_path / name)
+    with ArchiveWriter(path) as archive:
+        assert archive.add_file(str(tmp_path / "a.txt"), "a.txt") == "tar"
+        archive.add_text("notes.md", "notes\n")
+    with tarfile.open(path) as archive:
+        assert archive.extractfile("a.txt").read() == b"alpha\n"
+        assert archive.extractfile("notes.md").read() == b"notes\n"
+
+
+def test_unknown_archive_type_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ArchiveWriter(str(tmp_path / "out.rar"))
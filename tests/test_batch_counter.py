@@ -0,0 +1,70 @@
+import io
+
+import pytest
+
+from batch_counter import BatchTokenCounter, count_texts, read_ahead
+from metrics import Metrics, QUIET
+
+
+class SpecialTokenEncoder:
+    def encode(self, text):
+        if "<|endoftext|>" in text:
+            raise ValueError("special token")
+        return text.split()
+
+
+class FailingEncoder:
+    def encode_ordinary(self, text):
+        raise RuntimeError("broken")
+
+
+def test_count_texts_prefers_encode_ordinary(encoder):
+    assert count_texts(encoder, ["a b", "<|endoftext|>", ""]) == [2, 5, 0]
+
+
+def test_count_texts_warns_on_the_given_log():
+    log = io.StringIO()
+    assert count_texts(SpecialTokenEncoder(), ["a b", "<|endoftext|>"], log) == [2, None]
+    assert "Warning: Token counting failed" in log.getvalue()
+
+
+@pytest.mark.parametrize("batch_size", [1, 3, 64])
+def test_every_text_comes_back_once(encoder, batch_size):
+    metrics = Metrics(QUIET, io.StringIO())
+    counter = BatchTokenCounter(encoder, workers=3, batch_size=batch_size, metrics=metrics)
+    texts = {i: "word " * i for i in range(50)}
+    results = []
+    for key, text in texts.items():
+        results.extend(counter.add(key, text))
+    results.extend(counter.finish())
+    assert dict(results) == {key: len(text.split()) for key, text in texts.items()}
+    assert len(results) == 50
+    assert metrics.counters["tokenized_files"] == 50
+
+
+def test_processes_fall_back_to_threads_without_an_encoding_name(encoder):
+    log = io.StringIO()
+    counter = BatchTokenCounter(encoder, workers=2, use_processes=True, log=log)
+    counter.add("a", "one two")
+    assert counter.finish() == [("a", 2)]
+    assert "Using threads instead" in log.getvalue()
+
+
+def test_failed_batches_report_none():
+    log = io.StringIO()
+    counter = BatchTokenCounter(FailingEncoder(), workers=1, log=log)
+    counter.add("a", "text")
+    assert counter.finish() == [("a", None)]
+    assert "Warning" in log.getvalue()
+
+
+def test_read_ahead_keeps_order_and_reports_errors():
+    def reader(item):
+        if item == 3:
+            raise OSError("unreadable")
+        return item * 10
+
+    results = list(read_ahead(range(8), reader, workers=4))
+    assert [item for item, _, _ in results] == list(range(8))
+    assert [result for item, result, error in results if error is None] == [0, 10, 20, 40, 50, 60, 70]
+    assert isinstance(results[3][2], OSError)
@@ -0,0 +1,42 @@
+import os
+import time
+
+import benchmark
+
+
+def crashing_worker(queue, stage, tree, workdir, options):
+    # Dies the way an OOM-killed interpreter would: no result, no exception
+    os._exit(137)
+
+
+def sleeping_worker(queue, stage, tree, workdir, options):
+    time.sleep(60)
+
+
+def test_isolated_stage_reports_errors(tmp_path):
+    result = benchmark.run_stage_isolated('nope', str(tmp_path), str(tmp_path), {})
+    assert "error" in result
+
+
+def test_crashed_stage_is_reported_instead_of_hanging(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "_stage_worker", crashing_worker)
+    monkeypatch.setattr(benchmark, "RESULT_POLL_INTERVAL", 0.1)
+    result = benchmark.run_stage_isolated('scan', str(tmp_path), str(tmp_path), {})
+    assert result == {"error": "stage process exited with status 137 without a result"}
+
+
+def test_stage_past_its_timeout_is_stopped(tmp_path, monkeypatch):
+    monkeypatch.setattr(benchmark, "_stage_worker", sleeping_worker)
+    monkeypatch.setattr(benchmark, "RESULT_POLL_INTERVAL", 0.1)
+    start = time.monotonic()
+    result = benchmark.run_stage_isolated('scan', str(tmp_path), str(tmp_path), {}, timeout=0.5)
+    assert result == {"error": "stage did not finish within 0.5s"}
+    assert time.monotonic() - start < 10
+
+
+def test_summarize_and_compare_runs():
+    runs = [{"wall_seconds": 2.0, "peak_rss_mb": 10.0}, {"wall_seconds": 1.0, "peak_rss_mb": 12.0}]
+    best = benchmark.summarize_runs(runs)
+    assert best["wall_seconds"] == 1.0 and best["runs"] == [2.0, 1.0] and best["peak_rss_mb"] == 12.0
+    lines = benchmark.compare_results({"stages": {"scan": {"wall_seconds": 2.0}}}, {"stages": {"scan": best}})
+    assert lines == ["- scan: 2.000s -> 1.000s (-50.0%)"]
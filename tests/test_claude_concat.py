@@ -0,0 +1,154 @@
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import claude_concat
+from archive_writer import ArchiveWriter
+from claude_concat import concat_dir_data, load_sync_manifest, save_sync_manifest, sync_manifest_path, transform_path
+from metrics import QUIET, Metrics
+
+
+@pytest.fixture
+def project(tmp_path):
+    root = tmp_path / "project"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.txt").write_text("alpha\n")
+    (root / "sub" / "b.py").write_text("print('b')\n")
+    (root / "sub" / "logo.png").write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+    return root
+
+
+def scan(root):
+    return {str(root): {'dirs': ['sub'], 'files': ['a.txt']},
+            str(root / "sub"): {'dirs': [], 'files': ['b.py', 'logo.png']}}
+
+
+def sync(root, output_dir):
+    output_dir.mkdir(exist_ok=True)
+    manifest_file = sync_manifest_path(str(output_dir))
+    manifest = load_sync_manifest(manifest_file)
+    metrics = Metrics(QUIET)
+    concat_dir_data(scan(root), str(output_dir), sync_manifest=manifest, metrics=metrics)
+    save_sync_manifest(manifest_file, manifest)
+    return metrics.counters
+
+
+def test_transform_path():
+    assert transform_path('.', 'readme.md') == 'readme.md'
+    assert transform_path('.', 'src/pkg/mod.py') == 'src@pkg@mod.py'
+
+
+def test_flattened_names_and_visual_folder(project, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    concat_dir_data(scan(project), str(output_dir), metrics=Metrics(QUIET))
+    assert sorted(os.listdir(output_dir)) == ['a.txt', 'sub@b.py', 'visual']
+    assert os.listdir(output_dir / "visual") == ['sub@logo.png']
+    assert (output_dir / "sub@b.py").read_text() == "print('b')\n"
+
+
+def test_sync_skips_unchanged_and_removes_deleted(project, tmp_path):
+    output_dir = tmp_path / "out"
+    assert sync(project, output_dir)['written'] == 3
+    counters = sync(project, output_dir)
+    assert (counters.get('written', 0), counters['unchanged'], counters['removed']) == (0, 3, 0)
+
+    os.remove(project / "a.txt")
+    counters = sync(project, output_dir)
+    assert counters['removed'] == 1
+    assert not (output_dir / "a.txt").exists()
+
+
+def test_first_sync_prunes_files_from_earlier_runs(project, tmp_path):
+    output_dir = tmp_path / "out"
+    (output_dir / "visual").mkdir(parents=True)
+    (output_dir / "old@gone.txt").write_text("left over\n")
+    (output_dir / "visual" / "old.png").write_bytes(b"png")
+    (output_dir / claude_concat.DUPLICATES_MANIFEST).write_text("# stale list\n")
+
+    counters = sync(project, output_dir)
+    assert counters['removed'] == 2
+    assert sorted(os.listdir(output_dir)) == ['a.txt', 'sub@b.py', 'visual']
+    assert os.listdir(output_dir / "visual") == ['sub@logo.png']
+
+
+def test_hardlinked_output_is_never_written_through(project, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    manifest_file = sync_manifest_path(str(output_dir))
+    manifest = load_sync_manifest(manifest_file)
+    concat_dir_data(scan(project), str(output_dir), sync_manifest=manifest, copy_mode='hardlink', metrics=Metrics(QUIET))
+    save_sync_manifest(manifest_file, manifest)
+    assert os.path.samefile(output_dir / "a.txt", project / "a.txt")
+
+    # Switching back to copies must not truncate the source through the link
+    sync(project, output_dir)
+    assert (project / "a.txt").read_text() == "alpha\n"
+    assert not os.path.samefile(output_dir / "a.txt", project / "a.txt")
+
+
+def baseline_outputs(dir_data):
+    """Output names and contents as the original claude_concat.py produced them."""
+    parent_dir = next(iter(dir_data))
+    outputs = {}
+    for base_dir, content in dir_data.items():
+        for filepath in content["files"]:
+            full_path = os.path.join(base_dir, filepath)
+            name = transform_path(parent_dir, os.path.relpath(full_path, parent_dir))
+            if name.lower().endswith(('.png', '.jpg', '.jpeg', '.pdf')):
+                name = "visual/" + name
+            with open(full_path, "rb") as f:
+                outputs[name] = f.read()
+    return outputs
+
+
+def folder_contents(output_dir):
+    contents = {}
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, "rb") as f:
+                contents[os.path.relpath(path, output_dir).replace(os.sep, "/")] = f.read()
+    return contents
+
+
+def archive_contents(path):
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(path) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers() if member.isfile()}
+
+
+def test_output_is_byte_identical_to_the_baseline(project, tmp_path):
+    (project / "sub" / "latin1.txt").write_bytes("caf\xe9\n".encode("latin-1"))
+    dir_data = scan(project)
+    dir_data[str(project / "sub")]['files'].append('latin1.txt')
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    created, visual = concat_dir_data(dir_data, str(output_dir), metrics=Metrics(QUIET))
+    assert folder_contents(output_dir) == baseline_outputs(dir_data)
+    assert (created, visual) == (['a.txt', 'sub@b.py', 'sub@latin1.txt'], ['sub@logo.png'])
+
+
+@pytest.mark.parametrize("name", ["out.zip", "out.tar", "out.tar.gz"])
+@pytest.mark.parametrize("dedup", [False, True])
+def test_archive_matches_the_folder_output(project, tmp_path, name, dedup):
+    (project / "sub" / "copy.txt").write_text("same\n" * 100)
+    (project / "a.txt").write_text("same\n" * 100)
+    dir_data = scan(project)
+    dir_data[str(project / "sub")]['files'].append('copy.txt')
+
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    folder_result = concat_dir_data(dir_data, str(output_dir), metrics=Metrics(QUIET), dedup=dedup)
+
+    archive_path = str(tmp_path / name)
+    with ArchiveWriter(archive_path) as archive:
+        archive_result = concat_dir_data(dir_data, archive_path, metrics=Metrics(QUIET), dedup=dedup, archive=archive)
+
+    assert archive_result == folder_result
+    assert archive_contents(archive_path) == folder_contents(output_dir)
+    assert (claude_concat.DUPLICATES_MANIFEST in folder_contents(output_dir)) is dedup
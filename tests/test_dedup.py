@@ -0,0 +1,63 @@
+import io
+
+import dedup
+from dedup import DuplicateFinder, fast_digest, mark_duplicates, report_duplicates, tokens_saved
+from metrics import Metrics, NORMAL
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_first_copy_is_the_original(tmp_path):
+    body = b"x" * 1000
+    a = write(tmp_path / "a", body)
+    b = write(tmp_path / "b", body)
+    c = write(tmp_path / "c", b"y" * 1000)
+    d = write(tmp_path / "d", body)
+    assert list(mark_duplicates([a, b, c, d], DuplicateFinder())) == [(a, None), (b, a), (c, None), (d, a)]
+
+
+def test_only_same_size_files_are_hashed(tmp_path, monkeypatch):
+    hashed = []
+    real = dedup.fast_digest
+    monkeypatch.setattr(dedup, "fast_digest", lambda path: hashed.append(path) or real(path))
+    paths = [write(tmp_path / f"f{i}", b"z" * (300 + i)) for i in range(5)]
+    finder = DuplicateFinder()
+    assert all(original is None for _, original in mark_duplicates(paths, finder))
+    assert hashed == []
+
+    same = write(tmp_path / "same", b"z" * 300)
+    assert finder.check(same, 300) == paths[0]
+    assert sorted(hashed) == sorted([same, paths[0]])
+
+
+def test_small_files_are_never_duplicates(tmp_path):
+    a = write(tmp_path / "a", b"tiny")
+    b = write(tmp_path / "b", b"tiny")
+    assert list(mark_duplicates([a, b], DuplicateFinder())) == [(a, None), (b, None)]
+    assert list(mark_duplicates([a, b], DuplicateFinder(min_size=1))) == [(a, None), (b, a)]
+
+
+def test_without_a_finder_nothing_is_marked(tmp_path):
+    a = write(tmp_path / "a", b"x" * 1000)
+    assert list(mark_duplicates([a, a], None)) == [(a, None), (a, None)]
+
+
+def test_digest_and_savings(tmp_path):
+    a = write(tmp_path / "a", b"x" * 1000)
+    b = write(tmp_path / "b", b"x" * 1000)
+    assert fast_digest(a) == fast_digest(b)
+    finder = DuplicateFinder()
+    list(mark_duplicates([a, b], finder))
+    assert (finder.duplicates, finder.bytes_saved) == (1, 1000)
+
+    assert tokens_saved([(b, a)], {a: 300, b: 10}) == 290
+    metrics = Metrics(NORMAL, io.StringIO())
+    report_duplicates(finder, metrics, 290)
+    assert metrics.counters == {'duplicates': 1, 'duplicate_bytes': 1000, 'duplicate_tokens': 290}
+    assert "1 files replaced" in metrics.log.getvalue()
+
+    finder.discard(b)
+    assert finder.duplicates == 0
@@ -0,0 +1,167 @@
+import os
+import sys
+import json
+import shutil
+import subprocess
+
+import pytest
+
+import dir_scanner
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["dir_scanner.py", *argv])
+    dir_scanner.main()
+
+
+def test_tracked_only_needs_the_git_source(tmp_path, monkeypatch, capsys):
+    with pytest.raises(SystemExit) as exc:
+        run_main(monkeypatch, str(tmp_path), str(tmp_path / "scan.json"), "--tracked-only")
+    assert exc.value.code == 2
+    assert "--tracked-only" in capsys.readouterr().err
+    assert not (tmp_path / "scan.json").exists()
+
+
+def test_tracked_only_with_the_git_source(tmp_path, monkeypatch):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.txt").write_text("a\n")
+    # Outside a checkout the git source falls back to a walk
+    run_main(monkeypatch, str(tmp_path / "src"), str(tmp_path / "scan.json"), "-s", "git", "--tracked-only", "-q")
+    assert (tmp_path / "scan.json").exists()
+
+
+def make_tree(root):
+    for path in ["a/b/c/deep.txt", "a/b/two.py", "a/one.txt", "z/last.txt", "m/n/x.log",
+                 "build/out.o", ".hidden/secret.txt", "top.txt", "notes.log"]:
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(path + "\n")
+    for i in range(30):
+        (root / "wide" / f"d{i}").mkdir(parents=True)
+        (root / "wide" / f"d{i}" / "f.txt").write_text(str(i))
+
+
+def walk_order(directory):
+    return [(root, {'dirs': dirs, 'files': files}) for root, dirs, files in os.walk(directory)]
+
+
+@pytest.mark.parametrize("workers", [2, 8, 32])
+def test_parallel_scan_matches_os_walk_order(tmp_path, workers):
+    make_tree(tmp_path)
+    expected = walk_order(str(tmp_path))
+    assert list(dir_scanner.iter_directory_parallel(str(tmp_path), workers=workers)) == expected
+    assert list(dir_scanner.iter_directory_lookup_table(str(tmp_path), workers=1, verbose=False)) == expected
+
+
+def test_parallel_scan_applies_ignore_patterns_like_the_walk(tmp_path):
+    make_tree(tmp_path)
+    patterns = dict(dir_scanner.DEFAULT_IGNORE, folders=["build/"], extensions=[".log"],
+                    ignore_hidden=True, patterns=["a/b/*.py"])
+    walked = dir_scanner.create_directory_lookup_table(str(tmp_path), patterns, workers=1, verbose=False)
+    scanned = dir_scanner.scan_directory_parallel(str(tmp_path), patterns, workers=8)
+    assert list(scanned.items()) == list(walked.items())
+    assert "build" not in scanned[str(tmp_path)]['dirs']
+    assert ".hidden" not in scanned[str(tmp_path)]['dirs']
+    assert "notes.log" not in scanned[str(tmp_path)]['files']
+    assert scanned[str(tmp_path / "a" / "b")]['files'] == []
+
+
+def matcher(*lines, extensions=(), ignore_hidden=False):
+    return dir_scanner.compile_ignore_patterns(dict(dir_scanner.DEFAULT_IGNORE, patterns=list(lines),
+                                                    extensions=list(extensions), ignore_hidden=ignore_hidden))
+
+
+@pytest.mark.parametrize("lines, rel_path, is_dir, ignored", [
+    (["build"], "src/build", True, True),
+    (["build"], "src/build", False, True),
+    (["build/"], "src/build", False, False),
+    (["build/"], "src/build", True, True),
+    (["/build"], "src/build", True, False),
+    (["/build"], "build", True, True),
+    (["*.tmp"], "a/b/c.tmp", False, True),
+    (["doc/*.md"], "doc/a.md", False, True),
+    (["doc/*.md"], "doc/sub/a.md", False, False),
+    (["**/cache"], "a/b/cache", True, True),
+    (["a/**/z.txt"], "a/z.txt", False, True),
+    (["a/**/z.txt"], "a/b/c/z.txt", False, True),
+    (["*.log", "!keep.log"], "x/keep.log", False, False),
+    (["!keep.log", "*.log"], "x/keep.log", False, True),
+    (["file?.txt"], "file1.txt", False, True),
+    (["file[0-9].txt"], "fileA.txt", False, False),
+    (["# comment", ""], "# comment", False, False),
+])
+def test_ignore_rules_follow_gitignore(lines, rel_path, is_dir, ignored):
+    name = rel_path.rpartition('/')[2]
+    assert matcher(*lines).ignored(rel_path, name, is_dir) is ignored
+
+
+def test_ignore_extensions_hidden_and_negation():
+    m = matcher("!important.bak", extensions=[".bak"], ignore_hidden=True)
+    assert m.ignored("x.bak", "x.bak", False)
+    assert not m.ignored("important.bak", "important.bak", False)
+    assert m.ignored(".env", ".env", False)
+    assert not m.ignored("env", "env", False)
+
+
+def test_gitignore_rules_apply_below_their_directory(tmp_path):
+    (tmp_path / "pkg" / "gen").mkdir(parents=True)
+    (tmp_path / "pkg" / ".gitignore").write_text("gen/\n*.pyc\n")
+    (tmp_path / "pkg" / "mod.py").write_text("")
+    (tmp_path / "pkg" / "mod.pyc").write_text("")
+    (tmp_path / "top.pyc").write_text("")
+    patterns = dict(dir_scanner.DEFAULT_IGNORE, use_gitignore=True)
+    scan = dir_scanner.create_directory_lookup_table(str(tmp_path), patterns, verbose=False)
+    assert sorted(scan[str(tmp_path / "pkg")]['files']) == [".gitignore", "mod.py"]
+    assert scan[str(tmp_path / "pkg")]['dirs'] == []
+    assert "top.pyc" in scan[str(tmp_path)]['files']
+
+
+def test_incremental_scan_reports_changes(tmp_path):
+    make_tree(tmp_path)
+    patterns = dir_scanner.DEFAULT_IGNORE
+    full, records, changes, relisted = dir_scanner.incremental_scan(str(tmp_path), patterns, {'dirs': {}})
+    assert list(full.items()) == list(dir_scanner.scan_directory_parallel(str(tmp_path)).items())
+    assert relisted == len(full)
+
+    manifest = {'dirs': records}
+    (tmp_path / "a" / "one.txt").write_text("changed, and longer\n")
+    (tmp_path / "z" / "new.txt").write_text("new\n")
+    (tmp_path / "top.txt").unlink()
+    _, _, changes, relisted = dir_scanner.incremental_scan(str(tmp_path), patterns, manifest)
+    assert changes == {
+        'added': [str(tmp_path / "z" / "new.txt")],
+        'removed': [str(tmp_path / "top.txt")],
+        'modified': [str(tmp_path / "a" / "one.txt")],
+    }
+    assert relisted == 2
+
+
+def test_ndjson_round_trip(tmp_path):
+    make_tree(tmp_path)
+    entries = list(dir_scanner.iter_directory_parallel(str(tmp_path)))
+    out = tmp_path / "scan.ndjson"
+    with open(out, "w") as f:
+        count = dir_scanner.write_ndjson(entries, f)
+    assert count == sum(len(listing['files']) for _, listing in entries)
+    assert list(dir_scanner.load_scan(str(out))) == entries
+
+    legacy = tmp_path / "scan.json"
+    legacy.write_text(json.dumps(dict(entries)))
+    assert dir_scanner.load_scan(str(legacy)) == dict(entries)
+
+
+def test_git_source_lists_the_index(tmp_path):
+    if shutil.which("git") is None:
+        pytest.skip("git is not installed")
+    make_tree(tmp_path)
+    (tmp_path / ".gitignore").write_text("build/\n")
+    subprocess.run(["git", "init", "-q", str(tmp_path)], check=True)
+    subprocess.run(["git", "-C", str(tmp_path), "add", "a", ".gitignore"], check=True)
+
+    scan = dict(dir_scanner.iter_git_lookup_table(str(tmp_path), verbose=False))
+    assert "build" not in scan[str(tmp_path)]['dirs']
+    assert "top.txt" in scan[str(tmp_path)]['files']
+
+    tracked = dict(dir_scanner.iter_git_lookup_table(str(tmp_path), untracked=False, verbose=False))
+    assert tracked[str(tmp_path)]['files'] == [".gitignore"]
+    assert sorted(tracked[str(tmp_path / "a" / "b")]['files']) == ["two.py"]
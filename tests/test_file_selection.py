@@ -0,0 +1,43 @@
+import io
+import json
+
+import pytest
+
+from file_selection import DEFAULT_WEIGHTS, collect_candidates, load_weights_file, select_candidates, select_within_budget
+
+
+def test_empty_scan_selects_nothing():
+    log = io.StringIO()
+    assert collect_candidates({}, DEFAULT_WEIGHTS) == []
+    assert select_within_budget({}, 100, log=log) == {}
+    assert "dropped 0 files" in log.getvalue()
+
+
+@pytest.mark.parametrize("half_life", [0, -1, "30", True])
+def test_weights_file_rejects_bad_half_life(tmp_path, half_life):
+    path = tmp_path / "weights.json"
+    path.write_text(json.dumps({"recency_boost": 1.0, "recency_half_life_days": half_life}))
+    with pytest.raises(ValueError, match="recency_half_life_days"):
+        load_weights_file(str(path))
+
+
+def test_weights_file_fills_defaults(tmp_path):
+    path = tmp_path / "weights.json"
+    path.write_text(json.dumps({"depth_decay": 0.5}))
+    weights = load_weights_file(str(path))
+    assert weights["depth_decay"] == 0.5
+    assert weights["recency_half_life_days"] == DEFAULT_WEIGHTS["recency_half_life_days"]
+
+
+def test_selection_prefers_weight_per_token(tmp_path):
+    root = tmp_path / "project"
+    root.mkdir()
+    (root / "small.py").write_text("x" * 40)
+    (root / "large.txt").write_text("x" * 400)
+    dir_data = {str(root): {"dirs": [], "files": ["small.py", "large.txt"]}}
+    weights = dict(DEFAULT_WEIGHTS, extensions={".py": 2.0})
+
+    candidates = collect_candidates(dir_data, weights)
+    selected, dropped = select_candidates(candidates, budget=50)
+    assert [c["file"] for c in selected] == ["small.py"]
+    assert [c["file"] for c in dropped] == ["large.txt"]
@@ -0,0 +1,58 @@
+import pytest
+
+from file_sniffer import (DEFAULT_LIMITS, SkippedFile, classify_file, limits_from_ignore, parse_size,
+                          read_text_file, sniff_encoding)
+
+
+def test_sniff_encoding():
+    assert sniff_encoding(b"plain text\n") == 'utf-8'
+    assert sniff_encoding("café".encode('latin-1')) == 'utf-8'
+    assert sniff_encoding(b"\xff\xfeh\x00i\x00") == 'utf-16'
+    assert sniff_encoding(b"\xef\xbb\xbfhi") == 'utf-8-sig'
+    assert sniff_encoding(b"ab\x00cd") is None
+    assert sniff_encoding(bytes(range(1, 32)) * 4) is None
+    assert sniff_encoding(b"\x1b[31mred\x1b[0m\n") == 'utf-8'
+
+
+def test_latin1_file_is_read_with_replacement_characters(tmp_path):
+    path = tmp_path / "legacy.c"
+    path.write_bytes("/* résumé */\nint x;\n".encode('latin-1'))
+    content, truncated, size = read_text_file(str(path))
+    assert content == "/* r�sum� */\nint x;\n"
+    assert (truncated, size) == (False, path.stat().st_size)
+
+
+def test_binary_file_is_skipped_by_default(tmp_path):
+    path = tmp_path / "blob.bin"
+    path.write_bytes(b"\x00\x01\x02" * 100)
+    with pytest.raises(SkippedFile) as e:
+        read_text_file(str(path))
+    assert e.value.kind == 'binary'
+    content, _, _ = read_text_file(str(path), dict(DEFAULT_LIMITS, skip_binary=False))
+    assert content.startswith("\x00\x01\x02")
+
+
+def test_oversized_files_are_skipped_or_truncated(tmp_path):
+    path = tmp_path / "big.txt"
+    path.write_text("line\n" * 100)
+    skip = limits_from_ignore({'max_file_size': 100})
+    assert classify_file(str(path), skip)[0] == 'oversize'
+    with pytest.raises(SkippedFile):
+        read_text_file(str(path), skip)
+
+    truncate = limits_from_ignore({'max_file_size': '100B', 'oversize_action': 'truncate'})
+    content, truncated, size = read_text_file(str(path), truncate)
+    assert truncated and size == 500
+    assert content.startswith("line\n" * 20)
+    assert "showing the first 100 of 500 bytes" in content
+
+
+def test_limits_are_validated():
+    assert parse_size('5 MB') == 5 * 1024 ** 2
+    assert parse_size('512KB') == 512 * 1024
+    with pytest.raises(ValueError):
+        parse_size('lots')
+    with pytest.raises(ValueError):
+        limits_from_ignore({'oversize_action': 'shrink'})
+    with pytest.raises(ValueError):
+        limits_from_ignore({'skip_binary': 'yes'})
@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from git_index import GitError, git_file_list, group_by_directory, is_git_checkout
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def git(repo, *args):
+    subprocess.run(["git", "-C", str(repo), "-c", "user.name=test", "-c", "user.email=test@example.com",
+                    "-c", "commit.gpgsign=false", *args], check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    for path in ["src/app.py", "src/util/helpers.py", "readme.md", "build/out.o"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text(path + "\n")
+    (tmp_path / ".gitignore").write_text("build/\n")
+    git(tmp_path, "init", "-q")
+    git(tmp_path, "add", ".")
+    git(tmp_path, "commit", "-q", "-m", "initial")
+    return tmp_path
+
+
+def test_index_listing_honours_gitignore(repo):
+    (repo / "new.txt").write_text("untracked\n")
+    assert git_file_list(str(repo)) == [".gitignore", "new.txt", "readme.md", "src/app.py", "src/util/helpers.py"]
+    assert "new.txt" not in git_file_list(str(repo), untracked=False)
+
+
+def test_deleted_files_are_left_out(repo):
+    os.remove(repo / "readme.md")
+    assert "readme.md" not in git_file_list(str(repo))
+
+
+def test_changed_since_lists_the_diff(repo):
+    (repo / "src" / "app.py").write_text("changed\n")
+    (repo / "src" / "new.py").write_text("new\n")
+    os.remove(repo / "readme.md")
+    assert git_file_list(str(repo), "HEAD") == ["src/app.py", "src/new.py"]
+    assert git_file_list(str(repo), "HEAD", untracked=False) == ["src/app.py"]
+    with pytest.raises(GitError, match="unknown commit"):
+        git_file_list(str(repo), "no-such-ref")
+
+
+def test_listing_from_a_subdirectory_is_relative_to_it(repo):
+    assert git_file_list(str(repo / "src")) == ["app.py", "util/helpers.py"]
+
+
+def test_outside_a_checkout(tmp_path):
+    assert not is_git_checkout(str(tmp_path))
+    with pytest.raises(GitError):
+        git_file_list(str(tmp_path))
+
+
+def test_group_by_directory_is_top_down():
+    grouped = list(group_by_directory("/r", ["b/x.txt", "a/c/y.txt", "top.txt", "a/z.txt"]))
+    assert grouped == [
+        ("/r", {'dirs': ['a', 'b'], 'files': ['top.txt']}),
+        (os.path.join("/r", "a"), {'dirs': ['c'], 'files': ['z.txt']}),
+        (os.path.join("/r", "a", "c"), {'dirs': [], 'files': ['y.txt']}),
+        (os.path.join("/r", "b"), {'dirs': [], 'files': ['x.txt']}),
+    ]
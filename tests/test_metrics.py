@@ -0,0 +1,74 @@
+import io
+import json
+import argparse
+import threading
+
+from metrics import (NORMAL, QUIET, VERBOSE, Metrics, add_metrics_arguments, finish_metrics,
+                     metrics_from_args, timed_iter)
+
+
+def test_levels_decide_what_is_printed():
+    for level, expected in ((QUIET, ""), (NORMAL, "info\n"), (VERBOSE, "detail\ninfo\n")):
+        metrics = Metrics(level, io.StringIO())
+        metrics.detail("detail")
+        metrics.info("info")
+        assert metrics.log.getvalue() == expected
+
+
+def test_counters_and_timers_are_thread_safe():
+    metrics = Metrics(QUIET, io.StringIO())
+
+    def work():
+        for _ in range(1000):
+            metrics.count("files")
+            metrics.add_time("read", 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert metrics.counters["files"] == 8000
+    assert metrics.stages["read"]["calls"] == 8000
+    assert abs(metrics.seconds("read") - 8.0) < 1e-6
+
+
+def test_only_the_slowest_files_are_kept():
+    metrics = Metrics(QUIET, io.StringIO(), slowest=3)
+    for i in range(10):
+        metrics.record_file(f"f{i}", i / 10)
+    assert [entry['path'] for entry in metrics.slowest_files()] == ["f9", "f8", "f7"]
+
+
+def test_timed_iter_adds_to_the_stage():
+    metrics = Metrics(QUIET, io.StringIO())
+    assert list(timed_iter(range(3), metrics, "scan")) == [0, 1, 2]
+    assert metrics.stages["scan"]["calls"] == 3
+
+
+def test_arguments_and_json_report(tmp_path):
+    parser = argparse.ArgumentParser()
+    add_metrics_arguments(parser)
+    log = io.StringIO()
+    metrics = metrics_from_args(parser.parse_args(["-v", "--slowest", "2"]), log)
+    assert (metrics.level, metrics.slowest_limit) == (VERBOSE, 2)
+
+    metrics.count("files", 2)
+    metrics.record_file("a.txt", 0.5)
+    with metrics.timer("write"):
+        pass
+    out = tmp_path / "metrics.json"
+    finish_metrics(metrics, str(out))
+    data = json.loads(out.read_text())
+    assert data["counters"] == {"files": 2}
+    assert data["slowest_files"] == [{"path": "a.txt", "seconds": 0.5}]
+    assert "write" in data["stages"]
+    assert "Counts: files 2" in log.getvalue()
+    assert "Slowest files:" in log.getvalue()
+
+
+def test_scanner_arguments_leave_out_verbose_and_slowest():
+    parser = argparse.ArgumentParser()
+    add_metrics_arguments(parser, verbose=False, slowest=False)
+    metrics = metrics_from_args(parser.parse_args(["-q"]))
+    assert metrics.level == QUIET
@@ -0,0 +1,81 @@
+import sys
+import argparse
+import zipfile
+
+import pytest
+
+import pipeline
+import dir_scanner
+import claude_concat
+import single_file_concat
+
+
+def option_strings(parser):
+    return {option for action in parser._actions for option in action.option_strings}
+
+
+@pytest.mark.parametrize("command, add_arguments", [
+    ("single", single_file_concat.add_concat_arguments),
+    ("claude", claude_concat.add_flatten_arguments),
+])
+def test_subcommands_take_every_tool_option(command, add_arguments):
+    tool = argparse.ArgumentParser()
+    add_arguments(tool)
+    subparsers = next(action for action in pipeline.build_parser()._actions
+                      if isinstance(action, argparse._SubParsersAction))
+    assert option_strings(tool) <= option_strings(subparsers.choices[command])
+
+
+def test_claude_passes_api_and_process_options():
+    args = pipeline.build_parser().parse_args(
+        ["claude", "src", "out", "--api-concurrency", "2", "--api-rpm", "30", "--processes"])
+    assert (args.api_concurrency, args.api_rpm, args.processes) == (2, 30, True)
+    assert args.copy_mode == "copy" and args.compression == "auto"
+
+
+def test_single_defaults_match_the_standalone_tool():
+    args = pipeline.build_parser().parse_args(["single", "src"])
+    tool = argparse.ArgumentParser()
+    single_file_concat.add_concat_arguments(tool)
+    defaults = vars(tool.parse_args([]))
+    assert {key: getattr(args, key) for key in defaults} == defaults
+
+
+def test_tracked_only_needs_the_git_source(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(sys, "argv", ["pipeline.py", "single", str(tmp_path), str(tmp_path / "out.txt"), "--tracked-only"])
+    with pytest.raises(SystemExit) as exc:
+        pipeline.main()
+    assert exc.value.code == 2
+    assert "--tracked-only" in capsys.readouterr().err
+
+
+def test_single_matches_scanning_then_concatenating(tmp_path, monkeypatch):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "a.txt").write_text("alpha\n")
+    (root / "pkg" / "b.py").write_text("print('b')\n")
+    (root / "skip.log").write_text("noise\n")
+    ignore = tmp_path / "ignore.json"
+    ignore.write_text('{"files": [], "folders": [], "extensions": [".log"]}')
+
+    scan = dir_scanner.create_directory_lookup_table(str(root), dir_scanner.load_ignore_file(str(ignore)), verbose=False)
+    expected = single_file_concat.concat_dir_data(scan)
+
+    out = tmp_path / "out.txt"
+    monkeypatch.setattr(sys, "argv", ["pipeline.py", "single", str(root), str(out), "-i", str(ignore), "-q"])
+    pipeline.main()
+    assert out.read_text() == expected
+    assert "skip.log" not in expected
+
+
+def test_claude_matches_scanning_then_flattening(tmp_path, monkeypatch):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "a.txt").write_text("alpha\n")
+    (root / "pkg" / "b.py").write_text("print('b')\n")
+    out = tmp_path / "out.zip"
+    monkeypatch.setattr(sys, "argv", ["pipeline.py", "claude", str(root), str(out), "-q"])
+    pipeline.main()
+    with zipfile.ZipFile(out) as archive:
+        assert {name: archive.read(name) for name in archive.namelist()} == {
+            "a.txt": b"alpha\n", "pkg@b.py": b"print('b')\n"}
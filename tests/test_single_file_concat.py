@@ -0,0 +1,143 @@
+import io
+import os
+import sys
+import json
+
+import pytest
+
+import single_file_concat
+from metrics import Metrics, QUIET
+from single_file_concat import ShardWriter, DUPLICATE_NOTE
+
+
+def baseline_bundle(dir_data):
+    """The bundle exactly as the original single_file_concat.py built it."""
+    concat_data = ""
+    for k, v in dir_data.items():
+        for f in v["files"]:
+            filepath = os.path.join(k, f)
+            with open(filepath, "r") as fh:
+                file_content = fh.read()
+            concat_data += (
+                f"\n--- {filepath} START ---\n\n"
+                f"{file_content}\n"
+                f"\n--- {filepath} END ---\n\n"
+            )
+    return concat_data
+
+
+@pytest.fixture
+def scan(tmp_path):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    (root / "readme.txt").write_text("hello\nworld\n")
+    (root / "empty.txt").write_text("")
+    (root / "pkg" / "mod.py").write_text("def f():\n    return 'é'\n")
+    (root / "pkg" / "no_newline.py").write_text("x = 1")
+    dir_data = {
+        str(root): {"dirs": ["pkg"], "files": ["readme.txt", "empty.txt"]},
+        str(root / "pkg"): {"dirs": [], "files": ["mod.py", "no_newline.py"]},
+    }
+    scan_file = tmp_path / "scan.json"
+    scan_file.write_text(json.dumps(dir_data))
+    return dir_data, scan_file
+
+
+def run_main(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["single_file_concat.py", *argv])
+    single_file_concat.main()
+
+
+def test_output_file_is_byte_identical_to_the_baseline(scan, tmp_path, monkeypatch):
+    dir_data, scan_file = scan
+    out = tmp_path / "out.txt"
+    run_main(monkeypatch, str(scan_file), str(out), "-q")
+    assert out.read_bytes() == baseline_bundle(dir_data).encode("utf-8")
+
+
+def test_stdout_holds_only_the_bundle(scan, monkeypatch, capsys):
+    dir_data, scan_file = scan
+    run_main(monkeypatch, str(scan_file))
+    captured = capsys.readouterr()
+    assert captured.out == baseline_bundle(dir_data)
+    assert "Concatenating" in captured.err
+
+
+def test_ndjson_scan_gives_the_same_bundle(scan, tmp_path, monkeypatch):
+    dir_data, _ = scan
+    ndjson = tmp_path / "scan.ndjson"
+    with open(ndjson, "w") as f:
+        for root, listing in dir_data.items():
+            f.write(json.dumps({"dir": root, "dirs": listing["dirs"]}) + "\n")
+            for name in listing["files"]:
+                f.write(json.dumps({"file": name}) + "\n")
+    out = tmp_path / "out.txt"
+    run_main(monkeypatch, str(ndjson), str(out), "-q")
+    assert out.read_text() == baseline_bundle(dir_data)
+
+
+def test_dedup_writes_a_reference(scan):
+    dir_data, _ = scan
+    root = next(iter(dir_data))
+    with open(os.path.join(root, "copy.txt"), "w") as f:
+        f.write("hello\nworld\n" * 50)
+    with open(os.path.join(root, "readme.txt"), "w") as f:
+        f.write("hello\nworld\n" * 50)
+    dir_data[root]["files"].append("copy.txt")
+    metrics = Metrics(QUIET, io.StringIO())
+    out = io.StringIO()
+    single_file_concat.write_concat_dir_data(dir_data, out, metrics=metrics, dedup=True)
+    original = os.path.join(root, "readme.txt")
+    assert single_file_concat.frame_file(os.path.join(root, "copy.txt"), DUPLICATE_NOTE.format(original)) in out.getvalue()
+    assert out.getvalue().count("hello\nworld\n" * 50) == 1
+
+
+def test_token_counts_cover_the_framed_files(scan, encoder, monkeypatch):
+    dir_data, _ = scan
+    monkeypatch.setattr(single_file_concat, "setup_tiktoken_counter", lambda enabled, log=None: (enabled, encoder))
+    metrics = Metrics(QUIET, io.StringIO())
+    out = io.StringIO()
+    single_file_concat.write_concat_dir_data(dir_data, out, True, workers=2, metrics=metrics)
+    assert metrics.counters["tokens"] == len(encoder.encode(out.getvalue()))
+
+
+def count_words(encoder):
+    return lambda text: len(encoder.encode(text))
+
+
+def test_shard_writer_keeps_every_shard_within_budget(tmp_path, encoder):
+    count = count_words(encoder)
+    writer = ShardWriter(str(tmp_path / "bundle.txt"), 60, count)
+    for i in range(40):
+        framed = single_file_concat.frame_file(f"f{i}.txt", "word " * (i % 7))
+        writer.add(f"f{i}.txt", framed, count(framed))
+    shards = writer.close()
+
+    assert len(shards) > 1
+    for path, tokens, entries in shards:
+        text = open(path).read()
+        assert count(text) == tokens
+        assert tokens <= 60
+    assert sum(entries for _, _, entries in shards) == 40
+
+
+def test_sharded_bundle_splits_only_oversized_files(scan, tmp_path, encoder, monkeypatch):
+    dir_data, _ = scan
+    root = next(iter(dir_data))
+    with open(os.path.join(root, "big.txt"), "w") as f:
+        f.write("".join(f"line {i} of the big file\n" for i in range(200)))
+    dir_data[root]["files"].append("big.txt")
+    monkeypatch.setattr(single_file_concat, "setup_tiktoken_counter", lambda enabled, log=None: (enabled, encoder))
+
+    budget = 150
+    shards = single_file_concat.write_sharded_dir_data(dir_data, str(tmp_path / "bundle.txt"), budget,
+                                                       metrics=Metrics(QUIET, io.StringIO()))
+    texts = [open(path).read() for path, _, _ in shards]
+    for text in texts:
+        assert len(encoder.encode(text)) <= budget
+    joined = "".join(texts)
+    for name in ("readme.txt", "empty.txt"):
+        assert single_file_concat.frame_file(os.path.join(root, name), open(os.path.join(root, name)).read()) in joined
+    assert "big.txt (part 1/" in joined
+    for i in range(200):
+        assert f"line {i} of the big file\n" in joined
@@ -0,0 +1,49 @@
+import io
+
+from token_cache import TokenCache, content_digest, count_with_cache, open_token_cache
+
+
+def test_counts_persist_between_runs(tmp_path):
+    path = str(tmp_path / "cache" / "tokens.sqlite3")
+    cache = TokenCache(path)
+    assert count_with_cache(cache, "tiktoken", "gpt-4o", "hello world", lambda text: 2) == 2
+    cache.close()
+
+    cache = TokenCache(path)
+    assert count_with_cache(cache, "tiktoken", "gpt-4o", "hello world", lambda text: 1 / 0) == 2
+    assert (cache.hits, cache.misses) == (1, 0)
+    # Keyed by tokenizer and model as well as content
+    assert cache.get("anthropic", "gpt-4o", content_digest("hello world")) is None
+    cache.close()
+
+
+def test_failed_counts_are_not_stored():
+    cache = TokenCache(":memory:")
+    assert count_with_cache(cache, "tiktoken", "m", "text", lambda text: None) is None
+    assert cache.get("tiktoken", "m", content_digest("text")) is None
+    assert count_with_cache(None, "tiktoken", "m", "text", len) == 4
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr("token_cache.time.time", lambda: next(clock))
+    cache = TokenCache(":memory:", max_entries=2)
+    for name in ("a", "b", "c"):
+        cache.put("t", "m", name, 1)
+    cache.get("t", "m", "a")
+    assert cache.evict() == 1
+    assert cache.get("t", "m", "b") is None
+    assert cache.get("t", "m", "a") == 1 and cache.get("t", "m", "c") == 1
+
+
+def test_digest_handles_lone_surrogates():
+    assert content_digest("\ud800") != content_digest("")
+
+
+def test_open_token_cache_warns_on_the_given_log(tmp_path):
+    assert open_token_cache(False) is None
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    log = io.StringIO()
+    assert open_token_cache(True, str(blocker / "tokens.sqlite3"), log) is None
+    assert "Warning: Could not open token cache" in log.getvalue()
@@ -0,0 +1,125 @@
+import io
+import math
+
+import pytest
+
+import token_estimator
+from metrics import Metrics, QUIET
+from token_cache import TokenCache, content_digest
+from token_estimator import (MIN_SAMPLES, UNCALIBRATED_SIGMA, baseline_tokens, char_classes, estimate_files,
+                             fit_ratios, ratio_for, refine_near_budget, summarize)
+
+
+def entry(estimate, sigma=0.2, group="*", n=10, exact=None, path="x"):
+    return {'path': path, 'estimate': estimate, 'group': group, 'sigma': sigma, 'n': n, 'exact': exact}
+
+
+def test_char_classes():
+    assert char_classes("ab 12,é".encode("utf-8")) == {
+        'letters': 2, 'digits': 2, 'whitespace': 1, 'non_ascii': 2, 'punctuation': 1}
+
+
+def test_baseline_scales_the_sample_and_skips_binary(tmp_path, monkeypatch):
+    monkeypatch.setattr(token_estimator, "SAMPLE_SIZE", 100)
+    text = tmp_path / "a.txt"
+    text.write_text("abcd" * 100)
+    assert baseline_tokens(str(text), 400) == pytest.approx(100)
+    binary = tmp_path / "a.bin"
+    binary.write_bytes(b"\x00\x01" * 50)
+    assert baseline_tokens(str(binary), 100) is None
+    empty = tmp_path / "empty"
+    empty.write_bytes(b"")
+    assert baseline_tokens(str(empty), 0) == 0.0
+
+
+def test_fit_ratios_and_fallback():
+    samples = [(".py", 100.0, 200)] * MIN_SAMPLES + [(".md", 100.0, 50)]
+    ratios = fit_ratios(samples)
+    assert ratios[".py"]["log_ratio"] == pytest.approx(math.log(2), abs=1e-6)
+    assert ratios[".py"]["sigma"] == 0
+    assert ratios[".md"]["n"] == 1
+    assert ratio_for(ratios, ".py")[0] == ".py"
+    # Too few .md samples, so the overall fit is used
+    assert ratio_for(ratios, ".md")[0] == "*"
+    assert ratio_for({}, ".md") == ("?", 0.0, UNCALIBRATED_SIGMA, 1)
+
+
+def test_summarize_range_shrinks_as_files_are_counted():
+    files = [entry(1000.0), entry(1000.0)]
+    total, low, high = summarize(files)
+    assert total == 2000 and low < 2000 < high
+
+    files[0]['exact'] = 1100
+    total, low2, high2 = summarize(files)
+    assert total == 2100
+    assert high2 - low2 < high - low
+
+    files[1]['exact'] = 900
+    assert summarize(files) == (2000, 2000, 2000)
+
+
+def test_refine_stops_once_the_budget_is_outside_the_range(tmp_path):
+    files = []
+    for i in range(40):
+        path = tmp_path / f"f{i}.txt"
+        path.write_text("word " * 100)
+        files.append(entry(100.0, sigma=0.5, path=str(path)))
+    counted = []
+
+    def count(text):
+        counted.append(text)
+        return 100
+
+    total, low, high = refine_near_budget(files, 4000, count, metrics=Metrics(QUIET, io.StringIO()))
+    assert total == 4000
+    assert not low <= 4000 < high or all(f['exact'] is not None for f in files)
+    assert len(counted) == sum(f['exact'] is not None for f in files)
+
+    # Well outside the range, nothing needs counting
+    counted.clear()
+    fresh = [entry(100.0, sigma=0.1, path=f['path']) for f in files]
+    refine_near_budget(fresh, 100000, count)
+    assert counted == []
+
+
+def test_uncountable_files_keep_their_estimate_and_error(tmp_path):
+    files = [entry(1000.0, sigma=0.5, path=str(tmp_path / "missing.txt"))]
+    before = summarize(files)
+    metrics = Metrics(QUIET, io.StringIO())
+    assert refine_near_budget(files, 1000, lambda text: 1, metrics=metrics) == before
+    assert files[0]['exact'] is None
+    assert metrics.counters['uncountable'] == 1
+
+
+def test_estimates_use_calibration_from_the_cache(tmp_path):
+    root = tmp_path / "src"
+    root.mkdir()
+    names = [f"f{i}.py" for i in range(MIN_SAMPLES)]
+    for i, name in enumerate(names):
+        (root / name).write_text("value = compute(x)\n" * (i + 1))
+    (root / "blob.bin").write_bytes(b"\x00" * 64)
+    dir_data = {str(root): {'dirs': [], 'files': names + ["blob.bin"]}}
+
+    cache = TokenCache(":memory:")
+    for name in names:
+        content = (root / name).read_text()
+        cache.put("tiktoken", "gpt-4o", content_digest(content), 3 * len(content.split()))
+    samples = token_estimator.collect_calibration(dir_data, "tiktoken", "any", cache, 0, None)
+    assert len(samples) == MIN_SAMPLES
+    ratios = fit_ratios(samples)
+
+    metrics = Metrics(QUIET, io.StringIO())
+    files = estimate_files(dir_data, ratios, metrics=metrics)
+    assert metrics.counters == {'files': MIN_SAMPLES, 'skipped': 1}
+    for f in files:
+        exact = 3 * len(open(f['path']).read().split())
+        assert f['estimate'] == pytest.approx(exact, rel=1e-3)
+        assert f['group'] == ".py"
+
+
+def test_calibration_round_trip(tmp_path):
+    path = str(tmp_path / "calibration.json")
+    assert token_estimator.load_calibration(path)['models'] == {}
+    data = {'version': token_estimator.CALIBRATION_VERSION, 'models': {'tiktoken:gpt-4o': {'*': {'n': 1}}}}
+    token_estimator.save_calibration(path, data)
+    assert token_estimator.load_calibration(path) == data
@@ -0,0 +1,92 @@
+import io
+import os
+import argparse
+import threading
+
+import pytest
+
+from metrics import QUIET, Metrics
+from pipeline import bundle_to_file, scan_entries
+from toolkit_client import DaemonError, build_request, send_request
+from toolkit_daemon import ToolkitServer, ToolkitService, WarmState
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "tree"
+    (root / "sub").mkdir(parents=True)
+    (root / "a.py").write_text("a = 1\n")
+    (root / "sub" / "b.py").write_text("b = 2\n")
+    return root
+
+
+@pytest.fixture
+def service():
+    return ToolkitService(WarmState(scan_workers=2))
+
+
+def request(service, op, **args):
+    reply = service.handle({'op': op, 'args': dict(args, level='quiet')})
+    assert reply['ok'], reply
+    return reply
+
+
+def direct_bundle(source, output):
+    metrics = Metrics(QUIET, io.StringIO())
+    bundle_to_file(scan_entries(source), output, log=metrics.log, metrics=metrics)
+    with open(output, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("source", ["tree", "./tree/"])
+def test_bundle_matches_the_direct_cli(tree, tmp_path, service, monkeypatch, source):
+    monkeypatch.chdir(tmp_path)
+    expected = direct_bundle(source, "direct.txt")
+    assert f"--- {os.path.join(source, 'a.py')} START ---" in expected
+
+    # The daemon runs elsewhere; relative paths resolve against the client's directory
+    monkeypatch.chdir("/")
+    request(service, 'single', cwd=str(tmp_path), source=source, output="daemon.txt")
+    assert (tmp_path / "daemon.txt").read_text(encoding='utf-8') == expected
+    assert os.getcwd() == "/"
+
+
+def test_warm_scan_relists_only_changed_directories(tree, service):
+    assert request(service, 'scan', directory=str(tree))['result'] == {'directories': 2, 'files': 2}
+    (tree / "sub" / "c.py").write_text("c = 3\n")
+    reply = service.handle({'op': 'scan', 'args': {'directory': str(tree)}})
+    assert reply['result'] == {'directories': 2, 'files': 3}
+    assert "1 added" in reply['output']
+
+
+def test_unknown_request_and_errors_are_reported(tmp_path, service):
+    assert service.handle({'op': 'frobnicate'}) == {'ok': False, 'error': "unknown request: frobnicate"}
+    reply = service.handle({'op': 'scan', 'args': {'directory': str(tmp_path / "missing")}})
+    assert not reply['ok'] and "is not a directory" in reply['error']
+
+
+def test_socket_round_trip(tree, service, tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    server = ToolkitServer(socket_path, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert send_request('ping', socket_path=socket_path)['ok']
+        reply = send_request('scan', {'directory': str(tree)}, socket_path)
+        assert reply['result']['files'] == 2
+        assert send_request('shutdown', socket_path=socket_path)['output'] == "Daemon stopping"
+    finally:
+        thread.join(timeout=5)
+        server.server_close()
+    with pytest.raises(DaemonError):
+        send_request('ping', socket_path=socket_path)
+
+
+def test_client_sends_paths_as_given_with_its_cwd(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    args = argparse.Namespace(command='single', source='tree', output_file='out.txt', ignore=None,
+                              gitignore=False, quiet=True, verbose=False, metrics_json=None,
+                              count_tokens=False, token_budget=None, weights=None, dedup=False,
+                              max_tokens_per_shard=None)
+    sent = build_request(args)
+    assert (sent['cwd'], sent['source'], sent['output']) == (str(tmp_path), 'tree', 'out.txt')
@@ -0,0 +1,144 @@
+import os
+import random
+import itertools
+
+import pytest
+
+import watcher
+import single_file_concat
+from watcher import LiveBundle, PathFilter, apply_changes
+from dir_scanner import DEFAULT_IGNORE
+
+
+# Distinct mtimes, so every write is seen as a change
+TICKS = itertools.count(1)
+
+
+def write(path, text):
+    path.write_text(text, encoding='utf-8')
+    mtime = next(TICKS) * 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+
+
+def expected_bundle(paths):
+    return ''.join(single_file_concat.frame_file(path, open(path, encoding='utf-8').read()) for path in paths)
+
+
+def bundle_text(bundle):
+    with open(bundle.output_file, encoding='utf-8') as f:
+        return f.read()
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "src"
+    root.mkdir()
+    for i in range(5):
+        write(root / f"f{i}.txt", f"file {i}\n" * (i + 1))
+    return root
+
+
+def build(tree, tmp_path, count=None):
+    bundle = LiveBundle(str(tmp_path / "out.txt"), count)
+    paths = sorted(str(path) for path in tree.iterdir())
+    for path in paths:
+        bundle.update(path)
+    bundle.flush()
+    return bundle, paths
+
+
+def test_build_matches_single_file_concat_framing(tree, tmp_path):
+    bundle, paths = build(tree, tmp_path)
+    assert bundle_text(bundle) == expected_bundle(paths)
+    assert not os.path.exists(bundle.stage_file)
+
+
+def test_changes_are_spliced_in_place(tree, tmp_path):
+    bundle, paths = build(tree, tmp_path)
+    write(tree / "f1.txt", "grown " * 50)
+    write(tree / "f3.txt", "é")
+    bundle.update(str(tree / "f1.txt"))
+    bundle.update(str(tree / "f3.txt"))
+    bundle.flush()
+    assert bundle_text(bundle) == expected_bundle(paths)
+
+    # Same length: written over the old section
+    text = (tree / "f2.txt").read_text()
+    write(tree / "f2.txt", text.upper())
+    bundle.update(str(tree / "f2.txt"))
+    bundle.flush()
+    assert bundle_text(bundle) == expected_bundle(paths)
+
+    os.remove(tree / "f0.txt")
+    bundle.update(str(tree / "f0.txt"))
+    write(tree / "new.txt", "added later\n")
+    bundle.update(str(tree / "new.txt"))
+    bundle.flush()
+    assert bundle_text(bundle) == expected_bundle(paths[1:] + [str(tree / "new.txt")])
+
+
+def test_random_batches_match_a_fresh_build(tree, tmp_path):
+    bundle, order = build(tree, tmp_path)
+    rng = random.Random(7)
+    for _ in range(200):
+        gone = set()
+        for _ in range(rng.randint(1, 4)):
+            path = tree / f"f{rng.randint(0, 9)}.txt"
+            if rng.random() < 0.25 and path.exists():
+                os.remove(path)
+                gone.add(str(path))
+            else:
+                write(path, "x" * rng.randint(0, 80))
+                gone.discard(str(path))
+                if str(path) not in order:
+                    order.append(str(path))
+            bundle.update(str(path))
+        bundle.flush()
+        order = [path for path in order if path not in gone]
+        assert bundle_text(bundle) == expected_bundle(order)
+        assert sorted(bundle.known()) == sorted(order)
+
+
+def test_failed_flush_rewrites_the_bundle_in_full(tree, tmp_path, monkeypatch):
+    bundle, paths = build(tree, tmp_path, count=len)
+    write(tree / "f1.txt", "changed " * 10)
+    bundle.update(str(tree / "f1.txt"))
+
+    real_copy_range = watcher.copy_range
+    calls = []
+
+    def failing_copy_range(*args):
+        calls.append(args)
+        if len(calls) == 2:
+            raise OSError(28, "No space left on device")
+        real_copy_range(*args)
+
+    monkeypatch.setattr(watcher, "copy_range", failing_copy_range)
+    bundle.flush()
+    monkeypatch.setattr(watcher, "copy_range", real_copy_range)
+
+    # Everything is staged again from the source files
+    assert sorted(bundle.staged) == paths
+    bundle.flush()
+    assert bundle_text(bundle) == expected_bundle(paths)
+    assert bundle.total_tokens() == sum(len(single_file_concat.frame_file(p, open(p).read())) for p in paths)
+    assert not os.path.exists(bundle.stage_file)
+
+
+def test_apply_changes_follows_deleted_directories(tmp_path):
+    root = tmp_path / "src"
+    (root / "pkg").mkdir(parents=True)
+    write(root / "top.txt", "top\n")
+    write(root / "pkg" / "mod.txt", "mod\n")
+    bundle = LiveBundle(str(tmp_path / "out.txt"))
+    path_filter = PathFilter(str(root), DEFAULT_IGNORE)
+    apply_changes({str(root)}, [bundle], path_filter, resync=True)
+    bundle.flush()
+    assert sorted(bundle.known()) == [str(root / "pkg" / "mod.txt"), str(root / "top.txt")]
+
+    os.remove(root / "pkg" / "mod.txt")
+    os.rmdir(root / "pkg")
+    updated, removed = apply_changes({str(root / "pkg")}, [bundle], path_filter)
+    bundle.flush()
+    assert (updated, removed) == (0, 1)
+    assert bundle_text(bundle) == expected_bundle([str(root / "top.txt")])
@@ -0,0 +1,132 @@
+# token_cache.py
+# ---
+# persistent token-count cache shared by claude_concat.py and single_file_concat.py
+# counts are keyed by (tokenizer, model, content hash) so unchanged files are never re-tokenized
+
+import os
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Optional
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "data-ai-toolkit",
+    "token_cache.sqlite3",
+)
+
+# Least recently used entries beyond this are evicted when the cache is closed
+DEFAULT_MAX_ENTRIES = 500_000
+
+def content_digest(content: str) -> str:
+    """Hash of the exact text being counted."""
+    return hashlib.sha256(content.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+class TokenCache:
+    """SQLite-backed token counts with size-bounded LRU eviction."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tokens ("
+            " tokenizer TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " digest TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (tokenizer, model, digest))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used)")
+        self._conn.commit()
+
+    def get(self, tokenizer: str, model: str, digest: str) -> Optional[int]:
+        """Look up a count, marking it as recently used. Returns None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tokens FROM tokens WHERE tokenizer = ? AND model = ? AND digest = ?",
+                (tokenizer, model, digest),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE tokens SET last_used = ? WHERE tokenizer = ? AND model = ? AND digest = ?",
+                (time.time(), tokenizer, model, digest),
+            )
+            return row[0]
+
+    def put(self, tokenizer: str, model: str, digest: str, tokens: int) -> None:
+        """Store a count."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tokens (tokenizer, model, digest, tokens, last_used) VALUES (?, ?, ?, ?, ?)",
+                (tokenizer, model, digest, tokens, time.time()),
+            )
+
+    def evict(self) -> int:
+        """Drop the least recently used entries beyond max_entries. Returns the number removed."""
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM tokens").fetchone()
+            excess = count - self.max_entries
+            if excess <= 0:
+                return 0
+            self._conn.execute(
+                "DELETE FROM tokens WHERE rowid IN (SELECT rowid FROM tokens ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            return excess
+
+    def commit(self) -> None:
+        """Write pending counts to disk, for long-running users that do not close the cache."""
+        with self._lock:
+            self._conn.commit()
+
+    def close(self) -> None:
+        """Evict, commit and close the database."""
+        self.evict()
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def summary(self) -> str:
+        return f"Token cache: {self.hits:,} hits, {self.misses:,} misses"
+
+def count_with_cache(cache: Optional[TokenCache], tokenizer: str, model: str, content: str,
+                     count: Callable[[str], Optional[int]]) -> Optional[int]:
+    """Return the cached count for content, calling count() and storing the result on a miss."""
+    if cache is None:
+        return count(content)
+
+    digest = content_digest(content)
+    tokens = cache.get(tokenizer, model, digest)
+    if tokens is not None:
+        return tokens
+
+    tokens = count(content)
+    if tokens is not None:
+        cache.put(tokenizer, model, digest, tokens)
+    return tokens
+
+def open_token_cache(enabled: bool, path: Optional[str] = None, log=sys.stdout) -> Optional[TokenCache]:
+    """Open the token cache if enabled, warning and carrying on without it on failure."""
+    if not enabled:
+        return None
+    try:
+        return TokenCache(path or DEFAULT_CACHE_PATH)
+    except Exception as e:
+        print(f"Warning: Could not open token cache: {e}", file=log)
+        print("Token counts will not be cached.", file=log)
+        return None
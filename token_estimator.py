@@ -0,0 +1,364 @@
+# token_estimator.py
+# ---
+# predicts token counts without tokenizing, for sizing a project before a full run.
+# each file gets a baseline from the character classes of its first 64 KB (letters,
+# digits, punctuation, whitespace, non-ASCII), which is scaled by a per-extension ratio
+# calibrated against exact counts from earlier runs (the token cache). the total comes
+# with a 95% range, and with a budget only the files that could tip the answer are
+# counted exactly.
+#
+# usage:
+#   python token_estimator.py calibrate ./data/this.json -t tiktoken --count-missing 50
+#   python token_estimator.py estimate ./my_project -b 150000
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import claude_concat
+from pipeline import open_entries
+from token_cache import DEFAULT_CACHE_PATH, content_digest, count_with_cache, open_token_cache
+from batch_counter import count_texts, read_ahead
+from dir_scanner import DEFAULT_IGNORE, iter_dir_items, load_ignore_file
+from file_sniffer import DEFAULT_LIMITS, SNIFF_SIZE, SkippedFile, limits_from_ignore, read_text_file, sniff_encoding
+from metrics import Metrics, add_metrics_arguments, finish_metrics, metrics_from_args
+
+DEFAULT_CALIBRATION_PATH = os.path.join(os.path.dirname(DEFAULT_CACHE_PATH), "token_calibration.json")
+CALIBRATION_VERSION = 1
+
+# Bytes read from each file; larger files are scaled up from this sample
+SAMPLE_SIZE = 64 * 1024
+
+# Rough tokens per byte of each character class, before calibration
+BASELINE_COSTS = {
+    'letters': 1 / 4.0,
+    'digits': 1 / 2.5,
+    'punctuation': 1 / 1.5,
+    'whitespace': 1 / 4.0,
+    'non_ascii': 1 / 2.0,
+}
+
+# Extensions need this many calibration samples before their own ratio is trusted
+MIN_SAMPLES = 5
+# Spread (of the log ratio) assumed when nothing has been calibrated yet
+UNCALIBRATED_SIGMA = 0.35
+# Two-sided 95% interval
+Z_95 = 1.96
+
+LETTERS = bytes(range(ord('A'), ord('Z') + 1)) + bytes(range(ord('a'), ord('z') + 1))
+DIGITS = b'0123456789'
+WHITESPACE = b' \t\r\n\x0b\x0c'
+ASCII = bytes(range(128))
+
+def char_classes(sample: bytes) -> Dict[str, int]:
+    """Count the bytes of each character class in a sample."""
+    total = len(sample)
+    letters = total - len(sample.translate(None, LETTERS))
+    digits = total - len(sample.translate(None, DIGITS))
+    whitespace = total - len(sample.translate(None, WHITESPACE))
+    non_ascii = len(sample.translate(None, ASCII))
+    return {
+        'letters': letters,
+        'digits': digits,
+        'whitespace': whitespace,
+        'non_ascii': non_ascii,
+        'punctuation': total - letters - digits - whitespace - non_ascii,
+    }
+
+def baseline_tokens(path: str, size: int, limits: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """
+    Uncalibrated token estimate for a file from the character classes of its first
+    SAMPLE_SIZE bytes. Returns None for files the concat tools would skip.
+    """
+    limits = limits or DEFAULT_LIMITS
+    max_size = limits["max_file_size"]
+    if max_size is not None and size > max_size:
+        if limits["oversize_action"] == 'skip':
+            return None
+        size = max_size
+    with open(path, "rb") as f:
+        sample = f.read(min(size, SAMPLE_SIZE))
+    if not sample:
+        return 0.0
+    if limits["skip_binary"] and sniff_encoding(sample[:SNIFF_SIZE]) is None:
+        return None
+    classes = char_classes(sample)
+    tokens = sum(classes[name] * cost for name, cost in BASELINE_COSTS.items())
+    return tokens * size / len(sample)
+
+def extension_of(path: str) -> str:
+    return os.path.splitext(path)[1].lower() or '(none)'
+
+def calibration_key(tokenizer: str, model_name: str) -> str:
+    """Calibrations are kept per tokenizer and model, like the token cache."""
+    return f"{tokenizer}:{model_name if tokenizer == 'anthropic' else claude_concat.TIKTOKEN_MODEL}"
+
+def load_calibration(filename: str = DEFAULT_CALIBRATION_PATH) -> Dict[str, Any]:
+    """Load saved calibrations, or return an empty set if there are none."""
+    empty = {'version': CALIBRATION_VERSION, 'models': {}}
+    if not os.path.exists(filename):
+        return empty
+    try:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Warning: Could not read calibration '{filename}': {e}. Estimates are uncalibrated.")
+        return empty
+    if data.get('version') != CALIBRATION_VERSION or not isinstance(data.get('models'), dict):
+        print("Warning: Calibration file has an unknown format. Estimates are uncalibrated.")
+        return empty
+    return data
+
+def save_calibration(filename: str, data: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, 'w') as f:
+        json.dump(data, f, indent=4)
+
+def fit_ratios(samples: List[Tuple[str, float, int]]) -> Dict[str, Dict[str, float]]:
+    """
+    Fit per-extension ratios from (extension, baseline, exact tokens) samples.
+    Ratios are averaged in log space; 'sigma' is the spread of a single file's
+    log ratio and 'n' the number of files. '*' holds the fit over all extensions.
+    """
+    groups = {}
+    for ext, baseline, exact in samples:
+        if baseline > 0 and exact > 0:
+            log_ratio = math.log(exact / baseline)
+            groups.setdefault(ext, []).append(log_ratio)
+            groups.setdefault('*', []).append(log_ratio)
+
+    ratios = {}
+    for ext, values in groups.items():
+        n = len(values)
+        mean = sum(values) / n
+        variance = sum((v - mean) ** 2 for v in values) / (n - 1) if n > 1 else UNCALIBRATED_SIGMA ** 2
+        ratios[ext] = {'log_ratio': round(mean, 6), 'sigma': round(math.sqrt(variance), 6), 'n': n}
+    return ratios
+
+def ratio_for(ratios: Dict[str, Dict[str, float]], ext: str) -> Tuple[str, float, float, int]:
+    """(group, log ratio, sigma, samples) for an extension, falling back to the overall fit."""
+    for group in (ext, '*'):
+        entry = ratios.get(group)
+        if entry is not None and entry['n'] >= MIN_SAMPLES:
+            return group, entry['log_ratio'], entry['sigma'], entry['n']
+    return '?', 0.0, UNCALIBRATED_SIGMA, 1
+
+def summarize(files: List[Dict[str, Any]]) -> Tuple[int, int, int]:
+    """
+    Total tokens with a 95% range. Each file's own error is treated as independent,
+    and each calibration group adds a shared error from the uncertainty of its ratio.
+    Files that were counted exactly add no error.
+    """
+    total = 0.0
+    random_var = 0.0
+    group_totals = {}
+    for entry in files:
+        if entry['exact'] is not None:
+            total += entry['exact']
+            continue
+        total += entry['estimate']
+        random_var += (entry['estimate'] * entry['sigma']) ** 2
+        group = group_totals.setdefault(entry['group'], [0.0, entry['sigma'], entry['n']])
+        group[0] += entry['estimate']
+    shared_var = sum((amount * sigma / math.sqrt(n)) ** 2 for amount, sigma, n in group_totals.values())
+    margin = Z_95 * math.sqrt(random_var + shared_var)
+    return round(total), max(0, round(total - margin)), round(total + margin)
+
+def estimate_files(dir_data, ratios: Dict[str, Dict[str, float]], limits: Optional[Dict[str, Any]] = None,
+                   metrics: Optional[Metrics] = None) -> List[Dict[str, Any]]:
+    """Estimate every file in a scan. Skipped (binary, oversized, unreadable) files are left out."""
+    metrics = metrics or Metrics()
+    paths = (os.path.join(root, name) for root, listing in iter_dir_items(dir_data) for name in listing['files'])
+
+    def sample(path: str) -> Optional[float]:
+        with metrics.timer('read'):
+            return baseline_tokens(path, os.stat(path).st_size, limits)
+
+    files = []
+    for path, baseline, error in read_ahead(paths, sample):
+        if error is not None or baseline is None:
+            metrics.count('skipped')
+            continue
+        group, log_ratio, sigma, n = ratio_for(ratios, extension_of(path))
+        estimate = baseline * math.exp(log_ratio)
+        metrics.count('files')
+        metrics.detail(f"{path}: ~{estimate:,.0f} tokens")
+        files.append({'path': path, 'estimate': estimate, 'group': group, 'sigma': sigma, 'n': n, 'exact': None})
+    return files
+
+def refine_near_budget(files: List[Dict[str, Any]], budget: int, count: Callable[[str], Optional[int]],
+                       limits: Optional[Dict[str, Any]] = None, metrics: Optional[Metrics] = None) -> Tuple[int, int, int]:
+    """
+    While the budget falls inside the estimated range, count exactly the files that
+    add the most uncertainty, a batch at a time. Stops as soon as the whole range is
+    on one side of the budget. Files that cannot be counted keep their estimate and
+    its error. Returns the final (total, low, high).
+    """
+    metrics = metrics or Metrics()
+    pending = sorted((entry for entry in files if entry['exact'] is None),
+                     key=lambda entry: entry['estimate'] * entry['sigma'])
+    total, low, high = summarize(files)
+    while pending and low <= budget < high:
+        batch = [pending.pop() for _ in range(min(len(pending), max(16, len(pending) // 20)))]
+        for entry in batch:
+            try:
+                with metrics.timer('read'):
+                    content, _, _ = read_text_file(entry['path'], limits)
+                with metrics.timer('tokenize'):
+                    exact = count(content)
+            except (OSError, UnicodeDecodeError, SkippedFile):
+                exact = None
+            if exact is None:
+                metrics.count('uncountable')
+                continue
+            entry['exact'] = exact
+            metrics.count('counted_exactly')
+        total, low, high = summarize(files)
+    return total, low, high
+
+def collect_calibration(dir_data, tokenizer: str, model_name: str, token_cache, count_missing: int,
+                        count: Optional[Callable[[str], Optional[int]]], limits: Optional[Dict[str, Any]] = None,
+                        metrics: Optional[Metrics] = None) -> List[Tuple[str, float, int]]:
+    """
+    Pair each file's baseline with its exact count. Counts come from the token cache
+    when an earlier run stored them; otherwise up to 'count_missing' files per
+    extension are counted now with count(), which should store them in the cache.
+    """
+    metrics = metrics or Metrics()
+    cache_model = model_name if tokenizer == 'anthropic' else claude_concat.TIKTOKEN_MODEL
+    counted = {}
+    samples = []
+    for root, listing in iter_dir_items(dir_data):
+        for name in listing['files']:
+            path = os.path.join(root, name)
+            ext = extension_of(path)
+            try:
+                with metrics.timer('read'):
+                    baseline = baseline_tokens(path, os.stat(path).st_size, limits)
+                    if baseline is None:
+                        continue
+                    content, _, _ = read_text_file(path, limits)
+            except (OSError, UnicodeDecodeError, SkippedFile):
+                continue
+
+            exact = token_cache.get(tokenizer, cache_model, content_digest(content)) if token_cache else None
+            if exact is not None:
+                metrics.count('from_cache')
+            elif count is not None and counted.get(ext, 0) < count_missing:
+                with metrics.timer('tokenize'):
+                    exact = count(content)
+                counted[ext] = counted.get(ext, 0) + 1
+                metrics.count('counted')
+            if exact is not None:
+                samples.append((ext, baseline, exact))
+    return samples
+
+def make_counter(tokenizer: str, model_name: str, token_cache) -> Tuple[Optional[Callable[[str], Optional[int]]], str]:
+    """
+    Exact counter for the chosen tokenizer, with claude_concat.py's fallback to tiktoken.
+    tiktoken counts go through batch_counter.count_texts, like the cached counts from a run.
+    """
+    enabled, counter, active = claude_concat.setup_token_counter(True, tokenizer, model_name)
+    if not enabled:
+        return None, tokenizer
+    cache_model = model_name if active == 'anthropic' else claude_concat.TIKTOKEN_MODEL
+
+    def count(text: str) -> Optional[int]:
+        if active == 'tiktoken':
+            return count_with_cache(token_cache, active, cache_model, text, lambda t: count_texts(counter, [t])[0])
+        return count_with_cache(token_cache, active, cache_model, text,
+                                lambda t: claude_concat.count_file_tokens(active, counter, model_name, t))
+    return count, active
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate token counts quickly, calibrated against earlier exact counts.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, help_text in (('estimate', 'Estimate the tokens in a project'),
+                            ('calibrate', 'Fit per-extension ratios from exact counts')):
+        sub = subparsers.add_parser(name, help=help_text)
+        sub.add_argument('source', help='Directory to scan, or a saved scan file (JSON or NDJSON)')
+        sub.add_argument('-i', '--ignore', metavar='FILE', help='Ignore patterns file, JSON or TOML')
+        sub.add_argument('-t', '--tokenizer', choices=['anthropic', 'tiktoken'], default='tiktoken',
+                         help='Tokenizer the estimate is for (default: tiktoken)')
+        sub.add_argument('-m', '--model', default="claude-3-5-sonnet-latest",
+                         help='Model name for the Anthropic tokenizer (default: claude-3-5-sonnet-latest)')
+        sub.add_argument('--calibration', metavar='FILE', default=DEFAULT_CALIBRATION_PATH,
+                         help='Calibration file (default: next to the token cache)')
+        sub.add_argument('--token-cache', metavar='PATH', help='Token count cache database')
+        add_metrics_arguments(sub)
+    subparsers.choices['estimate'].add_argument('-b', '--token-budget', type=int, metavar='N',
+                                                help='Say whether the project fits in N tokens')
+    subparsers.choices['estimate'].add_argument('--no-exact', action='store_true',
+                                                help='Never count exactly, even when the budget is inside the range')
+    subparsers.choices['calibrate'].add_argument('--count-missing', type=int, default=0, metavar='N',
+                                                 help='Count up to N files per extension that are not in the token cache')
+
+    args = parser.parse_args()
+    metrics = metrics_from_args(args)
+    ignore_patterns = load_ignore_file(args.ignore) if args.ignore else DEFAULT_IGNORE.copy()
+    limits = limits_from_ignore(ignore_patterns)
+    try:
+        dir_data = open_entries(args.source, ignore_patterns=ignore_patterns)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {args.source}: {e}")
+        sys.exit(1)
+
+    key = calibration_key(args.tokenizer, args.model)
+    calibration = load_calibration(args.calibration)
+    token_cache = open_token_cache(True, args.token_cache)
+    try:
+        if args.command == 'calibrate':
+            count, active = None, args.tokenizer
+            if args.count_missing > 0:
+                count, active = make_counter(args.tokenizer, args.model, token_cache)
+                key = calibration_key(active, args.model)
+            samples = collect_calibration(dir_data, active, args.model, token_cache, args.count_missing,
+                                          count, limits, metrics)
+            if not samples:
+                print("No exact counts found. Run claude_concat.py with -c first, or pass --count-missing N.")
+                sys.exit(1)
+            ratios = fit_ratios(samples)
+            calibration['models'][key] = {'updated': time.strftime('%Y-%m-%d %H:%M:%S'), 'extensions': ratios}
+            save_calibration(args.calibration, calibration)
+            metrics.info(f"Calibrated {key} on {len(samples):,} files ({len(ratios) - 1:,} extensions); saved to {args.calibration}")
+            for ext, entry in sorted(ratios.items(), key=lambda item: -item[1]['n']):
+                metrics.detail(f"- {ext}: ratio {math.exp(entry['log_ratio']):.3f}, "
+                               f"spread {entry['sigma'] * 100:.0f}%, {entry['n']:,} files")
+        else:
+            ratios = calibration['models'].get(key, {}).get('extensions', {})
+            if not ratios:
+                metrics.info(f"No calibration for {key} yet; the range will be wide. See 'token_estimator.py calibrate'.")
+            files = estimate_files(dir_data, ratios, limits, metrics)
+            total, low, high = summarize(files)
+            metrics.info(f"Estimated tokens: {total:,} (95% range {low:,} to {high:,}) across {len(files):,} files")
+
+            if args.token_budget is not None:
+                budget = args.token_budget
+                if low <= budget < high and not args.no_exact:
+                    count, _ = make_counter(args.tokenizer, args.model, token_cache)
+                    if count is not None:
+                        total, low, high = refine_near_budget(files, budget, count, limits, metrics)
+                        exact = sum(1 for entry in files if entry['exact'] is not None)
+                        metrics.info(f"Counted {exact:,} files exactly: {total:,} tokens (95% range {low:,} to {high:,})")
+                if high <= budget:
+                    verdict = "fits"
+                elif low > budget:
+                    verdict = "does not fit"
+                else:
+                    verdict = "may or may not fit"
+                print(f"Budget {budget:,}: the project {verdict}")
+            metrics.count('estimated_tokens', total)
+            metrics.count('estimate_low', low)
+            metrics.count('estimate_high', high)
+    finally:
+        if token_cache is not None:
+            token_cache.close()
+
+    finish_metrics(metrics, args.metrics_json)
+
+if __name__ == "__main__":
+    main()
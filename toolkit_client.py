@@ -0,0 +1,208 @@
+# toolkit_client.py
+# ---
+# thin command line client for toolkit_daemon.py. it only uses the standard library
+# and imports nothing from the toolkit, so a request costs an interpreter start and
+# one round trip over the unix socket instead of loading tokenizers and rescanning.
+#
+# usage:
+#   python toolkit_client.py start
+#   python toolkit_client.py scan ./my_project -i ignore.json
+#   python toolkit_client.py count ./my_project/src ./notes.md
+#   python toolkit_client.py single ./my_project ./data/combined.txt -c
+#   python toolkit_client.py claude ./my_project ./data/claude -c -t tiktoken --sync
+#   python toolkit_client.py stop
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+from typing import Any, Dict, Optional
+
+DEFAULT_SOCKET = os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "data-ai-toolkit"),
+    "data-ai-toolkit.sock",
+)
+START_TIMEOUT = 15.0
+RECV_SIZE = 64 * 1024
+
+class DaemonError(RuntimeError):
+    """The daemon is not running, or could not handle a request."""
+
+def send_request(op: str, args: Optional[Dict[str, Any]] = None, socket_path: str = DEFAULT_SOCKET) -> Dict[str, Any]:
+    """Send one request and return the daemon's reply. Requests and replies are single JSON lines."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+            sock.sendall(json.dumps({'op': op, 'args': args or {}}).encode('utf-8') + b'\n')
+            chunks = []
+            while True:
+                chunk = sock.recv(RECV_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+    except OSError as e:
+        raise DaemonError(f"could not reach the daemon at {socket_path}: {e}")
+    if not chunks:
+        raise DaemonError("the daemon closed the connection without replying")
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+def is_running(socket_path: str = DEFAULT_SOCKET) -> bool:
+    try:
+        return send_request('ping', socket_path=socket_path).get('ok', False)
+    except DaemonError:
+        return False
+
+def start_daemon(socket_path: str = DEFAULT_SOCKET, log_file: Optional[str] = None) -> int:
+    """Start toolkit_daemon.py in the background and wait until it answers. Returns its pid."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'toolkit_daemon.py')
+    log_file = log_file or os.path.splitext(socket_path)[0] + '.log'
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+    with open(log_file, 'a') as log:
+        process = subprocess.Popen([sys.executable, script, '--socket', socket_path],
+                                   stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise DaemonError(f"the daemon exited with status {process.returncode}; see {log_file}")
+        if is_running(socket_path):
+            return process.pid
+        time.sleep(0.05)
+    raise DaemonError(f"the daemon did not start within {START_TIMEOUT:.0f}s; see {log_file}")
+
+def add_bundle_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('source', help='Directory to scan, or a saved scan file (JSON or NDJSON)')
+    parser.add_argument('-c', '--count-tokens', action='store_true', help='Enable token counting')
+    parser.add_argument('-b', '--token-budget', type=int, metavar='N',
+                        help='Only include the most valuable files that fit in N tokens')
+    parser.add_argument('--weights', metavar='FILE', help='JSON file with priority weights for --token-budget')
+    parser.add_argument('--dedup', action='store_true', help='Emit files with identical content only once')
+    parser.add_argument('-y', '--yes', action='store_true', help='Skip confirmation prompts')
+
+def add_scan_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-i', '--ignore', metavar='FILE', help='Ignore patterns file, JSON or TOML')
+    parser.add_argument('-g', '--gitignore', action='store_true', help='Also honour .gitignore files found while scanning')
+
+def add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only print warnings and errors')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Print a line for every file')
+    parser.add_argument('--metrics-json', metavar='FILE', help='Have the daemon write stage timings and counters to FILE')
+
+def build_request(args: argparse.Namespace) -> Dict[str, Any]:
+    """Paths are sent as given, with the working directory the daemon resolves them against."""
+    request = {
+        'cwd': os.getcwd(),
+        'ignore_file': getattr(args, 'ignore', None),
+        'gitignore': getattr(args, 'gitignore', False),
+        'level': 'quiet' if args.quiet else 'verbose' if args.verbose else 'normal',
+        'metrics_json': args.metrics_json,
+    }
+    if args.command == 'scan':
+        request.update(directory=args.directory, output_file=args.output_file)
+    elif args.command == 'count':
+        request.update(paths=args.paths, tokenizer=args.tokenizer, model=args.model)
+    else:
+        request.update(
+            mode=args.command,
+            source=args.source,
+            count_tokens=args.count_tokens,
+            token_budget=args.token_budget,
+            weights=args.weights,
+            dedup=args.dedup,
+        )
+        if args.command == 'single':
+            request.update(output=args.output_file, max_tokens_per_shard=args.max_tokens_per_shard)
+        else:
+            request.update(output=args.output_dir, tokenizer=args.tokenizer, model=args.model,
+                           sync=args.sync, copy_mode=args.copy_mode, compression=args.compression)
+    return request
+
+def main():
+    parser = argparse.ArgumentParser(description='Send scan, count and bundle requests to a running toolkit daemon.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Daemon socket (default: {DEFAULT_SOCKET})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    start = subparsers.add_parser('start', help='Start the daemon in the background')
+    start.add_argument('--log-file', metavar='FILE', help='Where the daemon writes its own log (default: next to the socket)')
+    subparsers.add_parser('stop', help='Stop the daemon')
+    subparsers.add_parser('status', help='Show what the daemon has loaded')
+
+    scan = subparsers.add_parser('scan', help='Scan a directory, reusing the previous scan of it')
+    scan.add_argument('directory', help='Directory to scan')
+    scan.add_argument('output_file', nargs='?', help='Save the scan here (.json or .ndjson); otherwise print a summary')
+    add_scan_arguments(scan)
+    add_output_arguments(scan)
+
+    count = subparsers.add_parser('count', help='Count the tokens in files or directories')
+    count.add_argument('paths', nargs='+', help='Files or directories to count')
+    count.add_argument('-t', '--tokenizer', choices=['anthropic', 'tiktoken'], default='tiktoken',
+                       help='Choose tokenizer for counting (default: tiktoken)')
+    count.add_argument('-m', '--model', default="claude-3-5-sonnet-latest",
+                       help='Model name for the Anthropic tokenizer (default: claude-3-5-sonnet-latest)')
+    add_scan_arguments(count)
+    add_output_arguments(count)
+
+    single = subparsers.add_parser('single', help='Concatenate into one file, like single_file_concat.py')
+    add_bundle_arguments(single)
+    single.add_argument('output_file', help='Output file')
+    single.add_argument('--max-tokens-per-shard', type=int, metavar='N',
+                        help='Split the output into numbered part files of at most N tokens each')
+    add_scan_arguments(single)
+    add_output_arguments(single)
+
+    claude = subparsers.add_parser('claude', help='Flatten into a folder, like claude_concat.py')
+    add_bundle_arguments(claude)
+    claude.add_argument('output_dir', help='Output directory for processed files, or a .zip, .tar or .tar.gz archive')
+    claude.add_argument('-m', '--model', default="claude-3-5-sonnet-latest",
+                        help='Model name for token counting (default: claude-3-5-sonnet-latest)')
+    claude.add_argument('-t', '--tokenizer', choices=['anthropic', 'tiktoken'], default='anthropic',
+                        help='Choose tokenizer for counting (default: anthropic)')
+    claude.add_argument('-s', '--sync', action='store_true', help='Update the output directory in place')
+    claude.add_argument('--copy-mode', choices=('copy', 'reflink', 'hardlink'), default='copy',
+                        help='How to create output files (default: copy)')
+    claude.add_argument('--compression', choices=('auto', 'deflate', 'store'), default='auto',
+                        help='Zip entry compression for archive output (default: auto)')
+    add_scan_arguments(claude)
+    add_output_arguments(claude)
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'start':
+            if is_running(args.socket):
+                print(f"Daemon already running on {args.socket}")
+            else:
+                pid = start_daemon(args.socket, args.log_file)
+                print(f"Daemon started (pid {pid}) on {args.socket}")
+            return
+        if args.command in ('single', 'claude'):
+            output = args.output_file if args.command == 'single' else args.output_dir
+            if os.path.exists(output) and not args.yes and not getattr(args, 'sync', False):
+                confirm = input(f"Output '{output}' already exists. Overwrite? (y/N): ")
+                if confirm.lower() != 'y':
+                    print("Operation cancelled.")
+                    sys.exit(0)
+        if args.command in ('stop', 'status'):
+            reply = send_request('shutdown' if args.command == 'stop' else 'status', socket_path=args.socket)
+        else:
+            reply = send_request(args.command, build_request(args), args.socket)
+    except DaemonError as e:
+        print(f"Error: {e}")
+        if args.command != 'start':
+            print("Start it with: python toolkit_client.py start")
+        sys.exit(1)
+
+    if reply.get('output'):
+        print(reply['output'], end='' if reply['output'].endswith('\n') else '\n')
+    if not reply.get('ok'):
+        print(f"Error: {reply.get('error', 'request failed')}")
+        sys.exit(1)
+    if args.command == 'status':
+        print(json.dumps(reply.get('result', {}), indent=4))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+# toolkit_daemon.py
+# ---
+# resident service that keeps the expensive parts of the toolkit loaded between runs:
+# tokenizers (the tiktoken encoder and Anthropic clients), loaded ignore files and
+# their compiled matchers, the previous scan of each directory (only directories
+# that changed are listed again), and an open token cache. it answers scan, count
+# and bundle requests on a unix socket; toolkit_client.py is the command line side.
+#
+# protocol: one JSON request per connection, {"op": ..., "args": {...}}, answered
+# with one JSON line {"ok": ..., "output": <what the tool printed>, "result": ...}.
+#
+# usage:
+#   python toolkit_daemon.py [--socket PATH] [--token-cache PATH]
+
+import io
+import os
+import sys
+import json
+import time
+import signal
+import shutil
+import argparse
+import threading
+import contextlib
+import socketserver
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import dir_scanner
+import claude_concat
+import single_file_concat
+from pipeline import bundle_to_directory, bundle_to_file, save_scan, select_entries
+from token_cache import TokenCache, count_with_cache, open_token_cache
+from batch_counter import count_texts, read_ahead
+from file_sniffer import SkippedFile, limits_from_ignore, read_text_file
+from file_selection import DEFAULT_WEIGHTS, load_weights_file
+from metrics import NORMAL, QUIET, VERBOSE, Metrics, finish_metrics
+from toolkit_client import DEFAULT_SOCKET, DaemonError, is_running
+
+# Directories whose last scan is kept for the next request, least recently used dropped first
+MAX_CACHED_SCANS = 16
+
+LEVELS = {'quiet': QUIET, 'normal': NORMAL, 'verbose': VERBOSE}
+
+class WarmState:
+    """
+    Everything the daemon keeps between requests. Requests that run the tools are
+    handled one at a time (see ToolkitService), so this is only used under that lock.
+    """
+
+    def __init__(self, token_cache: Optional[TokenCache] = None, scan_workers: int = dir_scanner.DEFAULT_WORKERS):
+        self.token_cache = token_cache
+        self.scan_workers = scan_workers
+        self.ignore_files = {}
+        self.matchers = {}
+        self.scans = OrderedDict()
+        self.counters = {}
+
+    def ignore_patterns(self, ignore_file: Optional[str], gitignore: bool = False) -> Dict[str, Any]:
+        """Load an ignore file, reusing the parsed copy until the file is modified."""
+        if not ignore_file:
+            patterns = dir_scanner.DEFAULT_IGNORE
+        else:
+            ignore_file = os.path.abspath(ignore_file)
+            try:
+                mtime_ns = os.stat(ignore_file).st_mtime_ns
+            except OSError:
+                mtime_ns = None
+            cached = self.ignore_files.get(ignore_file)
+            if cached is None or cached[0] != mtime_ns:
+                cached = (mtime_ns, dir_scanner.load_ignore_file(ignore_file))
+                self.ignore_files[ignore_file] = cached
+            patterns = cached[1]
+        return dict(patterns, use_gitignore=True) if gitignore else patterns
+
+    def matcher(self, ignore_patterns: Dict[str, Any]) -> dir_scanner.IgnoreMatcher:
+        fingerprint = dir_scanner.ignore_fingerprint(ignore_patterns)
+        matcher = self.matchers.get(fingerprint)
+        if matcher is None:
+            matcher = self.matchers[fingerprint] = dir_scanner.compile_ignore_patterns(ignore_patterns)
+        return matcher
+
+    def scan(self, directory: str, ignore_patterns: Dict[str, Any], metrics: Metrics) -> Dict[str, Dict[str, list]]:
+        """
+        Scan a directory against its previous scan, so only directories that changed
+        since the last request are listed again. Scans are kept by absolute path, and
+        the listing comes back under 'directory' as given, like a scan run by the client.
+        """
+        abs_directory = os.path.abspath(directory)
+        key = (abs_directory, dir_scanner.ignore_fingerprint(ignore_patterns))
+        previous = self.scans.pop(key, None)
+        with metrics.timer('scan'):
+            dir_dict, records, changes, relisted = dir_scanner.incremental_scan(
+                abs_directory, ignore_patterns, {'dirs': previous or {}}, self.scan_workers,
+                metrics.level >= VERBOSE, self.matcher(ignore_patterns)
+            )
+        self.scans[key] = records
+        while len(self.scans) > MAX_CACHED_SCANS:
+            self.scans.popitem(last=False)
+
+        metrics.count('relisted_dirs', relisted)
+        if previous is not None:
+            metrics.info(f"Re-listed {relisted:,} of {len(records):,} directories: "
+                         f"{len(changes['added']):,} added, {len(changes['removed']):,} removed, "
+                         f"{len(changes['modified']):,} modified")
+        if abs_directory == directory:
+            return dir_dict
+        return {directory if root == abs_directory else os.path.join(directory, os.path.relpath(root, abs_directory)):
+                listing for root, listing in dir_dict.items()}
+
+    def entries(self, source: str, ignore_patterns: Dict[str, Any], metrics: Metrics):
+        """Scan 'source' if it is a directory, otherwise read it as a saved scan file."""
+        if os.path.isdir(source):
+            return self.scan(source, ignore_patterns, metrics)
+        dir_data = dir_scanner.load_scan(source)
+        if isinstance(dir_data, dict) and not claude_concat.validate_json(dir_data):
+            raise ValueError(f"{source} is not a valid scan file")
+        return dir_data
+
+    def counter(self, tokenizer: str, model_name: str) -> Tuple[bool, Optional[Any], str]:
+        """setup_token_counter, done once per tokenizer and model."""
+        key = (tokenizer, model_name if tokenizer == 'anthropic' else None)
+        if key not in self.counters:
+            self.counters[key] = claude_concat.setup_token_counter(True, tokenizer, model_name)
+        return self.counters[key]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'tokenizers': sorted(f"{active}:{model}" if model else active
+                                 for (_, model), (enabled, _, active) in self.counters.items() if enabled),
+            'ignore_files': sorted(self.ignore_files),
+            'scans': [{'directory': directory, 'directories': len(records)}
+                      for (directory, _), records in self.scans.items()],
+            'token_cache': self.token_cache.summary() if self.token_cache is not None else None,
+        }
+
+def handle_scan(state: WarmState, args: Dict[str, Any], metrics: Metrics) -> Dict[str, Any]:
+    directory = args['directory']
+    if not os.path.isdir(directory):
+        raise ValueError(f"{directory} is not a directory")
+    dir_dict = state.scan(directory, state.ignore_patterns(args.get('ignore_file'), args.get('gitignore', False)), metrics)
+    files = sum(len(listing['files']) for listing in dir_dict.values())
+    if args.get('output_file'):
+        with metrics.timer('write'):
+            for _ in save_scan(dir_dict, args['output_file']):
+                pass
+        metrics.info(f"Saved scan of {len(dir_dict):,} directories and {files:,} files to {args['output_file']}")
+    else:
+        metrics.info(f"Scanned {len(dir_dict):,} directories and {files:,} files")
+    metrics.count('files', files)
+    return {'directories': len(dir_dict), 'files': files}
+
+def handle_count(state: WarmState, args: Dict[str, Any], metrics: Metrics) -> Dict[str, Any]:
+    """Count the tokens of files, and of every file found in the given directories."""
+    tokenizer = args.get('tokenizer', 'tiktoken')
+    model_name = args.get('model', "claude-3-5-sonnet-latest")
+    enabled, counter, active = state.counter(tokenizer, model_name)
+    if not enabled:
+        raise RuntimeError(f"the {tokenizer} tokenizer is not available")
+    cache_model = model_name if active == 'anthropic' else claude_concat.TIKTOKEN_MODEL
+    ignore_patterns = state.ignore_patterns(args.get('ignore_file'), args.get('gitignore', False))
+    limits = limits_from_ignore(ignore_patterns)
+
+    paths = []
+    for path in args['paths']:
+        if os.path.isdir(path):
+            for root, listing in state.scan(path, ignore_patterns, metrics).items():
+                paths.extend(os.path.join(root, name) for name in listing['files'])
+        else:
+            paths.append(path)
+
+    def read(path: str) -> str:
+        with metrics.timer('read'):
+            return read_text_file(path, limits)[0]
+
+    total = 0
+    counted = 0
+    for path, content, error in read_ahead(paths, read):
+        if error is not None:
+            if not isinstance(error, SkippedFile):
+                print(f"Warning: Could not read {path}: {error}")
+            metrics.count('skipped')
+            continue
+        with metrics.timer('tokenize'):
+            tokens = count_with_cache(state.token_cache, active, cache_model, content,
+                                      lambda text: count_texts(counter, [text])[0] if active == 'tiktoken'
+                                      else claude_concat.count_file_tokens(active, counter, model_name, text))
+        if tokens is None:
+            continue
+        metrics.detail(f"{path}: {tokens:,} tokens")
+        total += tokens
+        counted += 1
+    metrics.count('files', counted)
+    metrics.info(f"Total tokens: {total:,} across {counted:,} files")
+    return {'total_tokens': total, 'files': counted}
+
+def handle_bundle(state: WarmState, args: Dict[str, Any], metrics: Metrics) -> Dict[str, Any]:
+    """Run the single file or Claude Projects bundler on a warm scan with warm tokenizers."""
+    mode = args.get('mode', 'single')
+    output = args.get('output')
+    if not output:
+        raise ValueError("an output path is required")
+    ignore_patterns = state.ignore_patterns(args.get('ignore_file'), args.get('gitignore', False))
+    limits = limits_from_ignore(ignore_patterns) if mode == 'single' else claude_concat.folder_limits(ignore_patterns)
+    entries = state.entries(args['source'], ignore_patterns, metrics)
+
+    if args.get('token_budget') is not None:
+        weights = load_weights_file(args['weights']) if args.get('weights') else DEFAULT_WEIGHTS
+        estimate = single_file_concat.estimate_framed_tokens if mode == 'single' else claude_concat.estimate_file_tokens
+        entries = select_entries(entries, args['token_budget'], weights, estimate, log=metrics.log)
+
+    count_tokens = args.get('count_tokens', False)
+    if mode == 'single':
+        bundle_to_file(entries, output, count_tokens, state.token_cache,
+                       max_tokens_per_shard=args.get('max_tokens_per_shard'), log=metrics.log,
+                       limits=limits, metrics=metrics, dedup=args.get('dedup', False))
+        metrics.info("\nSuccessfully wrote to file.")
+        return {'output': output}
+
+    tokenizer = args.get('tokenizer', 'anthropic')
+    model_name = args.get('model', "claude-3-5-sonnet-latest")
+    anthropic_client = None
+    if count_tokens and tokenizer == 'anthropic':
+        enabled, counter, active = state.counter(tokenizer, model_name)
+        if active == 'anthropic':
+            anthropic_client = counter
+        else:
+            tokenizer = active
+    sync = args.get('sync', False)
+    if os.path.isdir(output) and not sync:
+        shutil.rmtree(output)
+    created_files, visual_files = bundle_to_directory(
+        entries, output, count_tokens, tokenizer, model_name, state.token_cache, sync=sync,
+        copy_mode=args.get('copy_mode', 'copy'), compression=args.get('compression', 'auto'),
+        anthropic_client=anthropic_client, limits=limits, metrics=metrics, dedup=args.get('dedup', False)
+    )
+    return {'output': output, 'files': len(created_files), 'visual_files': len(visual_files)}
+
+OPS = {
+    'scan': handle_scan,
+    'count': handle_count,
+    'single': handle_bundle,
+    'claude': handle_bundle,
+}
+
+class ToolkitService:
+    """
+    Runs requests against the warm state. The tools print their progress, so each
+    request runs alone with stdout captured and sent back to the client. It also runs
+    in the client's working directory, so relative paths (and the file headers made
+    from them) are the same as when the tools are run directly.
+    """
+
+    def __init__(self, state: WarmState):
+        self.state = state
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = 0
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        op = request.get('op')
+        args = request.get('args') or {}
+        if op == 'ping':
+            return {'ok': True, 'result': {'pid': os.getpid()}}
+        if op == 'status':
+            with self.lock:
+                result = dict(self.state.summary(), pid=os.getpid(), requests=self.requests,
+                              uptime_seconds=round(time.time() - self.started, 1))
+            return {'ok': True, 'result': result}
+        if op == 'shutdown':
+            return {'ok': True, 'output': "Daemon stopping"}
+        handler = OPS.get(op)
+        if handler is None:
+            return {'ok': False, 'error': f"unknown request: {op}"}
+        if op in ('single', 'claude'):
+            args = dict(args, mode=op)
+
+        output = io.StringIO()
+        with self.lock, contextlib.redirect_stdout(output):
+            self.requests += 1
+            metrics = Metrics(LEVELS.get(args.get('level'), NORMAL), output)
+            home = os.getcwd()
+            try:
+                os.chdir(args.get('cwd') or home)
+                result = handler(self.state, args, metrics)
+                finish_metrics(metrics, args.get('metrics_json'))
+                reply = {'ok': True, 'result': result}
+            except (Exception, SystemExit) as e:
+                reply = {'ok': False, 'error': str(e) or type(e).__name__}
+            finally:
+                os.chdir(home)
+                if self.state.token_cache is not None:
+                    self.state.token_cache.commit()
+        reply['output'] = output.getvalue()
+        return reply
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        try:
+            request = json.loads(line.decode('utf-8'))
+        except ValueError as e:
+            reply = {'ok': False, 'error': f"invalid request: {e}"}
+            request = {}
+        else:
+            reply = self.server.service.handle(request)
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+        if request.get('op') == 'shutdown':
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+class ToolkitServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, service: ToolkitService):
+        self.service = service
+        super().__init__(socket_path, RequestHandler)
+
+def prepare_socket(socket_path: str) -> None:
+    """Refuse to start twice, and clear a socket left behind by a daemon that died."""
+    if is_running(socket_path):
+        raise DaemonError(f"a daemon is already running on {socket_path}")
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep tokenizers, ignore matchers and scans warm and serve toolkit requests.')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f'Socket to listen on (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--token-cache', metavar='PATH', help='Token count cache database')
+    parser.add_argument('--no-token-cache', action='store_true', help='Do not cache token counts')
+    parser.add_argument('--scan-workers', type=int, default=dir_scanner.DEFAULT_WORKERS,
+                        help=f'Number of scanner threads (default: {dir_scanner.DEFAULT_WORKERS})')
+    parser.add_argument('--no-preload', action='store_true', help='Load the tiktoken encoder on first use instead of at startup')
+    args = parser.parse_args()
+
+    try:
+        prepare_socket(args.socket)
+    except (DaemonError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    state = WarmState(open_token_cache(not args.no_token_cache, args.token_cache), args.scan_workers)
+    if not args.no_preload:
+        state.counter('tiktoken', None)
+
+    # Only the current user may send requests; they read and write files as this user
+    old_umask = os.umask(0o077)
+    try:
+        server = ToolkitServer(args.socket, ToolkitService(state))
+    finally:
+        os.umask(old_umask)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+
+    print(f"Listening on {args.socket} (pid {os.getpid()})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        with contextlib.suppress(OSError):
+            os.unlink(args.socket)
+        if state.token_cache is not None:
+            state.token_cache.close()
+    print("Daemon stopped", flush=True)
+
+if __name__ == "__main__":
+    main()
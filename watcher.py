@@ -0,0 +1,799 @@
+# watcher.py
+# ---
+# keeps a single_file_concat.py bundle and/or a claude_concat.py folder up to date
+# while you work. the tree is built once, then inotify (or polling where inotify is
+# not available) reports which files changed, and only those files are re-read,
+# re-copied and re-counted. changes are debounced and applied in batches.
+#
+# usage:
+#   python watcher.py ./my_project -o ./data/combined.txt -d ./data/claude -i ignore.json -c
+
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+import argparse
+import contextlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import claude_concat
+import single_file_concat
+from batch_counter import count_texts
+from token_cache import TokenCache, count_with_cache, open_token_cache
+from dir_scanner import DEFAULT_IGNORE, compile_ignore_patterns, join_relative, load_ignore_file
+from file_sniffer import SkippedFile, classify_file, limits_from_ignore
+from metrics import Metrics, add_metrics_arguments, finish_metrics, metrics_from_args
+
+# Quiet period that ends a batch, and the longest a batch is held back while changes keep coming
+DEFAULT_DEBOUNCE = 0.1
+MAX_BATCH_DELAY = 0.5
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+# inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_SIZE = 64 * 1024
+
+# Changed bundle sections are staged here until they are spliced into the output file
+TEMP_SUFFIX = '.watch-tmp'
+
+class PathFilter:
+    """
+    Applies the ignore rules to single paths under the watched root, the way the
+    scanner would when reaching them. Matchers for each directory level are cached.
+    Paths in 'exclude' (the outputs themselves) are always ignored.
+    """
+
+    def __init__(self, root: str, ignore_patterns: Dict[str, Any], exclude: List[str] = ()):
+        self.root = root
+        self.ignore_patterns = ignore_patterns
+        self.exclude = [os.path.abspath(path) for path in exclude]
+        self.use_gitignore = ignore_patterns.get("use_gitignore", False)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget cached matchers, e.g. after a .gitignore changed."""
+        self.matchers = {'': compile_ignore_patterns(self.ignore_patterns).child('', self.root)}
+
+    def excluded(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        return any(path == out or path.startswith(out + os.sep) for out in self.exclude)
+
+    def _matcher(self, rel_dir: str):
+        matcher = self.matchers.get(rel_dir)
+        if matcher is None:
+            parent, _, _ = rel_dir.rpartition('/')
+            abs_dir = os.path.join(self.root, *rel_dir.split('/'))
+            matcher = self._matcher(parent).child(rel_dir, abs_dir)
+            self.matchers[rel_dir] = matcher
+        return matcher
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """Check a path and every directory above it against the ignore rules."""
+        if self.excluded(path):
+            return True
+        rel_path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        if rel_path == '.':
+            return False
+        if rel_path.startswith('../'):
+            return True
+        parts = rel_path.split('/')
+        rel_dir = ''
+        for depth, name in enumerate(parts):
+            last = depth == len(parts) - 1
+            rel = join_relative(rel_dir, name)
+            if self._matcher(rel_dir).ignored(rel, name, is_dir or not last):
+                return True
+            rel_dir = rel
+        return False
+
+    def walk(self, directory: str) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """os.walk below 'directory' with ignored folders and files left out."""
+        if self.ignored(directory, True):
+            return
+        for root, dirs, files in os.walk(directory):
+            rel_dir = os.path.relpath(root, self.root).replace(os.sep, '/')
+            rel_dir = '' if rel_dir == '.' else rel_dir
+            matcher = self._matcher(rel_dir)
+            dirs[:] = [d for d in dirs if not matcher.ignored(join_relative(rel_dir, d), d, True)
+                       and not self.excluded(os.path.join(root, d))]
+            files = [f for f in files if not matcher.ignored(join_relative(rel_dir, f), f, False)
+                     and not self.excluded(os.path.join(root, f))]
+            yield root, dirs, files
+
+    def files(self, directory: str) -> Iterator[str]:
+        """Every file below 'directory' that is not ignored, in scan order."""
+        for root, _, files in self.walk(directory):
+            for name in files:
+                yield os.path.join(root, name)
+
+def load_inotify() -> Optional[Any]:
+    """libc with the inotify calls, or None where inotify is not available."""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+class InotifyWatcher:
+    """
+    Watches every directory under the root that is not ignored with one inotify
+    instance. New directories are watched as they appear. If the kernel queue
+    overflows, needs_resync is set and the caller should rescan everything.
+    """
+
+    def __init__(self, libc: Any, path_filter: PathFilter):
+        self.libc = libc
+        self.filter = path_filter
+        self.needs_resync = False
+        self.watches = {}
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+        try:
+            self.add_tree(path_filter.root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, directory: str) -> None:
+        """Watch a directory and everything below it that is not ignored."""
+        for root, _, _ in self.filter.walk(directory):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    raise OSError(err, "inotify watch limit reached (see fs.inotify.max_user_watches)")
+                # The directory vanished or cannot be read; the scan would skip it too
+                continue
+            self.watches[wd] = root
+
+    def remove_tree(self, directory: str) -> None:
+        """Stop watching a directory that was moved away, and everything below it."""
+        prefix = directory + os.sep
+        for wd, root in list(self.watches.items()):
+            if root == directory or root.startswith(prefix):
+                self.libc.inotify_rm_watch(self.fd, wd)
+                del self.watches[wd]
+
+    def read(self, timeout: Optional[float]) -> Set[str]:
+        """Wait up to 'timeout' seconds (forever if None) and return the paths that changed."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, EVENT_BUFFER_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            for wd, mask, name in self._parse(data):
+                self._handle(wd, mask, name, changed)
+        return changed
+
+    def _parse(self, data: bytes) -> Iterator[Tuple[int, int, str]]:
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].split(b'\0', 1)[0]
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+    def _handle(self, wd: int, mask: int, name: str, changed: Set[str]) -> None:
+        if mask & IN_Q_OVERFLOW:
+            self.needs_resync = True
+            return
+        if mask & IN_IGNORED:
+            self.watches.pop(wd, None)
+            return
+        base = self.watches.get(wd)
+        if base is None or not name:
+            return
+
+        path = os.path.join(base, name)
+        is_dir = bool(mask & IN_ISDIR)
+        if name == '.gitignore' and self.filter.use_gitignore:
+            # The rules themselves changed, so anything may now be in or out
+            self.needs_resync = True
+            return
+        if self.filter.ignored(path, is_dir):
+            return
+        if is_dir and mask & (IN_CREATE | IN_MOVED_TO):
+            try:
+                self.add_tree(path)
+            except OSError as e:
+                # Changes below it are still seen by a full rescan when a batch asks for one
+                print(f"Warning: Not watching {path}: {e}")
+        elif is_dir and mask & IN_MOVED_FROM:
+            self.remove_tree(path)
+        changed.add(path)
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """
+    Fallback for systems without inotify: rescans the tree every 'interval' seconds
+    and compares file sizes and modification times with the previous pass.
+    """
+
+    def __init__(self, path_filter: PathFilter, interval: float = DEFAULT_POLL_INTERVAL):
+        self.filter = path_filter
+        self.interval = interval
+        self.needs_resync = False
+        self.snapshot = self._snapshot()
+        self.next_poll = time.monotonic() + interval
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in self.filter.files(self.filter.root):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout: Optional[float]) -> Set[str]:
+        """Wait for the next poll (at most 'timeout' seconds, forever if None) and return the paths that changed."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if deadline is not None and now >= deadline and now < self.next_poll:
+                return set()
+            wake = self.next_poll if deadline is None else min(self.next_poll, deadline)
+            if wake > now:
+                time.sleep(wake - now)
+            if time.monotonic() < self.next_poll:
+                continue
+            if self.filter.use_gitignore:
+                self.filter.reset()
+            snapshot = self._snapshot()
+            self.next_poll = time.monotonic() + self.interval
+            changed = {path for path, stat in snapshot.items() if self.snapshot.get(path) != stat}
+            changed.update(path for path in self.snapshot if path not in snapshot)
+            self.snapshot = snapshot
+            if changed or deadline is not None:
+                return changed
+
+    def close(self) -> None:
+        pass
+
+def open_watcher(path_filter: PathFilter, poll: bool = False,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, log=sys.stdout):
+    """inotify where possible, polling otherwise (or when asked for)."""
+    libc = None if poll else load_inotify()
+    if libc is not None:
+        try:
+            return InotifyWatcher(libc, path_filter)
+        except OSError as e:
+            print(f"Warning: Could not watch with inotify: {e}. Polling instead.", file=log)
+    return PollingWatcher(path_filter, poll_interval)
+
+def iter_batches(watcher, debounce: float = DEFAULT_DEBOUNCE,
+                 max_delay: float = MAX_BATCH_DELAY) -> Iterator[Tuple[Set[str], bool]]:
+    """
+    Group changes into batches. A batch ends once nothing has changed for
+    'debounce' seconds, or 'max_delay' seconds after its first change.
+    Yields (changed_paths, resync) where resync asks for a full rescan.
+    """
+    while True:
+        changed = set()
+        while not changed and not watcher.needs_resync:
+            changed = watcher.read(None)
+        deadline = time.monotonic() + max_delay
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            more = watcher.read(min(debounce, remaining))
+            if not more:
+                break
+            changed |= more
+        resync = watcher.needs_resync
+        watcher.needs_resync = False
+        yield changed, resync
+
+def copy_range(src_fd: int, src_offset: int, dst_fd: int, dst_offset: int, length: int) -> None:
+    """Copy a byte range between two open files, inside the kernel where copy_file_range works."""
+    use_kernel = hasattr(os, "copy_file_range")
+    while length > 0:
+        chunk = min(length, claude_concat.COPY_RANGE_SIZE)
+        copied = 0
+        if use_kernel:
+            try:
+                copied = os.copy_file_range(src_fd, dst_fd, chunk, src_offset, dst_offset)
+            except OSError:
+                use_kernel = False
+        if not copied:
+            data = os.pread(src_fd, chunk, src_offset)
+            if not data:
+                raise OSError(errno.EIO, "unexpected end of file while copying")
+            copied = os.pwrite(dst_fd, data, dst_offset)
+        src_offset += copied
+        dst_offset += copied
+        length -= copied
+
+class LiveBundle:
+    """
+    A single_file_concat.py bundle kept as framed sections, one per file, with the
+    offset and length of each section in the output. Changed sections are staged in
+    a side file and spliced in by flush, which rewrites the bundle only from the
+    first changed section onward, moving the sections after it with kernel copies.
+    File contents are never held in memory. Changed files keep their place; files
+    added while watching go at the end.
+    """
+
+    def __init__(self, output_file: str, count: Optional[Callable[[str], Optional[int]]] = None,
+                 limits: Optional[Dict[str, Any]] = None, metrics: Optional[Metrics] = None):
+        self.output_file = output_file
+        self.stage_file = output_file + TEMP_SUFFIX
+        self.count = count
+        self.limits = limits
+        self.metrics = metrics or Metrics()
+        # path -> (offset, length) in the bundle, in bundle order
+        self.sections = {}
+        self.size = 0
+        # path -> (offset, length) in the stage file, or None once removed; applied by flush
+        self.staged = {}
+        self.stage = None
+        self.stats = {}
+        self.tokens = {}
+
+    def known(self) -> List[str]:
+        paths = [path for path in self.sections if self.staged.get(path, ()) is not None]
+        return paths + [path for path, source in self.staged.items() if source is not None and path not in self.sections]
+
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def update(self, path: str) -> bool:
+        """Re-read a file if its size or mtime changed. Returns True if the bundle changed."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return self.remove(path)
+        if self.stats.get(path) == (st.st_size, st.st_mtime_ns):
+            return False
+        try:
+            with self.metrics.timer('read'):
+                content, _, _ = single_file_concat.read_source_file(path, self.limits)
+        except SkippedFile as e:
+            self.metrics.detail(f"Skipping {path}: {e}")
+            return self.remove(path)
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Warning: Could not read {path}: {e}", file=self.metrics.log)
+            return self.remove(path)
+
+        framed = single_file_concat.frame_file(path, content)
+        if self.stage is None:
+            self.stage = open(self.stage_file, 'w+b')
+        offset = self.stage.seek(0, os.SEEK_END)
+        self.staged[path] = (offset, self.stage.write(framed.encode('utf-8')))
+        self.stats[path] = (st.st_size, st.st_mtime_ns)
+        if self.count is not None:
+            with self.metrics.timer('tokenize'):
+                tokens = self.count(framed)
+            if tokens is not None:
+                self.tokens[path] = tokens
+        return True
+
+    def remove(self, path: str) -> bool:
+        self.stats.pop(path, None)
+        self.tokens.pop(path, None)
+        if path in self.sections:
+            present = self.staged.get(path, ()) is not None
+            self.staged[path] = None
+            return present
+        return self.staged.pop(path, None) is not None
+
+    def flush(self) -> None:
+        """
+        Splice the staged sections into the bundle, then drop the stage file. If that
+        fails, every file is staged again from the source tree and the next flush
+        rewrites the bundle in full.
+        """
+        if not self.staged:
+            return
+        with self.metrics.timer('write'):
+            try:
+                if self.stage is None:
+                    self.stage = open(self.stage_file, 'w+b')
+                self.stage.flush()
+                fd = os.open(self.output_file, os.O_RDWR | os.O_CREAT, 0o666)
+                try:
+                    self._splice(fd, self.stage.fileno())
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"Warning: Could not update {self.output_file}: {e}. It will be rewritten in full.",
+                      file=self.metrics.log)
+                self._rebuild()
+                return
+            self._drop_stage()
+            self.staged = {}
+
+    def _drop_stage(self) -> None:
+        if self.stage is not None:
+            self.stage.close()
+            self.stage = None
+        with contextlib.suppress(OSError):
+            os.remove(self.stage_file)
+
+    def _rebuild(self) -> None:
+        """Forget the bundle layout, whose offsets may no longer hold, and stage every file afresh."""
+        paths = self.known()
+        self._drop_stage()
+        self.sections, self.size, self.staged = {}, 0, {}
+        self.stats, self.tokens = {}, {}
+        for path in paths:
+            self.update(path)
+
+    def _splice(self, fd: int, stage_fd: int) -> None:
+        if all(source is not None and path in self.sections and source[1] == self.sections[path][1]
+               for path, source in self.staged.items()):
+            # Every change kept its length, so each one is written over its old section
+            for path, (offset, length) in self.staged.items():
+                copy_range(stage_fd, offset, fd, self.sections[path][0], length)
+            return
+
+        start = min((self.sections[path][0] for path in self.staged if path in self.sections), default=self.size)
+        # Sections after the first change move, so their current bytes are set aside in the stage file first
+        spill = os.fstat(stage_fd).st_size
+        if any(offset >= start and path not in self.staged for path, (offset, _) in self.sections.items()):
+            copy_range(fd, start, stage_fd, spill, self.size - start)
+
+        sections = {}
+        position = start
+        for path, (offset, length) in self.sections.items():
+            if offset < start:
+                sections[path] = (offset, length)
+                continue
+            if path in self.staged:
+                if self.staged[path] is None:
+                    continue
+                offset, length = self.staged[path]
+            else:
+                offset += spill - start
+            copy_range(stage_fd, offset, fd, position, length)
+            sections[path] = (position, length)
+            position += length
+        for path, source in self.staged.items():
+            if source is not None and path not in self.sections:
+                copy_range(stage_fd, source[0], fd, position, source[1])
+                sections[path] = (position, source[1])
+                position += source[1]
+        os.ftruncate(fd, position)
+        self.sections = sections
+        self.size = position
+
+    def describe(self) -> str:
+        text = f"{self.output_file}: {len(self.sections):,} files"
+        if self.count is not None:
+            text += f", {self.total_tokens():,} tokens"
+        return text
+
+class LiveFolder:
+    """
+    A claude_concat.py output folder updated one file at a time. It shares the
+    sync manifest with claude_concat.py --sync, so unchanged files are not copied
+    again on start-up and a later --sync run picks up where watching left off.
+    """
+
+    def __init__(self, root: str, output_dir: str, count: Optional[Callable[[str], Optional[int]]] = None,
+                 limits: Optional[Dict[str, Any]] = None, copy_mode: str = 'copy',
+                 metrics: Optional[Metrics] = None):
+        self.root = root
+        self.output_dir = output_dir
+        self.count = count
+        self.limits = limits or claude_concat.folder_limits({})
+        self.copy_mode = copy_mode
+        self.metrics = metrics or Metrics()
+        self.manifest_file = claude_concat.sync_manifest_path(output_dir)
+        # Entries from the previous run are kept until the first flush, then stale outputs are removed
+        self.previous = claude_concat.load_sync_manifest(self.manifest_file)['files']
+        self.pruned = False
+        self.entries = {}
+        self.names = {}
+        self.tokens = {}
+        os.makedirs(output_dir, exist_ok=True)
+
+    def known(self) -> List[str]:
+        return list(self.names)
+
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    def _output_path(self, name: str, visual: bool) -> str:
+        if visual:
+            visual_dir = os.path.join(self.output_dir, "visual")
+            os.makedirs(visual_dir, exist_ok=True)
+            return os.path.join(visual_dir, name)
+        return os.path.join(self.output_dir, name)
+
+    def update(self, path: str) -> bool:
+        """Copy a file into the folder if it changed. Returns True if the folder changed."""
+        name = claude_concat.transform_path(self.root, os.path.relpath(path, self.root))
+        visual = claude_concat.is_visual_file(name)
+        try:
+            st = os.stat(path)
+            with self.metrics.timer('read'):
+                kind, encoding, size = classify_file(path, self.limits, st.st_size, sniff=not visual)
+        except OSError:
+            return self.remove(path)
+        if kind == 'oversize' or (kind == 'binary' and self.limits['skip_binary']):
+            self.metrics.detail(f"Skipping {path} ({'binary' if kind == 'binary' else 'oversized'})")
+            return self.remove(path)
+
+        output_path = self._output_path(name, visual)
+        previous = self.entries.get(name) or self.previous.get(name)
+        if claude_concat.source_unchanged(previous, path, st, self.copy_mode) and os.path.exists(output_path):
+            self.entries[name] = previous
+            first_time = path not in self.names
+            self.names[path] = name
+            if first_time:
+                self._count(path, kind, encoding, size, visual)
+            return False
+
+        try:
+            with self.metrics.timer('read'):
+                digest = claude_concat.file_digest(path)
+            with self.metrics.timer('write'):
+                if (previous is None or previous['sha256'] != digest or not claude_concat.same_copy_mode(previous, self.copy_mode)
+                        or not os.path.exists(output_path)):
+                    if kind == 'truncate':
+                        claude_concat.write_truncated_copy(path, output_path, size, encoding, self.limits)
+                    else:
+                        claude_concat.transfer_file(path, output_path, self.copy_mode)
+        except OSError as e:
+            print(f"Warning: Could not copy {path}: {e}", file=self.metrics.log)
+            return False
+        self.entries[name] = {
+            'source': path,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'sha256': digest,
+            'visual': visual,
+            'copy_mode': self.copy_mode,
+        }
+        self.names[path] = name
+        self._count(path, kind, encoding, size, visual)
+        return True
+
+    def _count(self, path: str, kind: str, encoding: Optional[str], size: int, visual: bool) -> None:
+        if self.count is None or visual:
+            return
+        with self.metrics.timer('read'):
+            content = claude_concat.read_text_for_counting(path, kind, encoding, size, self.limits)
+        if content is None:
+            self.tokens.pop(path, None)
+            return
+        with self.metrics.timer('tokenize'):
+            tokens = self.count(content)
+        if tokens is not None:
+            self.tokens[path] = tokens
+
+    def remove(self, path: str) -> bool:
+        name = self.names.pop(path, None)
+        self.tokens.pop(path, None)
+        if name is None:
+            return False
+        entry = self.entries.pop(name, None)
+        visual = entry.get('visual') if entry else claude_concat.is_visual_file(name)
+        folder = os.path.join(self.output_dir, "visual") if visual else self.output_dir
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(folder, name))
+        return True
+
+    def flush(self) -> None:
+        with self.metrics.timer('write'):
+            if not self.pruned:
+                claude_concat.remove_stale_outputs(self.output_dir, self.previous, self.entries)
+                self.previous = {}
+                self.pruned = True
+            try:
+                claude_concat.save_sync_manifest(self.manifest_file, {
+                    'version': claude_concat.SYNC_MANIFEST_VERSION, 'files': self.entries,
+                })
+            except OSError as e:
+                print(f"Warning: Could not write sync manifest '{self.manifest_file}': {e}", file=self.metrics.log)
+
+    def describe(self) -> str:
+        text = f"{self.output_dir}: {len(self.names):,} files"
+        if self.count is not None:
+            text += f", {self.total_tokens():,} tokens"
+        return text
+
+def apply_changes(changed: Set[str], targets: List[Any], path_filter: PathFilter,
+                  resync: bool = False) -> Tuple[int, int]:
+    """
+    Bring every target in line with the changed paths (files or directories).
+    With resync the whole tree is compared instead. Returns (updated, removed) counts.
+    """
+    updated = removed = 0
+    if resync:
+        path_filter.reset()
+        changed = {path_filter.root}
+
+    for path in sorted(changed):
+        if os.path.isdir(path):
+            present = set(path_filter.files(path))
+            prefix = path.rstrip(os.sep) + os.sep
+            for target in targets:
+                for known in target.known():
+                    if known.startswith(prefix) and known not in present:
+                        removed += target.remove(known)
+            for file_path in sorted(present) if resync else present:
+                for target in targets:
+                    updated += target.update(file_path)
+        elif os.path.isfile(path) and not path_filter.ignored(path, False):
+            for target in targets:
+                updated += target.update(path)
+        else:
+            # Deleted (or now ignored) file, or a directory that was removed with everything in it
+            prefix = path + os.sep
+            for target in targets:
+                for known in target.known():
+                    if known == path or known.startswith(prefix):
+                        removed += target.remove(known)
+    return updated, removed
+
+def make_tiktoken_counter(token_cache: Optional[TokenCache]) -> Optional[Callable[[str], Optional[int]]]:
+    """Token counter for the single-file bundle, the same one single_file_concat.py uses (encode_ordinary, as cached)."""
+    enabled, encoder = single_file_concat.setup_tiktoken_counter(True)
+    if not enabled:
+        return None
+    return lambda text: count_with_cache(token_cache, 'tiktoken', single_file_concat.TIKTOKEN_MODEL, text,
+                                         lambda t: count_texts(encoder, [t])[0])
+
+def make_folder_counter(tokenizer: str, model_name: str,
+                        token_cache: Optional[TokenCache]) -> Optional[Callable[[str], Optional[int]]]:
+    """Token counter for the flattened folder, with claude_concat.py's tokenizer choice and fallback."""
+    enabled, counter, active = claude_concat.setup_token_counter(True, tokenizer, model_name)
+    if not enabled:
+        return None
+    if active == 'tiktoken':
+        return lambda text: count_with_cache(token_cache, active, claude_concat.TIKTOKEN_MODEL, text,
+                                             lambda t: count_texts(counter, [t])[0])
+    return lambda text: count_with_cache(token_cache, active, model_name, text,
+                                         lambda t: claude_concat.count_file_tokens(active, counter, model_name, t))
+
+def watch(directory: str, targets: List[Any], path_filter: PathFilter, metrics: Metrics,
+          poll: bool = False, poll_interval: float = DEFAULT_POLL_INTERVAL,
+          debounce: float = DEFAULT_DEBOUNCE, max_batches: Optional[int] = None,
+          token_cache: Optional[TokenCache] = None) -> None:
+    """
+    Build every target from a full scan, then keep them up to date until interrupted
+    (or until max_batches batches of changes have been applied). New token counts are
+    committed to the cache after every flush, so they survive the watcher being killed.
+    """
+    start = time.perf_counter()
+    # Start watching before the first build so nothing that changes during it is missed
+    watcher = open_watcher(path_filter, poll, poll_interval, metrics.log)
+    try:
+        for path in path_filter.files(directory):
+            metrics.detail(f"Processing: {path}")
+            for target in targets:
+                target.update(path)
+        for target in targets:
+            target.flush()
+        if token_cache is not None:
+            token_cache.commit()
+        metrics.info(f"Built in {time.perf_counter() - start:.2f}s: " + "; ".join(t.describe() for t in targets))
+        backend = "inotify" if isinstance(watcher, InotifyWatcher) else f"polling every {poll_interval:g}s"
+        metrics.info(f"Watching {directory} ({backend}). Press Ctrl+C to stop.")
+
+        batches = 0
+        for changed, resync in iter_batches(watcher, debounce):
+            started = time.perf_counter()
+            updated, removed = apply_changes(changed, targets, path_filter, resync)
+            if updated or removed:
+                for target in targets:
+                    target.flush()
+                if token_cache is not None:
+                    token_cache.commit()
+            elapsed = time.perf_counter() - started
+            metrics.count('batches')
+            metrics.add_time('update', elapsed)
+            if updated or removed or resync:
+                label = "Rescanned" if resync else f"{len(changed):,} changes"
+                metrics.info(f"[{time.strftime('%H:%M:%S')}] {label}: {updated:,} updated, {removed:,} removed "
+                             f"in {elapsed * 1000:.0f} ms; " + "; ".join(t.describe() for t in targets))
+            batches += 1
+            if max_batches is not None and batches >= max_batches:
+                break
+    finally:
+        watcher.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep a concatenated bundle and/or a flattened folder up to date as files change.')
+    parser.add_argument('directory', help='Directory to watch')
+    parser.add_argument('-o', '--output-file', metavar='FILE', help='Single-file bundle to keep up to date, like single_file_concat.py')
+    parser.add_argument('-d', '--output-dir', metavar='DIR', help='Flattened folder to keep up to date, like claude_concat.py --sync')
+    parser.add_argument('-i', '--ignore', metavar='FILE', help='Ignore patterns file, JSON or TOML')
+    parser.add_argument('-g', '--gitignore', action='store_true', help='Also honour .gitignore files')
+    parser.add_argument('-c', '--count-tokens', action='store_true', help='Keep running token totals')
+    parser.add_argument('-m', '--model', default="claude-3-5-sonnet-latest",
+                        help='Model name for Anthropic token counting in the folder (default: claude-3-5-sonnet-latest)')
+    parser.add_argument('-t', '--tokenizer', choices=['anthropic', 'tiktoken'], default='tiktoken',
+                        help='Tokenizer for the folder; the bundle always uses tiktoken (default: tiktoken)')
+    parser.add_argument('--copy-mode', choices=claude_concat.COPY_MODES, default='copy',
+                        help='How to create files in the folder (default: copy)')
+    parser.add_argument('--token-cache', metavar='PATH', help='Token count cache database')
+    parser.add_argument('--no-token-cache', action='store_true', help='Always re-count tokens instead of using the cache')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help=f'Seconds without changes that end a batch (default: {DEFAULT_DEBOUNCE})')
+    parser.add_argument('--poll', action='store_true', help='Poll for changes instead of using inotify')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'Seconds between polls (default: {DEFAULT_POLL_INTERVAL})')
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    if not args.output_file and not args.output_dir:
+        parser.error("give an output file (-o), an output folder (-d), or both")
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    metrics = metrics_from_args(args)
+    ignore_patterns = load_ignore_file(args.ignore) if args.ignore else DEFAULT_IGNORE.copy()
+    if args.gitignore:
+        ignore_patterns = dict(ignore_patterns, use_gitignore=True)
+    limits = limits_from_ignore(ignore_patterns)
+
+    exclude = [path for path in (args.output_file, args.output_dir) if path]
+    if args.output_file:
+        exclude.append(args.output_file + TEMP_SUFFIX)
+    if args.output_dir:
+        exclude.append(claude_concat.sync_manifest_path(args.output_dir))
+    path_filter = PathFilter(args.directory, ignore_patterns, exclude)
+
+    token_cache = open_token_cache(args.count_tokens and not args.no_token_cache, args.token_cache)
+    targets = []
+    if args.output_file:
+        count = make_tiktoken_counter(token_cache) if args.count_tokens else None
+        targets.append(LiveBundle(args.output_file, count, limits, metrics))
+    if args.output_dir:
+        count = make_folder_counter(args.tokenizer, args.model, token_cache) if args.count_tokens else None
+        targets.append(LiveFolder(args.directory, args.output_dir, count, claude_concat.folder_limits(ignore_patterns),
+                                  args.copy_mode, metrics))
+
+    try:
+        watch(args.directory, targets, path_filter, metrics, args.poll, args.poll_interval, args.debounce,
+              token_cache=token_cache)
+    except KeyboardInterrupt:
+        metrics.info("\nStopped watching.")
+    finally:
+        if token_cache is not None:
+            token_cache.close()
+
+    finish_metrics(metrics, args.metrics_json)
+
+if __name__ == "__main__":
+    main()